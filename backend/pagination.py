@@ -0,0 +1,44 @@
+# backend/pagination.py
+"""
+Cursor (keyset) pagination for the list endpoints.
+
+Pages are ordered by descending primary key, newest first, and each page is
+fetched with `WHERE id < <last id> ORDER BY id DESC LIMIT n` on the primary
+key index, so a page costs the same however deep into the table it is and
+rows added or removed while a client pages through never shift it.
+
+Responses have the shape {"next": url, "previous": url, "results": [...]};
+next and previous are null at either end and carry an opaque ?cursor=.
+Clients pick a page size with ?page_size=, capped at API_MAX_PAGE_SIZE
+(default API_PAGE_SIZE).
+"""
+from django.conf import settings
+from rest_framework.pagination import CursorPagination
+
+
+class KeysetPagination(CursorPagination):
+    ordering = '-id'
+    page_size_query_param = 'page_size'
+
+    def __init__(self):
+        self.page_size = getattr(settings, 'API_PAGE_SIZE', 50)
+        self.max_page_size = getattr(settings, 'API_MAX_PAGE_SIZE', 500)
+
+
+def paginate(request, queryset):
+    """
+    Fetch the page of a queryset requested by ?cursor= and ?page_size=.
+
+    Returns (paginator, rows); pass the serialized rows to page_data().
+    """
+    paginator = KeysetPagination()
+    return paginator, paginator.paginate_queryset(queryset, request)
+
+
+def page_data(paginator, results):
+    """Response body for one page"""
+    return {
+        'next': paginator.get_next_link(),
+        'previous': paginator.get_previous_link(),
+        'results': results
+    }
@@ -50,6 +50,8 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    # Probe each device or router at most once per request
+    'deviceApp.probememo.ProbeMemoMiddleware',
 
 ]
 
@@ -124,6 +126,15 @@ DATABASES = {
 }
 
 
+# Cache
+# Shared connectivity state (uplink health, probe locks, rate limits) lives here.
+# Point CACHE_URL at a shared backend (e.g. redis:// or dbcache://) when running
+# more than one worker process.
+CACHES = {
+    'default': env.cache('CACHE_URL', default='locmemcache://')
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -211,3 +222,86 @@ AUTH_USER_MODEL = 'userApp.CustomUser'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+
+
+# Connectivity monitoring
+# Maximum number of device probes the asyncio probe engine runs at once
+CONNECTIVITY_PROBE_CONCURRENCY = env.int('CONNECTIVITY_PROBE_CONCURRENCY', default=500)
+# Ping from in-process ICMP sockets instead of running the `ping` command
+CONNECTIVITY_NATIVE_PING = env.bool('CONNECTIVITY_NATIVE_PING', default=True)
+# Host uplink check shared by every connectivity probe (see deviceApp/uplink.py)
+CONNECTIVITY_UPLINK_TARGETS = env.list('CONNECTIVITY_UPLINK_TARGETS', default=['8.8.8.8:53', '1.1.1.1:53'])
+CONNECTIVITY_UPLINK_TTL = env.int('CONNECTIVITY_UPLINK_TTL', default=30)
+CONNECTIVITY_UPLINK_TIMEOUT = env.int('CONNECTIVITY_UPLINK_TIMEOUT', default=3)
+CONNECTIVITY_UPLINK_FAILURE_THRESHOLD = env.int('CONNECTIVITY_UPLINK_FAILURE_THRESHOLD', default=3)
+CONNECTIVITY_UPLINK_OPEN_SECONDS = env.int('CONNECTIVITY_UPLINK_OPEN_SECONDS', default=60)
+# Devices probed per /24 before the rest of the subnet; if all are offline the
+# subnet is marked unreachable via upstream without probing each device
+CONNECTIVITY_SUBNET_SAMPLE_SIZE = env.int('CONNECTIVITY_SUBNET_SAMPLE_SIZE', default=2)
+# A device marked unreachable via upstream this many sweeps in a row is probed directly
+CONNECTIVITY_SUBNET_DERIVE_LIMIT = env.int('CONNECTIVITY_SUBNET_DERIVE_LIMIT', default=3)
+# Router sweeps reuse an access point's status when it was checked this recently (seconds)
+CONNECTIVITY_PARENT_STATUS_MAX_AGE = env.int('CONNECTIVITY_PARENT_STATUS_MAX_AGE', default=180)
+# Adaptive probe scheduling (see deviceApp/scheduling.py), in seconds
+CONNECTIVITY_MIN_INTERVAL = env.int('CONNECTIVITY_MIN_INTERVAL', default=60)
+CONNECTIVITY_DEFAULT_INTERVAL = env.int('CONNECTIVITY_DEFAULT_INTERVAL', default=180)
+CONNECTIVITY_MAX_INTERVAL = env.int('CONNECTIVITY_MAX_INTERVAL', default=900)
+CONNECTIVITY_INTERVAL_BACKOFF = env.float('CONNECTIVITY_INTERVAL_BACKOFF', default=1.5)
+# A status change within this window counts as flapping and keeps the minimum interval
+CONNECTIVITY_FLAP_WINDOW = env.int('CONNECTIVITY_FLAP_WINDOW', default=900)
+# Upper bound on probes started by one sweep run
+CONNECTIVITY_MAX_PROBES_PER_CYCLE = env.int('CONNECTIVITY_MAX_PROBES_PER_CYCLE', default=5000)
+# 'spread' aligns each target's due times to a stable per-target phase so probes are
+# spread evenly over the interval; 'adaptive' schedules relative to the last probe
+CONNECTIVITY_SCHEDULER_MODE = env.str('CONNECTIVITY_SCHEDULER_MODE', default='spread')
+# Seconds between sweep runs; must match the beat schedule in deviceApp/celery.py
+CONNECTIVITY_SWEEP_TICK = env.int('CONNECTIVITY_SWEEP_TICK', default=60)
+# Probe rate limits (probes per second) shared by all workers through the cache;
+# a school's own probe_rate_limit overrides the school default
+CONNECTIVITY_SCHOOL_RATE_LIMIT = env.float('CONNECTIVITY_SCHOOL_RATE_LIMIT', default=20)
+CONNECTIVITY_SUBNET_RATE_LIMIT = env.float('CONNECTIVITY_SUBNET_RATE_LIMIT', default=10)
+# Sweep fan-out (see deviceApp/sharding.py): due devices are split into chunks of
+# whole /24 subnets that run on separate Celery workers when a result backend is set.
+# The chunk size adapts so each chunk takes about CONNECTIVITY_SWEEP_CHUNK_TARGET_SECONDS
+CONNECTIVITY_SWEEP_FANOUT = env.bool('CONNECTIVITY_SWEEP_FANOUT', default=True)
+CONNECTIVITY_SWEEP_CHUNK_SIZE = env.int('CONNECTIVITY_SWEEP_CHUNK_SIZE', default=200)
+CONNECTIVITY_SWEEP_CHUNK_TARGET_SECONDS = env.int('CONNECTIVITY_SWEEP_CHUNK_TARGET_SECONDS', default=30)
+CONNECTIVITY_SWEEP_MIN_CHUNK_SIZE = env.int('CONNECTIVITY_SWEEP_MIN_CHUNK_SIZE', default=20)
+CONNECTIVITY_SWEEP_MAX_CHUNK_SIZE = env.int('CONNECTIVITY_SWEEP_MAX_CHUNK_SIZE', default=2000)
+# Time budget for one sweep cycle (seconds); chunks not started by then are carried
+# over to the next cycle. Keep it below CONNECTIVITY_SWEEP_TICK
+CONNECTIVITY_SWEEP_BUDGET_SECONDS = env.int('CONNECTIVITY_SWEEP_BUDGET_SECONDS', default=50)
+# Probe history (deviceApp.ProbeResult) is partitioned by month on PostgreSQL:
+# partitions are created this many months ahead, and drop_probe_partitions keeps
+# this many months by default
+CONNECTIVITY_HISTORY_MONTHS_AHEAD = env.int('CONNECTIVITY_HISTORY_MONTHS_AHEAD', default=2)
+CONNECTIVITY_HISTORY_KEEP_MONTHS = env.int('CONNECTIVITY_HISTORY_KEEP_MONTHS', default=12)
+# Probe results that do not change a target's status only write a compact heartbeat;
+# the full stored snapshot is refreshed at most this often (seconds)
+CONNECTIVITY_HEARTBEAT_SECONDS = env.int('CONNECTIVITY_HEARTBEAT_SECONDS', default=300)
+# Consecutive probes that must agree before a status change is recorded as a transition
+CONNECTIVITY_TRANSITION_CONFIRMATIONS = env.int('CONNECTIVITY_TRANSITION_CONFIRMATIONS', default=2)
+# Confirmed transitions within CONNECTIVITY_FLAP_WINDOW that mark a target as flapping
+CONNECTIVITY_FLAP_THRESHOLD = env.int('CONNECTIVITY_FLAP_THRESHOLD', default=3)
+# Probe data retention tiers in days, 0 keeps forever; a rollup tier never keeps less than a finer one
+# (see deviceApp/retention.py)
+CONNECTIVITY_RAW_RETENTION_DAYS = env.int('CONNECTIVITY_RAW_RETENTION_DAYS', default=30)
+CONNECTIVITY_MINUTE_ROLLUP_RETENTION_DAYS = env.int('CONNECTIVITY_MINUTE_ROLLUP_RETENTION_DAYS', default=30)
+CONNECTIVITY_HOUR_ROLLUP_RETENTION_DAYS = env.int('CONNECTIVITY_HOUR_ROLLUP_RETENTION_DAYS', default=365)
+CONNECTIVITY_DAY_ROLLUP_RETENTION_DAYS = env.int('CONNECTIVITY_DAY_ROLLUP_RETENTION_DAYS', default=0)
+CONNECTIVITY_EVENT_RETENTION_DAYS = env.int('CONNECTIVITY_EVENT_RETENTION_DAYS', default=730)
+# Where expired probe data is archived as gzipped JSON Lines
+CONNECTIVITY_ARCHIVE_DIR = env.str('CONNECTIVITY_ARCHIVE_DIR', default=str(BASE_DIR / 'archive'))
+# Rows removed per transaction, the pause between chunks and the time budget of one run (seconds)
+CONNECTIVITY_RETENTION_BATCH_SIZE = env.int('CONNECTIVITY_RETENTION_BATCH_SIZE', default=5000)
+CONNECTIVITY_RETENTION_BATCH_PAUSE = env.float('CONNECTIVITY_RETENTION_BATCH_PAUSE', default=0.5)
+CONNECTIVITY_RETENTION_MAX_SECONDS = env.int('CONNECTIVITY_RETENTION_MAX_SECONDS', default=1800)
+# Local hours on working days (Monday=0) during which retention does not run
+CONNECTIVITY_BUSINESS_HOURS_START = env.int('CONNECTIVITY_BUSINESS_HOURS_START', default=7)
+CONNECTIVITY_BUSINESS_HOURS_END = env.int('CONNECTIVITY_BUSINESS_HOURS_END', default=18)
+CONNECTIVITY_BUSINESS_DAYS = [0, 1, 2, 3, 4]
+# The API flags a stored status as stale once it is older than this many probe intervals
+CONNECTIVITY_STALE_FACTOR = env.float('CONNECTIVITY_STALE_FACTOR', default=2)
+# Default and largest page sizes of the cursor-paginated list endpoints (see backend/pagination.py)
+API_PAGE_SIZE = env.int('API_PAGE_SIZE', default=50)
+API_MAX_PAGE_SIZE = env.int('API_MAX_PAGE_SIZE', default=500)
@@ -10,10 +10,27 @@ app.config_from_object('django.conf:settings', namespace='CELERY')
 app.autodiscover_tasks()
 
 # Schedule tasks
+# Each run only probes devices whose own adaptive interval has elapsed
+# (see deviceApp/scheduling.py), so the sweeps tick every minute
 app.conf.beat_schedule = {
-    'check-devices-every-3-minutes': {
+    'check-due-devices-every-minute': {
         'task': 'deviceApp.tasks.check_all_devices_connectivity',
-        'schedule': crontab(minute='*/3'),  # Run every 15 minutes
+        'schedule': crontab(minute='*'),
+    },
+    # Routers reuse the access point results from the device sweep above
+    'check-due-routers-every-minute': {
+        'task': 'routerApp.tasks.check_all_routers_connectivity',
+        'schedule': crontab(minute='*'),
+    },
+    # Probe history partitions are created a few months ahead
+    'ensure-probe-history-partitions-daily': {
+        'task': 'deviceApp.tasks.ensure_probe_history_partitions',
+        'schedule': crontab(hour=0, minute=30),
+    },
+    # Expired probe data is archived and removed outside business hours
+    'apply-probe-data-retention-nightly': {
+        'task': 'deviceApp.tasks.apply_probe_data_retention',
+        'schedule': crontab(hour=1, minute=15),
     },
 }
 
@@ -0,0 +1,125 @@
+# deviceApp/cycles.py
+"""
+Overlap protection and time budgets for sweep cycles.
+
+Only one sweep of each kind runs at a time: a sweep takes a lock in the
+Django cache (shared by every worker with a shared cache backend) and a run
+that finds the lock held is skipped. The lock expires on its own shortly
+after the cycle's budget, so a crashed worker cannot block sweeps for long.
+
+Each cycle has a budget of CONNECTIVITY_SWEEP_BUDGET_SECONDS. Chunks are
+taken longest-waiting first and a chunk that would start after the deadline
+is skipped; its devices keep their due times and are picked up first by the
+next cycle. Every cycle is recorded as a SweepCycle row with its progress,
+and marked 'failed' if the sweep itself breaks off.
+"""
+import logging
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F
+from django.utils.timezone import now
+
+from .models import SweepCycle
+
+logger = logging.getLogger(__name__)
+
+
+def get_sweep_budget():
+    """Seconds a sweep cycle may spend before carrying devices over"""
+    return getattr(settings, 'CONNECTIVITY_SWEEP_BUDGET_SECONDS', 50)
+
+
+class SweepLock:
+    """
+    Cache-backed lock held for the duration of one sweep cycle.
+    The token identifies the holder so a late release cannot drop a newer cycle's lock.
+    """
+
+    def __init__(self, kind, timeout=None):
+        self.key = f"connectivity:sweep:lock:{kind}"
+        self.timeout = timeout or get_sweep_budget() + 60
+
+    def acquire(self):
+        """Returns the lock token, or None if another cycle holds the lock"""
+        token = uuid.uuid4().hex
+        if cache.add(self.key, token, timeout=self.timeout):
+            return token
+        return None
+
+    def release(self, token):
+        if token and cache.get(self.key) == token:
+            cache.delete(self.key)
+
+    def is_held(self):
+        return cache.get(self.key) is not None
+
+
+def start_cycle(kind, due_count, chunk_count=0):
+    """Record the start of a sweep cycle. Returns the SweepCycle."""
+    started_at = now()
+    return SweepCycle.objects.create(
+        kind=kind,
+        started_at=started_at,
+        deadline=started_at + timedelta(seconds=get_sweep_budget()),
+        due_count=due_count,
+        chunk_count=chunk_count
+    )
+
+
+def cycle_time_left(cycle_id):
+    """Seconds until the cycle's deadline, or None when not part of a cycle"""
+    if cycle_id is None:
+        return None
+    deadline = SweepCycle.objects.filter(id=cycle_id).values_list('deadline', flat=True).first()
+    if deadline is None:
+        return None
+    return max(0.0, (deadline - now()).total_seconds())
+
+
+def cycle_expired(cycle_id):
+    """Whether the cycle's budget is spent (False when not part of a cycle)"""
+    time_left = cycle_time_left(cycle_id)
+    return time_left is not None and time_left <= 0
+
+
+def record_chunk_progress(cycle_id, checked):
+    """Count a finished chunk and the targets it checked towards the cycle"""
+    if cycle_id is None:
+        return
+    SweepCycle.objects.filter(id=cycle_id).update(
+        checked_count=F('checked_count') + checked,
+        chunks_done=F('chunks_done') + 1
+    )
+
+
+def finish_cycle(cycle_id, summary):
+    """
+    Record the outcome of a cycle: 'completed' if every due target was
+    checked, 'partial' if some were carried over.
+    """
+    if cycle_id is None:
+        return
+    carried_over = summary.get('carried_over', 0)
+    SweepCycle.objects.filter(id=cycle_id).update(
+        status='partial' if carried_over else 'completed',
+        finished_at=now(),
+        carried_over=carried_over,
+        summary={key: value for key, value in summary.items() if key != 'details'}
+    )
+    if carried_over:
+        logger.warning(f"Sweep cycle {cycle_id} ran out of time, {carried_over} targets carried over")
+
+
+def fail_cycle(cycle_id, error):
+    """Record that a cycle broke off with an error before it could finish"""
+    if cycle_id is None:
+        return
+    SweepCycle.objects.filter(id=cycle_id, status='running').update(
+        status='failed',
+        finished_at=now(),
+        summary={'error': str(error)}
+    )
+    logger.error(f"Sweep cycle {cycle_id} failed: {error}")
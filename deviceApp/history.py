@@ -0,0 +1,178 @@
+# deviceApp/history.py
+"""
+Append-only probe result history (the ProbeResult model).
+
+Every saved probe of a device or router appends one ProbeResult row. Inside
+a writeback.probe_write_batch() block the rows are collected and written
+with one bulk insert when the block ends; the sweep wraps each chunk in a
+batch so a chunk costs one insert rather than one per device.
+
+On PostgreSQL the table is range-partitioned by month on checked_at, with a
+default partition catching anything outside the monthly ranges. Partitions
+are created ahead of time (ensure_partitions, run daily by Celery beat) and
+old months are removed by dropping their partition, which is far cheaper
+than deleting rows.
+
+Each write also updates the uptime and latency rollups (see rollups.py).
+"""
+import logging
+from datetime import date
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils.timezone import now
+
+from .models import ProbeResult
+from .rollups import update_rollups
+from .utils import extract_probe_metrics
+from .writeback import pending_writes
+
+logger = logging.getLogger(__name__)
+
+
+def build_probe_result(target_type, target_id, school_id, result, checked_at=None):
+    """
+    Build an unsaved ProbeResult from a probe engine result dictionary.
+
+    Parameters:
+    - target_type: 'device' or 'router'
+    - target_id: ID of the device or router
+    - school_id: ID of the school the target belongs to
+    - result: Result dictionary from the probe engine (or a derived result)
+    - checked_at: When the probe ran (defaults to now)
+    """
+    metrics = extract_probe_metrics(result)
+    return ProbeResult(
+        target_type=target_type,
+        target_id=target_id,
+        school_id=school_id,
+        checked_at=checked_at or now(),
+        status=result.get('status', 'offline'),
+        cause=result.get('cause'),
+        latency_ms=metrics['latency_ms'],
+        packet_loss=metrics['packet_loss'],
+        open_ports=metrics['open_ports'],
+        error=(result.get('error') or '')[:255] or None
+    )
+
+
+def record_probe_result(target_type, target_id, school_id, result, checked_at=None):
+    """
+    Append a probe result to the history; queued when inside a
+    writeback.probe_write_batch()
+    """
+    row = build_probe_result(target_type, target_id, school_id, result, checked_at)
+    writes = pending_writes()
+    if writes is not None:
+        writes.add_history(row)
+    else:
+        row.save()
+        update_rollups([row])
+
+
+# Monthly partitions (PostgreSQL only)
+
+def is_partitioned():
+    return connection.vendor == 'postgresql'
+
+
+def add_months(month, count):
+    """First day of the month `count` months after `month` (a date on the first of a month)"""
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f"{ProbeResult._meta.db_table}_{month:%Y%m}"
+
+
+def create_partition(month):
+    """
+    Create the partition holding the given month if it does not exist yet.
+    Must run before any row for that month lands in the default partition,
+    since PostgreSQL refuses to create a partition overlapping rows there.
+
+    Returns True if the partition was created.
+    """
+    if not is_partitioned():
+        return False
+
+    name = partition_name(month)
+    if name in list_partitions():
+        return False
+
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"CREATE TABLE {quote(name)} PARTITION OF {quote(ProbeResult._meta.db_table)} "
+            f"FOR VALUES FROM (%s) TO (%s)",
+            [f"{month.isoformat()} 00:00:00+00", f"{add_months(month, 1).isoformat()} 00:00:00+00"]
+        )
+    logger.info(f"Created probe history partition {name}")
+    return True
+
+
+def ensure_partitions(months_ahead=None):
+    """
+    Make sure partitions exist for the current month and the next months_ahead
+    (default CONNECTIVITY_HISTORY_MONTHS_AHEAD) months.
+
+    Returns the names of the partitions created.
+    """
+    if months_ahead is None:
+        months_ahead = getattr(settings, 'CONNECTIVITY_HISTORY_MONTHS_AHEAD', 2)
+
+    current_month = now().date().replace(day=1)
+    created = []
+    for offset in range(months_ahead + 1):
+        month = add_months(current_month, offset)
+        if create_partition(month):
+            created.append(partition_name(month))
+    return created
+
+
+def list_partitions():
+    """Names of the monthly partitions, oldest first (the default partition is excluded)"""
+    if not is_partitioned():
+        return []
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT child.relname
+            FROM pg_inherits
+            JOIN pg_class parent ON pg_inherits.inhparent = parent.oid
+            JOIN pg_class child ON pg_inherits.inhrelid = child.oid
+            WHERE parent.relname = %s
+            """,
+            [ProbeResult._meta.db_table]
+        )
+        names = [row[0] for row in cursor.fetchall()]
+
+    prefix = ProbeResult._meta.db_table + '_'
+    return sorted(name for name in names if name[len(prefix):].isdigit())
+
+
+def partition_month(name):
+    """The month a partition holds, from its name"""
+    suffix = name.rsplit('_', 1)[1]
+    return date(int(suffix[:4]), int(suffix[4:]), 1)
+
+
+def drop_partitions_before(cutoff_month, dry_run=False):
+    """
+    Drop every monthly partition holding only data from before cutoff_month.
+
+    Returns the names of the partitions dropped (or that would be dropped).
+    """
+    old_partitions = [name for name in list_partitions() if partition_month(name) < cutoff_month]
+    if dry_run:
+        return old_partitions
+
+    quote = connection.ops.quote_name
+    with transaction.atomic(), connection.cursor() as cursor:
+        for name in old_partitions:
+            cursor.execute(f"ALTER TABLE {quote(ProbeResult._meta.db_table)} DETACH PARTITION {quote(name)}")
+            cursor.execute(f"DROP TABLE {quote(name)}")
+            logger.info(f"Dropped probe history partition {name}")
+    return old_partitions
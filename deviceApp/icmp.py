@@ -0,0 +1,251 @@
+# deviceApp/icmp.py
+"""
+In-process ICMP echo ("ping") support for the probe engine.
+
+Uses Linux unprivileged ICMP datagram sockets when the host allows them
+(net.ipv4.ping_group_range) and falls back to a raw socket when running with
+CAP_NET_RAW. One socket serves every target pinged on an event loop; replies
+are matched back to their request by source address and sequence number.
+When neither socket type can be opened, open_pinger() returns None and the
+caller falls back to the `ping` command.
+"""
+import asyncio
+import errno
+import itertools
+import os
+import socket
+import struct
+import time
+
+ICMP_ECHO_REPLY = 0
+ICMP_ECHO_REQUEST = 8
+
+PAYLOAD = bytes(range(56))
+
+# ICMP errors a datagram socket reports for one destination; the socket stays usable
+DESTINATION_ERRORS = {errno.ECONNREFUSED, errno.EHOSTUNREACH, errno.ENETUNREACH, errno.EHOSTDOWN}
+
+# Remember a failed socket open so every probe does not retry it
+_unavailable_reason = None
+
+
+class IcmpUnavailable(OSError):
+    """Raised when neither a datagram nor a raw ICMP socket can be opened"""
+
+
+def icmp_checksum(data):
+    """Internet checksum (RFC 1071) of the given bytes"""
+    if len(data) % 2:
+        data += b'\x00'
+    total = sum(struct.unpack(f'!{len(data) // 2}H', data))
+    total = (total >> 16) + (total & 0xFFFF)
+    total += total >> 16
+    return ~total & 0xFFFF
+
+
+def build_echo_request(identifier, sequence, payload=PAYLOAD):
+    """Build an ICMP echo request packet"""
+    header = struct.pack('!BBHHH', ICMP_ECHO_REQUEST, 0, 0, identifier, sequence)
+    checksum = icmp_checksum(header + payload)
+    header = struct.pack('!BBHHH', ICMP_ECHO_REQUEST, 0, checksum, identifier, sequence)
+    return header + payload
+
+
+def parse_echo_reply(packet, has_ip_header):
+    """
+    Parse an ICMP echo reply.
+
+    Returns (identifier, sequence), or None if the packet is not an echo reply.
+    """
+    if has_ip_header:
+        if len(packet) < 20:
+            return None
+        packet = packet[(packet[0] & 0x0F) * 4:]
+    if len(packet) < 8:
+        return None
+    icmp_type, _, _, identifier, sequence = struct.unpack('!BBHHH', packet[:8])
+    if icmp_type != ICMP_ECHO_REPLY:
+        return None
+    return identifier, sequence
+
+
+def _open_socket():
+    """
+    Open a non-blocking ICMP socket.
+
+    Returns (socket, is_raw). Raises IcmpUnavailable if neither socket type is permitted.
+    """
+    errors = []
+    for sock_type in (socket.SOCK_DGRAM, socket.SOCK_RAW):
+        try:
+            sock = socket.socket(socket.AF_INET, sock_type, socket.IPPROTO_ICMP)
+        except OSError as e:
+            errors.append(str(e))
+            continue
+        sock.setblocking(False)
+        return sock, sock_type == socket.SOCK_RAW
+    raise IcmpUnavailable(f"ICMP sockets unavailable: {'; '.join(errors)}")
+
+
+class AsyncPinger:
+    """
+    Sends ICMP echo requests to many hosts from a single socket on one event loop.
+    """
+
+    def __init__(self, loop=None):
+        self.loop = loop or asyncio.get_running_loop()
+        self.sock, self.raw = _open_socket()
+        # Datagram sockets get their identifier rewritten by the kernel
+        self.identifier = (os.getpid() ^ id(self)) & 0xFFFF
+        self._sequence = itertools.count(1)
+        self._waiters = {}
+        try:
+            self.loop.add_reader(self.sock.fileno(), self._on_readable)
+        except NotImplementedError:
+            # e.g. the Windows proactor event loop
+            self.sock.close()
+            raise IcmpUnavailable("Event loop does not support socket readers")
+
+    @property
+    def closed(self):
+        return self.sock is None
+
+    def close(self, error=None):
+        """
+        Stop listening and close the socket.
+
+        Pending pings fail with error if one is given, otherwise they are cancelled.
+        """
+        if self.sock is None:
+            return
+        self.loop.remove_reader(self.sock.fileno())
+        self.sock.close()
+        self.sock = None
+        for future in self._waiters.values():
+            if future.done():
+                continue
+            if error is None:
+                future.cancel()
+            else:
+                future.set_exception(error)
+        self._waiters.clear()
+
+    def _next_sequence(self):
+        return next(self._sequence) & 0xFFFF
+
+    def _on_readable(self):
+        while self.sock is not None:
+            try:
+                packet, address = self.sock.recvfrom(2048)
+            except BlockingIOError:
+                return
+            except OSError as e:
+                # ICMP errors (e.g. host unreachable) surface here on datagram sockets;
+                # the loop calls back if more replies are queued. Any other error
+                # means the socket is broken, so fail the pings still waiting on it.
+                if e.errno not in DESTINATION_ERRORS:
+                    self.close(e)
+                return
+
+            received_at = time.perf_counter()
+            reply = parse_echo_reply(packet, self.raw)
+            if reply is None:
+                continue
+            identifier, sequence = reply
+            if self.raw and identifier != self.identifier:
+                continue  # Reply to another process's ping
+
+            future = self._waiters.get((address[0], sequence))
+            if future is not None and not future.done():
+                future.set_result(received_at)
+
+    async def _echo(self, ip_address, timeout):
+        """Send one echo request and return the round trip time in ms, or None on timeout"""
+        if self.sock is None:
+            raise OSError("ICMP socket is closed")
+        sequence = self._next_sequence()
+        key = (ip_address, sequence)
+        future = self.loop.create_future()
+        self._waiters[key] = future
+        try:
+            packet = build_echo_request(self.identifier, sequence)
+            sent_at = time.perf_counter()
+            await self.loop.sock_sendto(self.sock, packet, (ip_address, 0))
+            received_at = await asyncio.wait_for(future, timeout)
+            return (received_at - sent_at) * 1000
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            self._waiters.pop(key, None)
+
+    async def ping(self, ip_address, count=1, timeout=5, interval=0.2):
+        """
+        Ping a host.
+
+        Parameters:
+        - ip_address: IPv4 address to ping
+        - count: Number of echo requests to send
+        - timeout: Seconds to wait for each reply
+        - interval: Seconds between consecutive requests
+
+        Returns a dictionary with the average latency, packet loss percentage
+        and per-packet round trip times (None for lost packets).
+        """
+        result = {
+            'latency_ms': None,
+            'error': None,
+            'packet_loss': None,
+            'rtts_ms': []
+        }
+
+        echoes = []
+        try:
+            for index in range(count):
+                if index:
+                    await asyncio.sleep(interval)
+                echoes.append(asyncio.ensure_future(self._echo(ip_address, timeout)))
+            rtts = await asyncio.gather(*echoes)
+        except OSError as e:
+            for echo in echoes:
+                echo.cancel()
+            result['error'] = f"Ping error: {str(e)}"
+            return result
+
+        received = [rtt for rtt in rtts if rtt is not None]
+        result['rtts_ms'] = [round(rtt, 3) if rtt is not None else None for rtt in rtts]
+        result['packet_loss'] = round(100 * (count - len(received)) / count) if count else 0
+
+        if received:
+            result['latency_ms'] = sum(received) / len(received)
+        else:
+            result['error'] = "No reply received from host"
+
+        return result
+
+    async def ping_many(self, ip_addresses, count=1, timeout=5, interval=0.2):
+        """
+        Ping many hosts at once from this socket.
+
+        Returns a dictionary mapping each IP address to its ping() result.
+        """
+        ip_addresses = list(ip_addresses)
+        results = await asyncio.gather(*(
+            self.ping(ip, count=count, timeout=timeout, interval=interval) for ip in ip_addresses
+        ))
+        return dict(zip(ip_addresses, results))
+
+
+def open_pinger(loop=None):
+    """
+    Open an AsyncPinger on the running loop.
+
+    Returns None (and remembers why) when ICMP sockets are not permitted on this host.
+    """
+    global _unavailable_reason
+    if _unavailable_reason is not None:
+        return None
+    try:
+        return AsyncPinger(loop)
+    except IcmpUnavailable as e:
+        _unavailable_reason = str(e)
+        return None
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+
+from deviceApp.retention import RETENTION_SETTINGS, apply_retention, get_archive_dir, get_retention_days
+
+
+class Command(BaseCommand):
+    help = "Archive and remove probe history, rollups and events past their retention period"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Count what would be removed without removing anything")
+        parser.add_argument('--force', action='store_true',
+                            help="Run even during business hours")
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help="Rows deleted per transaction (default CONNECTIVITY_RETENTION_BATCH_SIZE)")
+        parser.add_argument('--max-seconds', type=int, default=None,
+                            help="Time budget for this run (default CONNECTIVITY_RETENTION_MAX_SECONDS)")
+
+    def handle(self, *args, **options):
+        for tier in RETENTION_SETTINGS:
+            days = get_retention_days(tier)
+            self.stdout.write(f"{tier}: {f'{days} days' if days else 'kept forever'}")
+        self.stdout.write(f"Archive directory: {get_archive_dir()}")
+
+        summary = apply_retention(
+            dry_run=options['dry_run'],
+            force=options['force'],
+            batch_size=options['batch_size'],
+            max_seconds=options['max_seconds']
+        )
+        if summary['status'] == 'skipped':
+            self.stdout.write(self.style.WARNING("Business hours, nothing done (use --force to run anyway)"))
+            return
+
+        verb = "Would remove" if options['dry_run'] else "Removed"
+        for tier, count in summary.items():
+            if tier not in ('dry_run', 'status'):
+                self.stdout.write(f"{verb} {count} {tier.replace('_', ' ')}")
+        if summary['status'] == 'partial':
+            self.stdout.write(self.style.WARNING("Stopped early (time budget or business hours); run again to continue"))
+        else:
+            self.stdout.write(self.style.SUCCESS("Retention applied"))
@@ -0,0 +1,65 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, time, timedelta, timezone
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Max, Min
+
+from deviceApp.models import ProbeResult
+from deviceApp.retention import get_retention_cutoff
+from deviceApp.rollups import rebuild_rollups
+
+
+def rebuild_day(day):
+    """Rebuild the rollups of one UTC day in its own database connection"""
+    try:
+        window_start = datetime.combine(day, time.min, tzinfo=timezone.utc)
+        return day, rebuild_rollups(window_start, window_start + timedelta(days=1))
+    finally:
+        connection.close()
+
+
+class Command(BaseCommand):
+    help = "Rebuild the uptime and latency rollups from the probe history, one day window per worker"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help="First day to rebuild (YYYY-MM-DD, default: oldest probe result)")
+        parser.add_argument('--end', help="Last day to rebuild (YYYY-MM-DD, default: newest probe result)")
+        parser.add_argument('--workers', type=int, default=4, help="Day windows rebuilt in parallel")
+
+    def handle(self, *args, **options):
+        bounds = ProbeResult.objects.aggregate(first=Min('checked_at'), last=Max('checked_at'))
+        try:
+            start = datetime.strptime(options['start'], '%Y-%m-%d').date() if options['start'] else None
+            end = datetime.strptime(options['end'], '%Y-%m-%d').date() if options['end'] else None
+        except ValueError:
+            raise CommandError("Dates must be in YYYY-MM-DD format")
+
+        start = start or (bounds['first'] and bounds['first'].date())
+        end = end or (bounds['last'] and bounds['last'].date())
+        if start is None or end is None:
+            self.stdout.write("No probe history to backfill from")
+            return
+
+        # Older buckets outlive the raw history and must not be rebuilt from what is left of it
+        cutoff = get_retention_cutoff('raw')
+        if cutoff and start < cutoff.date():
+            self.stdout.write(self.style.WARNING(
+                f"Raw history before {cutoff:%Y-%m-%d %H:%M} is past its retention, "
+                f"keeping the rollups before then as they are"
+            ))
+            start = cutoff.date()
+        if start > end:
+            self.stdout.write("No probe history within the raw retention to backfill from")
+            return
+
+        days = [start + timedelta(days=offset) for offset in range((end - start).days + 1)]
+        self.stdout.write(f"Rebuilding rollups for {len(days)} days with {options['workers']} workers")
+
+        with ThreadPoolExecutor(max_workers=max(options['workers'], 1)) as executor:
+            futures = [executor.submit(rebuild_day, day) for day in days]
+            for future in as_completed(futures):
+                day, buckets = future.result()
+                self.stdout.write(f"{day}: {buckets} buckets")
+
+        self.stdout.write(self.style.SUCCESS("Rollup backfill complete"))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from deviceApp.history import ensure_partitions, is_partitioned
+
+
+class Command(BaseCommand):
+    help = "Create monthly probe history partitions for the current month and the months ahead (PostgreSQL only)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months-ahead', type=int, default=None,
+                            help="Months to create after the current one (default CONNECTIVITY_HISTORY_MONTHS_AHEAD)")
+
+    def handle(self, *args, **options):
+        if not is_partitioned():
+            self.stdout.write("Probe history is only partitioned on PostgreSQL, nothing to do")
+            return
+
+        created = ensure_partitions(options['months_ahead'])
+        if created:
+            self.stdout.write(self.style.SUCCESS(f"Created partitions: {', '.join(created)}"))
+        else:
+            self.stdout.write("All partitions already exist")
@@ -0,0 +1,33 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils.timezone import now
+
+from deviceApp.history import add_months, drop_partitions_before, is_partitioned
+
+
+class Command(BaseCommand):
+    help = "Drop monthly probe history partitions older than the retention period (PostgreSQL only)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep-months', type=int, default=None,
+                            help="Months to keep including the current one (default CONNECTIVITY_HISTORY_KEEP_MONTHS)")
+        parser.add_argument('--dry-run', action='store_true',
+                            help="List the partitions that would be dropped without dropping them")
+
+    def handle(self, *args, **options):
+        if not is_partitioned():
+            self.stdout.write("Probe history is only partitioned on PostgreSQL, nothing to do")
+            return
+
+        keep_months = options['keep_months']
+        if keep_months is None:
+            keep_months = getattr(settings, 'CONNECTIVITY_HISTORY_KEEP_MONTHS', 12)
+        cutoff = add_months(now().date().replace(day=1), 1 - max(keep_months, 1))
+
+        dropped = drop_partitions_before(cutoff, dry_run=options['dry_run'])
+        if not dropped:
+            self.stdout.write(f"No partitions older than {cutoff:%Y-%m}")
+        elif options['dry_run']:
+            self.stdout.write(f"Would drop: {', '.join(dropped)}")
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Dropped: {', '.join(dropped)}"))
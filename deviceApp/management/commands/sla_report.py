@@ -0,0 +1,48 @@
+from datetime import datetime, timezone
+
+from django.core.management.base import BaseCommand, CommandError
+
+from deviceApp.history import add_months
+from deviceApp.sla import GROUPINGS, sla_report
+
+
+class Command(BaseCommand):
+    help = "Compute uptime, outages, MTTR and MTBF per device and router or per school over a window"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--month', help="Month to report (YYYY-MM, default: the previous month)")
+        parser.add_argument('--start', help="Start of a custom window (YYYY-MM-DD, instead of --month)")
+        parser.add_argument('--end', help="End of a custom window, exclusive (YYYY-MM-DD)")
+        parser.add_argument('--group', choices=sorted(GROUPINGS), default='school', help="Report rows per target or per school")
+        parser.add_argument('--school', type=int, help="Only this school ID")
+        parser.add_argument('--target-type', choices=['device', 'router'], help="Only devices or only routers")
+        parser.add_argument('--output', help="Write the report to this CSV file instead of printing it")
+
+    def handle(self, *args, **options):
+        try:
+            if options['start'] or options['end']:
+                if not (options['start'] and options['end']):
+                    raise CommandError("--start and --end must be given together")
+                start = datetime.strptime(options['start'], '%Y-%m-%d').date()
+                end = datetime.strptime(options['end'], '%Y-%m-%d').date()
+            else:
+                if options['month']:
+                    start = datetime.strptime(options['month'], '%Y-%m').date()
+                else:
+                    start = add_months(datetime.now(timezone.utc).date().replace(day=1), -1)
+                end = add_months(start, 1)
+        except ValueError:
+            raise CommandError("Use YYYY-MM for --month and YYYY-MM-DD for --start and --end")
+        if start >= end:
+            raise CommandError("--start must be before --end")
+
+        window_start = datetime.combine(start, datetime.min.time(), tzinfo=timezone.utc)
+        window_end = datetime.combine(end, datetime.min.time(), tzinfo=timezone.utc)
+        report = sla_report(window_start, window_end, options['group'], options['target_type'], options['school'])
+
+        if options['output']:
+            report.to_csv(options['output'], index=False)
+            self.stdout.write(self.style.SUCCESS(f"Wrote {len(report)} rows to {options['output']}"))
+        else:
+            self.stdout.write(f"SLA from {start} to {end} ({len(report)} rows)")
+            self.stdout.write(report.to_string(index=False))
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.17 on 2026-10-18 08:54
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('deviceApp', '0008_device_last_status_device_last_status_change_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SweepCycle',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('devices', 'Devices'), ('routers', 'Routers')], max_length=20)),
+                ('status', models.CharField(choices=[('running', 'Running'), ('completed', 'Completed'), ('partial', 'Partial')], default='running', max_length=20)),
+                ('started_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('deadline', models.DateTimeField()),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('due_count', models.IntegerField(default=0)),
+                ('checked_count', models.IntegerField(default=0)),
+                ('carried_over', models.IntegerField(default=0, help_text='Due targets left for the next cycle when the budget ran out')),
+                ('chunk_count', models.IntegerField(default=0)),
+                ('chunks_done', models.IntegerField(default=0)),
+                ('summary', models.JSONField(blank=True, default=dict)),
+            ],
+            options={
+                'ordering': ['-started_at'],
+                'indexes': [models.Index(fields=['kind', '-started_at'], name='deviceApp_s_kind_9a1c81_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,96 @@
+# Generated by Django 4.2.17 on 2026-10-18 08:55
+
+from datetime import date
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+def month_bounds(year, month):
+    start = date(year, month, 1)
+    end = date(year + (month == 12), month % 12 + 1, 1)
+    return start, end
+
+
+def create_probe_result_table(apps, schema_editor):
+    """
+    On PostgreSQL create the history table partitioned by month on checked_at,
+    with a default partition and partitions for this month and the next two.
+    Other databases get a plain table.
+    """
+    ProbeResult = apps.get_model('deviceApp', 'ProbeResult')
+    if schema_editor.connection.vendor != 'postgresql':
+        schema_editor.create_model(ProbeResult)
+        return
+
+    table = ProbeResult._meta.db_table
+    quote = schema_editor.quote_name
+    schema_editor.execute(f"""
+        CREATE TABLE {quote(table)} (
+            "id" bigserial NOT NULL,
+            "target_type" varchar(10) NOT NULL,
+            "target_id" integer NOT NULL,
+            "school_id" integer NULL,
+            "checked_at" timestamp with time zone NOT NULL,
+            "status" varchar(20) NOT NULL,
+            "cause" varchar(50) NULL,
+            "latency_ms" double precision NULL,
+            "packet_loss" double precision NULL,
+            "open_ports" jsonb NOT NULL,
+            "error" varchar(255) NULL,
+            PRIMARY KEY ("id", "checked_at")
+        ) PARTITION BY RANGE ("checked_at")
+    """)
+    schema_editor.execute(f'CREATE TABLE {quote(table + "_default")} PARTITION OF {quote(table)} DEFAULT')
+    for index in ProbeResult._meta.indexes:
+        schema_editor.add_index(ProbeResult, index)
+
+    today = date.today()
+    year, month = today.year, today.month
+    for _ in range(3):
+        start, end = month_bounds(year, month)
+        schema_editor.execute(
+            f"CREATE TABLE {quote(f'{table}_{start:%Y%m}')} PARTITION OF {quote(table)} "
+            f"FOR VALUES FROM ('{start.isoformat()} 00:00:00+00') TO ('{end.isoformat()} 00:00:00+00')"
+        )
+        year, month = end.year, end.month
+
+
+def drop_probe_result_table(apps, schema_editor):
+    # Dropping the partitioned table drops its partitions too
+    schema_editor.delete_model(apps.get_model('deviceApp', 'ProbeResult'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('deviceApp', '0009_sweepcycle'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='ProbeResult',
+                    fields=[
+                        ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                        ('target_type', models.CharField(choices=[('device', 'Device'), ('router', 'Router')], max_length=10)),
+                        ('target_id', models.IntegerField()),
+                        ('school_id', models.IntegerField(blank=True, null=True)),
+                        ('checked_at', models.DateTimeField(default=django.utils.timezone.now)),
+                        ('status', models.CharField(max_length=20)),
+                        ('cause', models.CharField(blank=True, max_length=50, null=True)),
+                        ('latency_ms', models.FloatField(blank=True, null=True)),
+                        ('packet_loss', models.FloatField(blank=True, null=True)),
+                        ('open_ports', models.JSONField(blank=True, default=list)),
+                        ('error', models.CharField(blank=True, max_length=255, null=True)),
+                    ],
+                    options={
+                        'ordering': ['-checked_at'],
+                        'indexes': [models.Index(fields=['target_type', 'target_id', 'checked_at'], name='deviceApp_p_target__9b0085_idx'), models.Index(fields=['school_id', 'checked_at'], name='deviceApp_p_school__b69287_idx')],
+                    },
+                ),
+            ],
+        ),
+        migrations.RunPython(create_probe_result_table, drop_probe_result_table),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.17 on 2026-10-18 08:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('deviceApp', '0010_proberesult'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConnectivityRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('granularity', models.CharField(choices=[('minute', 'Minute'), ('hour', 'Hour'), ('day', 'Day')], max_length=10)),
+                ('scope', models.CharField(choices=[('device', 'Device'), ('router', 'Router'), ('school', 'School'), ('province', 'Province')], max_length=10)),
+                ('scope_key', models.CharField(help_text='Device, router or school ID, or the province name', max_length=100)),
+                ('bucket_start', models.DateTimeField()),
+                ('probe_count', models.IntegerField(default=0)),
+                ('online_count', models.IntegerField(default=0)),
+                ('latency_count', models.IntegerField(default=0)),
+                ('latency_sum', models.FloatField(default=0)),
+                ('latency_min', models.FloatField(blank=True, null=True)),
+                ('latency_max', models.FloatField(blank=True, null=True)),
+                ('latency_histogram', models.JSONField(blank=True, default=list, help_text='Latency counts per rollups.LATENCY_BUCKETS_MS bucket')),
+            ],
+            options={
+                'ordering': ['bucket_start'],
+                'indexes': [models.Index(fields=['granularity', 'bucket_start'], name='deviceApp_c_granula_0a2352_idx')],
+                'unique_together': {('granularity', 'scope', 'scope_key', 'bucket_start')},
+            },
+        ),
+    ]
@@ -0,0 +1,89 @@
+# Generated by Django 4.2.17 on 2026-10-18 08:59
+
+import json
+
+from django.db import migrations, models
+
+
+def parse_connectivity_details(apps, schema_editor):
+    """Move the JSON text of the latest result into the JSON column and fill the metric columns"""
+    Device = apps.get_model('deviceApp', 'Device')
+    devices = []
+    for device in Device.objects.exclude(connectivity_details_text__isnull=True).exclude(connectivity_details_text='').iterator():
+        try:
+            result = json.loads(device.connectivity_details_text)
+        except json.JSONDecodeError:
+            continue
+        if not isinstance(result, dict):
+            continue
+
+        ping_check = result.get('ping_check') or {}
+        port_check = result.get('port_check') or {}
+        device.connectivity_details = result
+        device.latency_ms = ping_check.get('latency_ms')
+        device.packet_loss = ping_check.get('packet_loss')
+        device.ports_checked = port_check.get('ports_checked')
+        device.ports_open = port_check.get('ports_open')
+        device.open_ports = port_check.get('open_ports') or []
+        devices.append(device)
+
+    Device.objects.bulk_update(devices, ['connectivity_details', 'latency_ms', 'packet_loss',
+                                       'ports_checked', 'ports_open', 'open_ports'], batch_size=500)
+
+
+def dump_connectivity_details(apps, schema_editor):
+    Device = apps.get_model('deviceApp', 'Device')
+    devices = list(Device.objects.all())
+    for device in devices:
+        device.connectivity_details_text = json.dumps(device.connectivity_details) if device.connectivity_details else None
+    Device.objects.bulk_update(devices, ['connectivity_details_text'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('deviceApp', '0011_connectivityrollup'),
+    ]
+
+    operations = [
+        migrations.RenameField(
+            model_name='device',
+            old_name='connectivity_details',
+            new_name='connectivity_details_text',
+        ),
+        migrations.AddField(
+            model_name='device',
+            name='connectivity_details',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='device',
+            name='latency_ms',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='device',
+            name='open_ports',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddField(
+            model_name='device',
+            name='packet_loss',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='device',
+            name='ports_checked',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='device',
+            name='ports_open',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.RunPython(parse_connectivity_details, dump_connectivity_details),
+        migrations.RemoveField(
+            model_name='device',
+            name='connectivity_details_text',
+        ),
+    ]
@@ -0,0 +1,115 @@
+# Generated by Django 4.2.17 on 2026-10-18 09:01
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+STATE_FIELDS = ['last_connectivity', 'last_check_attempt', 'connectivity_error', 'connectivity_details',
+                'latency_ms', 'packet_loss', 'ports_checked', 'ports_open', 'open_ports',
+                'last_status', 'last_status_change', 'probe_interval', 'next_check_due']
+
+
+def copy_state_to_table(apps, schema_editor):
+    Device = apps.get_model('deviceApp', 'Device')
+    DeviceProbeState = apps.get_model('deviceApp', 'DeviceProbeState')
+    DeviceProbeState.objects.bulk_create([
+        DeviceProbeState(target_id=target.id, **{field: getattr(target, field) for field in STATE_FIELDS})
+        for target in Device.objects.all().iterator()
+    ], batch_size=500)
+
+
+def copy_state_to_inventory(apps, schema_editor):
+    Device = apps.get_model('deviceApp', 'Device')
+    DeviceProbeState = apps.get_model('deviceApp', 'DeviceProbeState')
+    targets = []
+    for state in DeviceProbeState.objects.all().iterator():
+        target = Device(id=state.target_id)
+        for field in STATE_FIELDS:
+            setattr(target, field, getattr(state, field))
+        targets.append(target)
+    Device.objects.bulk_update(targets, STATE_FIELDS, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('deviceApp', '0012_structured_connectivity_metrics'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeviceProbeState',
+            fields=[
+                ('last_connectivity', models.DateTimeField(blank=True, null=True)),
+                ('last_check_attempt', models.DateTimeField(blank=True, null=True)),
+                ('connectivity_error', models.CharField(blank=True, max_length=255, null=True)),
+                ('connectivity_details', models.JSONField(blank=True, default=dict)),
+                ('latency_ms', models.FloatField(blank=True, null=True)),
+                ('packet_loss', models.FloatField(blank=True, null=True)),
+                ('ports_checked', models.IntegerField(blank=True, null=True)),
+                ('ports_open', models.IntegerField(blank=True, null=True)),
+                ('open_ports', models.JSONField(blank=True, default=list)),
+                ('last_status', models.CharField(blank=True, max_length=20, null=True)),
+                ('last_status_change', models.DateTimeField(blank=True, null=True)),
+                ('probe_interval', models.IntegerField(blank=True, help_text='Current probe interval in seconds', null=True)),
+                ('next_check_due', models.DateTimeField(blank=True, db_index=True, null=True)),
+                ('target', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='probe_state', serialize=False, to='deviceApp.device')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.RunPython(copy_state_to_table, copy_state_to_inventory),
+        migrations.RemoveField(
+            model_name='device',
+            name='connectivity_details',
+        ),
+        migrations.RemoveField(
+            model_name='device',
+            name='connectivity_error',
+        ),
+        migrations.RemoveField(
+            model_name='device',
+            name='last_check_attempt',
+        ),
+        migrations.RemoveField(
+            model_name='device',
+            name='last_connectivity',
+        ),
+        migrations.RemoveField(
+            model_name='device',
+            name='last_status',
+        ),
+        migrations.RemoveField(
+            model_name='device',
+            name='last_status_change',
+        ),
+        migrations.RemoveField(
+            model_name='device',
+            name='latency_ms',
+        ),
+        migrations.RemoveField(
+            model_name='device',
+            name='next_check_due',
+        ),
+        migrations.RemoveField(
+            model_name='device',
+            name='open_ports',
+        ),
+        migrations.RemoveField(
+            model_name='device',
+            name='packet_loss',
+        ),
+        migrations.RemoveField(
+            model_name='device',
+            name='ports_checked',
+        ),
+        migrations.RemoveField(
+            model_name='device',
+            name='ports_open',
+        ),
+        migrations.RemoveField(
+            model_name='device',
+            name='probe_interval',
+        ),
+    ]
@@ -0,0 +1,75 @@
+# Generated by Django 4.2.17 on 2026-10-18 09:07
+
+from django.db import migrations, models
+from django.db.models import F
+import django.utils.timezone
+
+
+def initialise_confirmed_status(apps, schema_editor):
+    # Start every detector from the status of the latest probe (see transitions.classify_status)
+    DeviceProbeState = apps.get_model('deviceApp', 'DeviceProbeState')
+    DeviceProbeState.objects.update(confirmed_status=F('last_status'))
+    DeviceProbeState.objects.filter(
+        last_status='offline', connectivity_error__contains='reachable but has no internet'
+    ).update(confirmed_status='no_internet')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('deviceApp', '0014_probestate_last_confirmed_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='deviceprobestate',
+            name='confirmed_status',
+            field=models.CharField(blank=True, max_length=20, null=True),
+        ),
+        migrations.AddField(
+            model_name='deviceprobestate',
+            name='flapping',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='deviceprobestate',
+            name='pending_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='deviceprobestate',
+            name='pending_since',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='deviceprobestate',
+            name='pending_status',
+            field=models.CharField(blank=True, max_length=20, null=True),
+        ),
+        migrations.AddField(
+            model_name='deviceprobestate',
+            name='recent_transitions',
+            field=models.JSONField(blank=True, default=list, help_text='Times of the confirmed transitions within the flap window'),
+        ),
+        migrations.CreateModel(
+            name='StatusTransitionEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('target_type', models.CharField(choices=[('device', 'Device'), ('router', 'Router')], max_length=10)),
+                ('target_id', models.IntegerField()),
+                ('school_id', models.IntegerField(blank=True, null=True)),
+                ('kind', models.CharField(choices=[('transition', 'Transition'), ('flap_start', 'Flapping started'), ('flap_end', 'Flapping ended')], default='transition', max_length=20)),
+                ('previous_status', models.CharField(blank=True, max_length=20, null=True)),
+                ('status', models.CharField(max_length=20)),
+                ('occurred_at', models.DateTimeField(default=django.utils.timezone.now, help_text='When the new status was first seen')),
+                ('confirmed_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('confirmations', models.IntegerField(default=1, help_text='Consecutive probes that agreed on the new status')),
+                ('error', models.CharField(blank=True, max_length=255, null=True)),
+            ],
+            options={
+                'ordering': ['-occurred_at'],
+                'indexes': [models.Index(fields=['school_id', 'occurred_at'], name='deviceApp_s_school__d150f0_idx'), models.Index(fields=['target_type', 'target_id', 'occurred_at'], name='deviceApp_s_target__86879c_idx'), models.Index(fields=['occurred_at'], name='deviceApp_s_occurre_9f8579_idx')],
+            },
+        ),
+        migrations.RunPython(initialise_confirmed_status, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 4.2.17 on 2026-10-18 09:08
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def initialise_status_since(apps, schema_editor):
+    # Best estimate of when the current status started
+    DeviceProbeState = apps.get_model('deviceApp', 'DeviceProbeState')
+    DeviceProbeState.objects.filter(confirmed_status__isnull=False).update(status_since=F('last_status_change'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('deviceApp', '0015_status_transitions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='deviceprobestate',
+            name='status_since',
+            field=models.DateTimeField(blank=True, help_text='Start of the current confirmed status', null=True),
+        ),
+        migrations.CreateModel(
+            name='StatusInterval',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('target_type', models.CharField(choices=[('device', 'Device'), ('router', 'Router')], max_length=10)),
+                ('target_id', models.IntegerField()),
+                ('school_id', models.IntegerField(blank=True, null=True)),
+                ('status', models.CharField(max_length=20)),
+                ('started_at', models.DateTimeField()),
+                ('ended_at', models.DateTimeField()),
+            ],
+            options={
+                'ordering': ['started_at'],
+                'indexes': [models.Index(fields=['target_type', 'target_id', 'ended_at'], name='deviceApp_s_target__833fe5_idx'), models.Index(fields=['school_id', 'ended_at'], name='deviceApp_s_school__93e69b_idx'), models.Index(fields=['ended_at'], name='deviceApp_s_ended_a_08b34c_idx')],
+            },
+        ),
+        migrations.RunPython(initialise_status_since, migrations.RunPython.noop),
+    ]
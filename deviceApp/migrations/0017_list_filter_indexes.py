@@ -0,0 +1,23 @@
+# Generated by Django 4.2.17 on 2026-10-18 09:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('deviceApp', '0016_status_intervals'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='device',
+            name='type',
+            field=models.CharField(choices=[('router', 'Router'), ('access_point', 'Access Point')], db_index=True, max_length=50),
+        ),
+        migrations.AlterField(
+            model_name='deviceprobestate',
+            name='last_status',
+            field=models.CharField(blank=True, db_index=True, max_length=20, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.17 on 2026-10-18 09:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('deviceApp', '0017_list_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='sweepcycle',
+            name='status',
+            field=models.CharField(choices=[('running', 'Running'), ('completed', 'Completed'), ('partial', 'Partial'), ('failed', 'Failed')], default='running', max_length=20),
+        ),
+    ]
@@ -2,16 +2,10 @@ from django.db import models
 from django.utils.timezone import now
 from schoolApp.models import School
 from userApp.models import CustomUser
-from datetime import datetime
-import json
 
-from .utils import (
-    check_device_connectivity_with_params,
-    check_internet_connectivity,
-    is_valid_ipv4
-)
+from .state import ProbeState, ProbeTargetMixin
 
-class Device(models.Model):
+class Device(ProbeTargetMixin, models.Model):
     DEVICE_TYPES = (
         ('router', 'Router'),
         ('access_point', 'Access Point'),
@@ -21,12 +15,11 @@ class Device(models.Model):
     name = models.CharField(max_length=255)
     mac_address = models.CharField(max_length=100, unique=True)
     ip_address = models.GenericIPAddressField(null=True, blank=True)
-    type = models.CharField(max_length=50, choices=DEVICE_TYPES)
+    type = models.CharField(max_length=50, choices=DEVICE_TYPES, db_index=True)
     school = models.ForeignKey(School, on_delete=models.CASCADE, related_name='devices')
     created_by = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='devices')
     created_at = models.DateTimeField(default=now)
     last_updated = models.DateTimeField(auto_now=True)
-    last_connectivity = models.DateTimeField(null=True, blank=True)
     
     # Connectivity settings
     check_ports = models.CharField(max_length=255, blank=True, null=True, 
@@ -36,10 +29,9 @@ class Device(models.Model):
     timeout = models.IntegerField(default=5)
     retry_count = models.IntegerField(default=2)
     
-    # Status tracking fields
-    last_check_attempt = models.DateTimeField(null=True, blank=True)
-    connectivity_error = models.CharField(max_length=255, blank=True, null=True)
-    connectivity_details = models.TextField(blank=True, null=True)
+    # Probe status and schedule live in the probe_state row, connectivity
+    # checks are shared with Router (see deviceApp/state.py)
+    target_type = 'device'
     
     class Meta:
         ordering = ['-last_updated']
@@ -50,131 +42,13 @@ class Device(models.Model):
     def __str__(self):
         return f"{self.name} ({self.type}) - {self.school.name}"
     
-    @property
-    def status(self):
-        """Dynamic property that returns the current connectivity status"""
-        try:
-            latest_check = self.check_connectivity()
-            return latest_check.get('status', 'unknown')
-        except Exception as e:
-            self.connectivity_error = str(e)
-            self.save(update_fields=['connectivity_error'])
-            return 'error'
-    
-    @property
-    def connection_details(self):
-        """Returns the latest connectivity check details as a dictionary"""
-        if self.connectivity_details:
-            try:
-                return json.loads(self.connectivity_details)
-            except json.JSONDecodeError:
-                return {}
-        return {}
+    def get_school(self):
+        return self.school
     
-    def check_connectivity(self, save_result=True):
-        """
-        Check if the device is online using both port checks and ping based on the utils module.
-        Updates device status fields and returns the detailed result dictionary.
-        
-        Parameters:
-        - save_result: Whether to save the result to the database
-        
-        Returns: 
-        - Dictionary with detailed connectivity information
-        """
-        # Update check attempt timestamp
-        self.last_check_attempt = now()
-        self.connectivity_error = None
-        
-        # Basic validation
-        if not self.ip_address:
-            self.connectivity_error = "No IP address configured"
-            if save_result:
-                self.save(update_fields=['last_check_attempt', 'connectivity_error'])
-            return {'status': 'offline', 'error': self.connectivity_error}
-            
-        if not is_valid_ipv4(self.ip_address):
-            self.connectivity_error = "Invalid IP address format"
-            if save_result:
-                self.save(update_fields=['last_check_attempt', 'connectivity_error'])
-            return {'status': 'offline', 'error': self.connectivity_error}
-        
-        # Check if host machine has internet connectivity
-        if not check_internet_connectivity():
-            self.connectivity_error = "Host machine has no internet connection"
-            if save_result:
-                self.save(update_fields=['last_check_attempt', 'connectivity_error'])
-            return {'status': 'unknown', 'error': self.connectivity_error}
-        
-        # Use the enhanced connectivity check function from utils
-        result = check_device_connectivity_with_params(
-            ip_address=self.ip_address,
-            device_type=self.type,
-            ports=self.check_ports,
-            use_ping_fallback=self.use_ping_fallback,
-            ping_count=self.ping_count,
-            timeout=self.timeout,
-            retry_count=self.retry_count
-        )
-        
-        # Update device fields based on check results
-        if result['status'] == 'online':
-            self.last_connectivity = now()
-            self.connectivity_error = None
-        else:
-            self.connectivity_error = result.get('error', 'Device is unreachable')
-        
-        # Store the detailed results 
-        self.connectivity_details = json.dumps(result)
-        
-        if save_result:
-            fields_to_update = [
-                'last_check_attempt', 
-                'connectivity_error', 
-                'connectivity_details'
-            ]
-            
-            if result['status'] == 'online':
-                fields_to_update.append('last_connectivity')
-                
-            self.save(update_fields=fields_to_update)
-        
-        return result
-    
-    def get_connectivity_metrics(self):
-        """
-        Returns consolidated connectivity metrics based on the latest check
-        """
-        details = self.connection_details
-        
-        metrics = {
-            'status': self.status,
-            'last_check': self.last_check_attempt,
-            'last_online': self.last_connectivity,
-            'error': self.connectivity_error
-        }
-        
-        # Extract ping metrics if available
-        if details and 'ping_check' in details:
-            ping_data = details['ping_check']
-            if ping_data:
-                metrics.update({
-                    'latency_ms': ping_data.get('latency_ms'),
-                    'packet_loss': ping_data.get('packet_loss')
-                })
-        
-        # Extract port check metrics if available
-        if details and 'port_check' in details:
-            port_data = details['port_check']
-            if port_data:
-                metrics.update({
-                    'ports_checked': port_data.get('ports_checked'),
-                    'ports_open': port_data.get('ports_open'),
-                    'open_ports': port_data.get('open_ports')
-                })
-        
-        return metrics
+    def get_school_id(self):
+        return self.school_id
     
+    @classmethod
     def bulk_check_devices(cls, school_id=None, device_type=None):
         """
         Class method to check connectivity for multiple devices with filtering options
@@ -192,51 +66,213 @@ class Device(models.Model):
         if device_type:
             filters['type'] = device_type
             
-        devices = cls.objects.filter(**filters)
-        
-        results = {
-            'timestamp': datetime.now().isoformat(),
-            'total_devices': devices.count(),
-            'online_count': 0,
-            'offline_count': 0,
-            'error_count': 0,
-            'details': {}
-        }
-        
-        for device in devices:
-            device_result = device.check_connectivity()
-            
-            # Update counts
-            if device_result['status'] == 'online':
-                results['online_count'] += 1
-            elif device_result['status'] == 'offline':
-                results['offline_count'] += 1
-            else:
-                results['error_count'] += 1
-                
-            # Store detailed result
-            results['details'][device.id] = {
-                'name': device.name,
-                'ip': device.ip_address,
-                'type': device.type,
-                'status': device_result['status'],
-                'error': device_result.get('error'),
-                'school': device.school.name
-            }
-            
-            # Add latency if available
-            ping_data = device_result.get('ping_check', {})
-            if ping_data and ping_data.get('latency_ms') is not None:
-                results['details'][device.id]['latency_ms'] = ping_data['latency_ms']
-        
-        # Calculate summary statistics for online devices
-        online_devices = [details for _, details in results['details'].items() 
-                         if details['status'] == 'online' and 'latency_ms' in details]
-        
-        if online_devices:
-            latencies = [device['latency_ms'] for device in online_devices]
-            results['avg_latency_ms'] = sum(latencies) / len(latencies)
-            results['min_latency_ms'] = min(latencies)
-            results['max_latency_ms'] = max(latencies)
-        
-        return results
\ No newline at end of file
+        devices = cls.objects.filter(**filters).select_related('school', 'probe_state')
+        return cls.summarize_checks(devices, lambda device: {'school': device.school.name})
+
+class DeviceProbeState(ProbeState):
+    """Current probe state of a device (see deviceApp/state.py)"""
+    target = models.OneToOneField(Device, on_delete=models.CASCADE, primary_key=True,
+                                  related_name='probe_state')
+
+    def __str__(self):
+        return f"Probe state of device {self.target_id}: {self.last_status}"
+
+
+class SweepCycle(models.Model):
+    """
+    One run of a connectivity sweep and how far it got (see deviceApp/cycles.py)
+    """
+    KINDS = (
+        ('devices', 'Devices'),
+        ('routers', 'Routers'),
+    )
+    STATUSES = (
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('partial', 'Partial'),
+        ('failed', 'Failed'),
+    )
+
+    kind = models.CharField(max_length=20, choices=KINDS)
+    status = models.CharField(max_length=20, choices=STATUSES, default='running')
+    started_at = models.DateTimeField(default=now)
+    deadline = models.DateTimeField()
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    # Progress
+    due_count = models.IntegerField(default=0)
+    checked_count = models.IntegerField(default=0)
+    carried_over = models.IntegerField(default=0,
+                                       help_text="Due targets left for the next cycle when the budget ran out")
+    chunk_count = models.IntegerField(default=0)
+    chunks_done = models.IntegerField(default=0)
+    summary = models.JSONField(default=dict, blank=True)
+
+    class Meta:
+        ordering = ['-started_at']
+        indexes = [
+            models.Index(fields=['kind', '-started_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} sweep at {self.started_at:%Y-%m-%d %H:%M:%S} ({self.status})"
+
+
+class ProbeResult(models.Model):
+    """
+    Append-only history of probe results for devices and routers.
+
+    On PostgreSQL the table is partitioned by month on checked_at
+    (see deviceApp/history.py); elsewhere it is a plain table.
+    """
+    TARGET_TYPES = (
+        ('device', 'Device'),
+        ('router', 'Router'),
+    )
+
+    id = models.BigAutoField(primary_key=True)
+    target_type = models.CharField(max_length=10, choices=TARGET_TYPES)
+    target_id = models.IntegerField()
+    school_id = models.IntegerField(null=True, blank=True)
+    checked_at = models.DateTimeField(default=now)
+    status = models.CharField(max_length=20)
+    cause = models.CharField(max_length=50, blank=True, null=True)
+    latency_ms = models.FloatField(null=True, blank=True)
+    packet_loss = models.FloatField(null=True, blank=True)
+    open_ports = models.JSONField(default=list, blank=True)
+    error = models.CharField(max_length=255, blank=True, null=True)
+
+    class Meta:
+        ordering = ['-checked_at']
+        indexes = [
+            models.Index(fields=['target_type', 'target_id', 'checked_at']),
+            models.Index(fields=['school_id', 'checked_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.target_type} {self.target_id} {self.status} at {self.checked_at:%Y-%m-%d %H:%M:%S}"
+
+
+class StatusTransitionEvent(models.Model):
+    """
+    A confirmed status change of a device or router, or the start or end of
+    a flapping period (see deviceApp/transitions.py)
+    """
+    TARGET_TYPES = ProbeResult.TARGET_TYPES
+    KINDS = (
+        ('transition', 'Transition'),
+        ('flap_start', 'Flapping started'),
+        ('flap_end', 'Flapping ended'),
+    )
+
+    target_type = models.CharField(max_length=10, choices=TARGET_TYPES)
+    target_id = models.IntegerField()
+    school_id = models.IntegerField(null=True, blank=True)
+    kind = models.CharField(max_length=20, choices=KINDS, default='transition')
+    previous_status = models.CharField(max_length=20, blank=True, null=True)
+    status = models.CharField(max_length=20)
+    occurred_at = models.DateTimeField(default=now,
+                                       help_text="When the new status was first seen")
+    confirmed_at = models.DateTimeField(default=now)
+    confirmations = models.IntegerField(default=1,
+                                        help_text="Consecutive probes that agreed on the new status")
+    error = models.CharField(max_length=255, blank=True, null=True)
+
+    class Meta:
+        ordering = ['-occurred_at']
+        indexes = [
+            models.Index(fields=['school_id', 'occurred_at']),
+            models.Index(fields=['target_type', 'target_id', 'occurred_at']),
+            models.Index(fields=['occurred_at']),
+        ]
+
+    def __str__(self):
+        return (f"{self.target_type} {self.target_id} {self.previous_status} -> {self.status} "
+                f"at {self.occurred_at:%Y-%m-%d %H:%M:%S}")
+
+
+class StatusInterval(models.Model):
+    """
+    A closed period during which a device or router held one confirmed
+    status (see deviceApp/transitions.py and deviceApp/sla.py)
+    """
+    target_type = models.CharField(max_length=10, choices=ProbeResult.TARGET_TYPES)
+    target_id = models.IntegerField()
+    school_id = models.IntegerField(null=True, blank=True)
+    status = models.CharField(max_length=20)
+    started_at = models.DateTimeField()
+    ended_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ['started_at']
+        indexes = [
+            models.Index(fields=['target_type', 'target_id', 'ended_at']),
+            models.Index(fields=['school_id', 'ended_at']),
+            models.Index(fields=['ended_at']),
+        ]
+
+    def __str__(self):
+        return (f"{self.target_type} {self.target_id} {self.status} "
+                f"from {self.started_at:%Y-%m-%d %H:%M:%S} to {self.ended_at:%Y-%m-%d %H:%M:%S}")
+
+
+class ConnectivityRollup(models.Model):
+    """
+    Pre-aggregated probe results for one time bucket of one device, router,
+    school or province (see deviceApp/rollups.py)
+    """
+    GRANULARITIES = (
+        ('minute', 'Minute'),
+        ('hour', 'Hour'),
+        ('day', 'Day'),
+    )
+    SCOPES = (
+        ('device', 'Device'),
+        ('router', 'Router'),
+        ('school', 'School'),
+        ('province', 'Province'),
+    )
+
+    granularity = models.CharField(max_length=10, choices=GRANULARITIES)
+    scope = models.CharField(max_length=10, choices=SCOPES)
+    scope_key = models.CharField(max_length=100,
+                                 help_text="Device, router or school ID, or the province name")
+    bucket_start = models.DateTimeField()
+
+    probe_count = models.IntegerField(default=0)
+    online_count = models.IntegerField(default=0)
+    latency_count = models.IntegerField(default=0)
+    latency_sum = models.FloatField(default=0)
+    latency_min = models.FloatField(null=True, blank=True)
+    latency_max = models.FloatField(null=True, blank=True)
+    latency_histogram = models.JSONField(default=list, blank=True,
+                                         help_text="Latency counts per rollups.LATENCY_BUCKETS_MS bucket")
+
+    class Meta:
+        ordering = ['bucket_start']
+        unique_together = [
+            ('granularity', 'scope', 'scope_key', 'bucket_start'),
+        ]
+        indexes = [
+            models.Index(fields=['granularity', 'bucket_start']),
+        ]
+
+    def __str__(self):
+        return f"{self.scope} {self.scope_key} {self.granularity} at {self.bucket_start:%Y-%m-%d %H:%M}"
+
+    @property
+    def uptime_ratio(self):
+        if not self.probe_count:
+            return None
+        return self.online_count / self.probe_count
+
+    @property
+    def avg_latency_ms(self):
+        if not self.latency_count:
+            return None
+        return self.latency_sum / self.latency_count
+
+    @property
+    def p95_latency_ms(self):
+        from .rollups import histogram_percentile
+        return histogram_percentile(self.latency_histogram, 95, self.latency_max)
@@ -0,0 +1,71 @@
+# deviceApp/probememo.py
+"""
+Single-flight probe results per request or sweep.
+
+Inside a probe_memo() block each device or router is probed at most once:
+the first check_connectivity() or check_connectivity_many() of a target
+remembers its result, and later checks of the same target (through any
+instance, e.g. the `status` property, a serializer or a second query)
+get that result back without probing again. Instances served from the
+memo also share the probed instance's probe state, so they read the same
+fields.
+
+ProbeMemoMiddleware opens a block for every HTTP request and the sweeps
+open one per chunk. Nested blocks join the outermost one. Outside a block
+every check probes.
+"""
+import contextvars
+from contextlib import contextmanager
+
+# (model label, pk) -> (result, probed instance), or None outside a memo block
+_probe_memo = contextvars.ContextVar('probe_memo', default=None)
+
+
+def _memo_key(target):
+    return (target._meta.label_lower, target.pk)
+
+
+def memoized_result(target):
+    """The result remembered for this target in the current block, or None"""
+    memo = _probe_memo.get()
+    entry = memo.get(_memo_key(target)) if memo is not None else None
+    if entry is None:
+        return None
+
+    result, probed = entry
+    if probed is not target:
+        target.probe_state = probed.get_probe_state()
+    return result
+
+
+def remember_result(target, result):
+    """Remember a target's result in the current block; returns the result"""
+    memo = _probe_memo.get()
+    if memo is not None:
+        memo[_memo_key(target)] = (result, target)
+    return result
+
+
+@contextmanager
+def probe_memo():
+    """Probe each target at most once inside the block"""
+    if _probe_memo.get() is not None:
+        yield
+        return
+
+    token = _probe_memo.set({})
+    try:
+        yield
+    finally:
+        _probe_memo.reset(token)
+
+
+class ProbeMemoMiddleware:
+    """Probe each device or router at most once per request"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with probe_memo():
+            return self.get_response(request)
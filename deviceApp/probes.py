@@ -0,0 +1,383 @@
+# deviceApp/probes.py
+"""
+Asyncio probe engine.
+
+The synchronous helpers in utils.py wrap the coroutines defined here, and the
+sweep tasks use run_probes() to check the whole fleet concurrently instead of
+one device at a time.
+"""
+import asyncio
+import contextvars
+import platform
+import threading
+from datetime import datetime
+
+from django.conf import settings
+
+from .icmp import open_pinger
+from .ratelimit import async_acquire_all
+from .utils import is_valid_ipv4, parse_ping_output, build_ping_command
+
+DEFAULT_PROBE_CONCURRENCY = 500
+
+# Seconds between the echo requests of one native ping
+PING_INTERVAL = 0.2
+# Extra seconds a `ping` subprocess gets beyond its timeout before it is killed
+PING_SUBPROCESS_GRACE = 5
+# Seconds between ping attempts
+PING_RETRY_PAUSE = 1
+
+IS_WINDOWS = platform.system().lower() == 'windows'
+
+# Per-run holder for the shared ICMP socket, see _get_pinger()
+_pinger_holder = contextvars.ContextVar('pinger_holder', default=None)
+
+
+def get_probe_concurrency():
+    """Return the configured maximum number of probes running at once."""
+    return getattr(settings, 'CONNECTIVITY_PROBE_CONCURRENCY', DEFAULT_PROBE_CONCURRENCY)
+
+
+def use_native_ping():
+    """Whether pings should use in-process ICMP sockets instead of the ping command."""
+    return getattr(settings, 'CONNECTIVITY_NATIVE_PING', True)
+
+
+async def _run_with_pinger(coro):
+    """
+    Await coro with a lazily opened ICMP socket shared by every ping it makes,
+    closing the socket afterwards.
+    """
+    holder = {'pinger': None, 'opened': False}
+    token = _pinger_holder.set(holder)
+    try:
+        return await coro
+    finally:
+        _pinger_holder.reset(token)
+        if holder['pinger'] is not None:
+            holder['pinger'].close()
+
+
+def _get_pinger():
+    """
+    Return the shared AsyncPinger for the current run, or None when native
+    ping is disabled, not permitted on this host or its socket failed.
+    """
+    holder = _pinger_holder.get()
+    if holder is None or not use_native_ping():
+        return None
+    if not holder['opened']:
+        holder['opened'] = True
+        holder['pinger'] = open_pinger()
+    if holder['pinger'] is not None and holder['pinger'].closed:
+        return None
+    return holder['pinger']
+
+
+def probe_time_bound(ports=None, use_ping_fallback=True, ping_count=3, timeout=5, retry_count=2):
+    """
+    Longest a probe with these settings can take once it has its rate-limit
+    tokens and a concurrency slot: one shared timeout for the port scan,
+    then every ping attempt running to its limit with a pause between attempts.
+    The defaults are the Device and Router defaults.
+    """
+    seconds = timeout if ports else 0
+    if use_ping_fallback:
+        # A native ping waits for the last echo; a `ping` subprocess is killed after its grace
+        attempt = timeout + max((ping_count - 1) * PING_INTERVAL, PING_SUBPROCESS_GRACE)
+        seconds += (retry_count + 1) * attempt + retry_count * PING_RETRY_PAUSE
+    return seconds
+
+
+def run_sync(coro):
+    """
+    Run a coroutine to completion from synchronous code.
+
+    Uses asyncio.run() when no event loop is running in this thread, otherwise
+    runs the coroutine on a short-lived helper thread so callers inside an
+    event loop (e.g. async views) do not deadlock.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(_run_with_pinger(coro))
+
+    outcome = {}
+
+    def runner():
+        try:
+            outcome['result'] = asyncio.run(_run_with_pinger(coro))
+        except BaseException as e:
+            outcome['error'] = e
+
+    thread = threading.Thread(target=runner)
+    thread.start()
+    thread.join()
+    if 'error' in outcome:
+        raise outcome['error']
+    return outcome['result']
+
+
+def parse_ports(ports):
+    """
+    Convert a comma-separated string or iterable of ports to a list of ints.
+    Raises ValueError on malformed input.
+    """
+    if isinstance(ports, str):
+        return [int(p.strip()) for p in ports.split(',') if p.strip()]
+    return [int(p) for p in ports]
+
+
+async def _connect_port(ip_address, port):
+    """Open and immediately close a TCP connection. Returns the port on success."""
+    _, writer = await asyncio.open_connection(ip_address, port)
+    writer.close()
+    return port
+
+
+async def async_check_port_connectivity(ip_address, ports, timeout=3):
+    """
+    Coroutine version of utils.check_port_connectivity.
+
+    Connects to every port at once and stops as soon as one of them answers,
+    so the whole check is bounded by a single timeout. Ports that were still
+    connecting when another port answered are listed in 'skipped_ports'.
+
+    Returns a dictionary with port status results.
+    """
+    if not ports:
+        return {'ports_checked': 0, 'ports_open': 0, 'status': 'skipped'}
+
+    try:
+        ports = parse_ports(ports)
+    except ValueError:
+        return {'error': 'Invalid port format', 'status': 'error'}
+
+    results = {
+        'ports_checked': len(ports),
+        'ports_open': 0,
+        'open_ports': [],
+        'closed_ports': [],
+        'skipped_ports': [],
+        'status': 'offline'
+    }
+
+    attempts = {asyncio.ensure_future(_connect_port(ip_address, port)): port for port in ports}
+    pending = set(attempts)
+    deadline = asyncio.get_running_loop().time() + timeout
+
+    try:
+        while pending and not results['ports_open']:
+            remaining = deadline - asyncio.get_running_loop().time()
+            if remaining <= 0:
+                break
+            done, pending = await asyncio.wait(pending, timeout=remaining,
+                                               return_when=asyncio.FIRST_COMPLETED)
+            for attempt in done:
+                port = attempts[attempt]
+                error = attempt.exception()
+                if error is None:
+                    results['ports_open'] += 1
+                    results['open_ports'].append(port)
+                else:
+                    if not isinstance(error, OSError):
+                        results['error'] = f"Error checking port {port}: {str(error)}"
+                    results['closed_ports'].append(port)
+    finally:
+        for attempt in pending:
+            attempt.cancel()
+
+    # Ports still connecting either timed out or lost the race to an open port
+    for attempt in pending:
+        if results['ports_open']:
+            results['skipped_ports'].append(attempts[attempt])
+        else:
+            results['closed_ports'].append(attempts[attempt])
+
+    for key in ('open_ports', 'closed_ports', 'skipped_ports'):
+        results[key].sort()
+
+    # Consider device online if at least one port is open
+    if results['ports_open'] > 0:
+        results['status'] = 'online'
+
+    return results
+
+
+async def async_measure_ping_latency(ip_address, count=1, timeout=5, retry_count=2):
+    """
+    Coroutine version of utils.measure_ping_latency.
+
+    Pings from the shared in-process ICMP socket when available, otherwise
+    runs the platform `ping` command.
+
+    Returns a dictionary with latency in milliseconds.
+    """
+    result = {
+        'latency_ms': None,
+        'error': None,
+        'packet_loss': None
+    }
+
+    if not is_valid_ipv4(ip_address):
+        result['error'] = "Invalid IP address format"
+        return result
+
+    pinger = _get_pinger()
+    if pinger is None:
+        return await _ping_subprocess(ip_address, count, timeout, retry_count, result)
+
+    for attempt in range(retry_count + 1):
+        ping_result = await pinger.ping(ip_address, count=count, timeout=timeout, interval=PING_INTERVAL)
+        result.update(ping_result)
+        if result['latency_ms'] is not None:
+            break
+
+        # If we reach here and it's not the last attempt, try again
+        if attempt < retry_count:
+            await asyncio.sleep(PING_RETRY_PAUSE)  # Wait a bit before retrying
+
+    return result
+
+
+async def _ping_subprocess(ip_address, count, timeout, retry_count, result):
+    """Fallback for async_measure_ping_latency using the platform `ping` command"""
+    command = build_ping_command(ip_address, count, timeout, IS_WINDOWS)
+
+    for attempt in range(retry_count + 1):
+        process = None
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *command,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE
+            )
+            stdout, _ = await asyncio.wait_for(process.communicate(), timeout=timeout + PING_SUBPROCESS_GRACE)
+            if parse_ping_output(stdout.decode(errors='ignore'), result, IS_WINDOWS):
+                break
+        except asyncio.TimeoutError:
+            if process and process.returncode is None:
+                process.kill()
+            result['error'] = "Ping error: timed out"
+        except Exception as e:
+            result['error'] = f"Error: {str(e)}"
+
+        # If we reach here and it's not the last attempt, try again
+        if attempt < retry_count:
+            await asyncio.sleep(PING_RETRY_PAUSE)  # Wait a bit before retrying
+
+    return result
+
+
+async def async_check_device_connectivity_with_params(ip_address, device_type=None, ports=None,
+                                                      use_ping_fallback=True, ping_count=3,
+                                                      timeout=5, retry_count=2, rate_limits=None):
+    """
+    Coroutine version of utils.check_device_connectivity_with_params.
+
+    rate_limits is an optional list of (key, probes per second) pairs; the
+    probe waits for a token from each bucket (see ratelimit.py) before starting.
+
+    Returns a dictionary with connectivity status and detailed results.
+    """
+    await async_acquire_all(rate_limits)
+
+    result = {
+        'ip': ip_address,
+        'status': 'offline',
+        'timestamp': datetime.now().isoformat(),
+        'device_type': device_type,
+        'error': None,
+        'port_check': None,
+        'ping_check': None
+    }
+
+    # First try port check if ports are specified
+    if ports:
+        port_result = await async_check_port_connectivity(ip_address, ports, timeout)
+        result['port_check'] = port_result
+
+        # If port check shows device is online, we're done
+        if port_result['status'] == 'online':
+            result['status'] = 'online'
+            return result
+
+    # If port check failed or wasn't performed, and ping fallback is enabled
+    if use_ping_fallback:
+        ping_result = await async_measure_ping_latency(
+            ip_address,
+            count=ping_count,
+            timeout=timeout,
+            retry_count=retry_count
+        )
+
+        result['ping_check'] = {
+            'latency_ms': ping_result['latency_ms'],
+            'packet_loss': ping_result['packet_loss'],
+            'error': ping_result['error']
+        }
+
+        if ping_result['latency_ms'] is not None:
+            result['status'] = 'online'
+
+    # If we got this far and status is still offline, record an error
+    if result['status'] == 'offline':
+        if result.get('port_check') and result.get('port_check', {}).get('error'):
+            result['error'] = result['port_check']['error']
+        elif result.get('ping_check') and result.get('ping_check', {}).get('error'):
+            result['error'] = result['ping_check']['error']
+        else:
+            result['error'] = "Device is unreachable"
+
+    return result
+
+
+async def async_run_probes(targets, concurrency=None):
+    """
+    Probe many targets concurrently.
+
+    Parameters:
+    - targets: List of keyword-argument dictionaries for
+      async_check_device_connectivity_with_params. An optional 'start_delay'
+      key (seconds) postpones that probe, used to spread probes over a tick.
+    - concurrency: Maximum number of probes in flight (defaults to settings)
+
+    Each probe waits for its rate-limit tokens before taking a concurrency
+    slot, so a throttled school never holds slots other schools could use.
+
+    Returns a list of result dictionaries in the same order as targets.
+    """
+    semaphore = asyncio.Semaphore(concurrency or get_probe_concurrency())
+
+    async def probe(params):
+        params = dict(params)
+        delay = params.pop('start_delay', 0)
+        rate_limits = params.pop('rate_limits', None)
+        if delay:
+            await asyncio.sleep(delay)
+        try:
+            await async_acquire_all(rate_limits)
+            async with semaphore:
+                return await async_check_device_connectivity_with_params(**params)
+        except Exception as e:
+            return {
+                'ip': params.get('ip_address'),
+                'status': 'offline',
+                'timestamp': datetime.now().isoformat(),
+                'device_type': params.get('device_type'),
+                'error': f"Error: {str(e)}",
+                'port_check': None,
+                'ping_check': None
+            }
+
+    return await asyncio.gather(*(probe(params) for params in targets))
+
+
+def run_probes(targets, concurrency=None):
+    """
+    Synchronous entry point for async_run_probes, used by the sweep tasks.
+    All pings in the batch share one ICMP socket.
+    """
+    if not targets:
+        return []
+    return run_sync(async_run_probes(targets, concurrency))
@@ -0,0 +1,114 @@
+# deviceApp/ratelimit.py
+"""
+Per-site probe rate limiting.
+
+Schools often sit behind thin uplinks, so the probe engine limits how many
+probes per second it starts against any one school and any one /24 subnet,
+while overall probe concurrency stays high. Buckets live in the Django cache
+so every worker sharing the cache backend draws from the same budget.
+
+Each bucket holds a whole number of tokens, at least one, and is refilled
+at the start of every window; the window is stretched to fit, so a rate of
+0.5/s is one token every two seconds and 1.5/s one token every 2/3 second.
+Taking a token is one atomic cache increment.
+"""
+import asyncio
+import math
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+
+def get_school_rate_limit(school=None):
+    """Probes per second allowed against a school; the school's own limit wins"""
+    if school is not None and school.probe_rate_limit:
+        return school.probe_rate_limit
+    return getattr(settings, 'CONNECTIVITY_SCHOOL_RATE_LIMIT', 20)
+
+
+def get_subnet_rate_limit():
+    """Probes per second allowed against a single /24 subnet"""
+    return getattr(settings, 'CONNECTIVITY_SUBNET_RATE_LIMIT', 10)
+
+
+def subnet_key(ip_address):
+    """Rate-limit key for the /24 network an IPv4 address belongs to"""
+    return 'subnet:' + '.'.join(ip_address.split('.')[:3])
+
+
+class TokenBucket:
+    """
+    A cache-backed bucket allowing `rate` acquisitions per second for one key.
+    """
+
+    def __init__(self, key, rate):
+        self.key = key
+        self.rate = float(rate)
+        # Whole tokens per window, with the window sized to give exactly `rate`
+        self.capacity = max(1, int(self.rate))
+        self.window = self.capacity / self.rate
+
+    def _window_key(self, current_time):
+        window_index = int(current_time // self.window)
+        return f"connectivity:ratelimit:{self.key}:{window_index}"
+
+    def _seconds_to_next_window(self, current_time):
+        return (math.floor(current_time / self.window) + 1) * self.window - current_time
+
+    def try_acquire(self):
+        """
+        Take a token if one is left in the current window.
+
+        Returns 0 on success, otherwise the seconds until the bucket refills.
+        """
+        current_time = time.time()
+        key = self._window_key(current_time)
+        cache.add(key, 0, timeout=int(self.window) + 5)
+        try:
+            taken = cache.incr(key)
+        except ValueError:
+            # The window expired between add() and incr(); start a fresh one
+            cache.add(key, 1, timeout=int(self.window) + 5)
+            return 0
+        if taken <= self.capacity:
+            return 0
+        return self._seconds_to_next_window(current_time)
+
+    async def async_try_acquire(self):
+        """
+        Coroutine version of try_acquire(). Runs the synchronous cache calls in
+        a worker thread because the cache's async incr is not atomic; the
+        calls are independent, so they need not share Django's one
+        thread-sensitive thread.
+        """
+        return await sync_to_async(self.try_acquire, thread_sensitive=False)()
+
+    def acquire(self):
+        """Block until a token is available"""
+        while True:
+            wait = self.try_acquire()
+            if not wait:
+                return
+            time.sleep(wait)
+
+    async def async_acquire(self):
+        """Wait without blocking the event loop until a token is available"""
+        while True:
+            wait = await self.async_try_acquire()
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+
+async def async_acquire_all(rate_limits):
+    """
+    Wait for a token from every bucket.
+
+    Parameters:
+    - rate_limits: Iterable of (key, probes per second) pairs; a falsy rate means unlimited
+    """
+    for key, rate in rate_limits or []:
+        if rate:
+            await TokenBucket(key, rate).async_acquire()
@@ -0,0 +1,271 @@
+# deviceApp/retention.py
+"""
+Tiered retention for probe data.
+
+Each tier keeps its rows for a configurable number of days (0 keeps them
+forever):
+
+- raw: ProbeResult history (CONNECTIVITY_RAW_RETENTION_DAYS)
+- minute, hour, day: ConnectivityRollup buckets of that granularity
+  (CONNECTIVITY_<GRANULARITY>_ROLLUP_RETENTION_DAYS)
+- events: StatusTransitionEvent and StatusInterval rows
+  (CONNECTIVITY_EVENT_RETENTION_DAYS)
+
+Each coarser tier keeps its rows at least as long as the finer ones, so a
+shorter setting for, say, minute rollups than for raw results is raised to
+the raw retention.
+
+Expired raw results, events and intervals are archived to gzipped JSON
+Lines files under CONNECTIVITY_ARCHIVE_DIR before they are removed; the
+rollups are derived data and are simply deleted. Rows are removed in
+chunks of CONNECTIVITY_RETENTION_BATCH_SIZE, each in its own short
+transaction with a pause in between, so the hot tables are never locked
+for long. On PostgreSQL whole months of raw history past the cutoff are
+archived and then dropped as a partition instead (see history.py).
+
+A run stops between chunks once it has used its time budget or business
+hours (CONNECTIVITY_BUSINESS_HOURS_START/END on working days, local time)
+begin, and picks up where it left off next time. Archive files written by
+chunked deletes are appended to, so a run interrupted between writing a
+chunk and deleting it archives that chunk twice. A whole-month partition
+archive is streamed in chunks too, into a .partial file that a later run
+resumes from the last archived ID; it gets its final name once the month
+is complete, and only then is the partition dropped.
+"""
+import gzip
+import json
+import logging
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils.timezone import localtime, now
+
+from .history import add_months, drop_partitions_before, is_partitioned, list_partitions, partition_month
+from .models import ConnectivityRollup, ProbeResult, StatusInterval, StatusTransitionEvent
+
+logger = logging.getLogger(__name__)
+
+# Tier -> (setting, default days)
+RETENTION_SETTINGS = {
+    'raw': ('CONNECTIVITY_RAW_RETENTION_DAYS', 30),
+    'minute': ('CONNECTIVITY_MINUTE_ROLLUP_RETENTION_DAYS', 30),
+    'hour': ('CONNECTIVITY_HOUR_ROLLUP_RETENTION_DAYS', 365),
+    'day': ('CONNECTIVITY_DAY_ROLLUP_RETENTION_DAYS', 0),
+    'events': ('CONNECTIVITY_EVENT_RETENTION_DAYS', 730),
+}
+
+# Tiers from finest to coarsest
+TIER_ORDER = ['raw', 'minute', 'hour', 'day']
+
+
+def _configured_days(tier):
+    setting, default = RETENTION_SETTINGS[tier]
+    return getattr(settings, setting, default)
+
+
+def get_retention_days(tier):
+    """Days the tier keeps its rows (0 forever), never less than a finer tier"""
+    days = _configured_days(tier)
+    if tier in TIER_ORDER:
+        for finer in TIER_ORDER[:TIER_ORDER.index(tier)]:
+            finer_days = _configured_days(finer)
+            days = 0 if not days or not finer_days else max(days, finer_days)
+    return days
+
+
+def get_retention_cutoff(tier, current_time=None):
+    """Time before which the tier's rows are removed, or None if it keeps them forever"""
+    days = get_retention_days(tier)
+    if not days:
+        return None
+    return (current_time or now()) - timedelta(days=days)
+
+
+def get_archive_dir():
+    return getattr(settings, 'CONNECTIVITY_ARCHIVE_DIR', os.path.join(settings.BASE_DIR, 'archive'))
+
+
+def in_business_hours(at=None):
+    """Whether the given time (default now) falls in business hours on a working day"""
+    at = localtime(at or now())
+    start = getattr(settings, 'CONNECTIVITY_BUSINESS_HOURS_START', 7)
+    end = getattr(settings, 'CONNECTIVITY_BUSINESS_HOURS_END', 18)
+    working_days = getattr(settings, 'CONNECTIVITY_BUSINESS_DAYS', [0, 1, 2, 3, 4])
+    return at.weekday() in working_days and start <= at.hour < end
+
+
+class RetentionRun:
+    """Limits shared by every step of one retention run"""
+
+    def __init__(self, dry_run=False, force=False, batch_size=None, max_seconds=None):
+        self.dry_run = dry_run
+        self.force = force
+        self.batch_size = batch_size or getattr(settings, 'CONNECTIVITY_RETENTION_BATCH_SIZE', 5000)
+        self.pause = getattr(settings, 'CONNECTIVITY_RETENTION_BATCH_PAUSE', 0.5)
+        max_seconds = max_seconds or getattr(settings, 'CONNECTIVITY_RETENTION_MAX_SECONDS', 1800)
+        self.deadline = time.monotonic() + max_seconds
+        self.stopped = False
+
+    def should_stop(self):
+        """True once the time budget is used up or business hours begin (unless forced)"""
+        if not self.stopped:
+            self.stopped = time.monotonic() >= self.deadline or (not self.force and in_business_hours())
+        return self.stopped
+
+
+def write_archive(path, rows, mode='ab'):
+    """Write rows as gzipped JSON Lines, appending a gzip member by default"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with gzip.open(path, mode) as archive:
+        for row in rows:
+            archive.write(json.dumps(row, cls=DjangoJSONEncoder).encode() + b'\n')
+
+
+def archive_by_day(model, time_field, rows):
+    """Append rows to one archive file per table and UTC day"""
+    by_day = {}
+    for row in rows:
+        by_day.setdefault(row[time_field].date(), []).append(row)
+    for day, day_rows in by_day.items():
+        write_archive(os.path.join(get_archive_dir(), model._meta.db_table, f"{day:%Y-%m-%d}.jsonl.gz"), day_rows)
+
+
+def prune_rows(queryset, time_field, cutoff, run, archive=False):
+    """
+    Delete the rows of a queryset older than cutoff in bounded chunks,
+    archiving each chunk first if requested.
+
+    Returns the number of rows deleted (or that would be deleted).
+    """
+    model = queryset.model
+    expired = queryset.filter(**{f'{time_field}__lt': cutoff}).order_by(time_field)
+    if run.dry_run:
+        return expired.count()
+
+    pk_field = model._meta.pk.attname
+    fields = [field.attname for field in model._meta.concrete_fields] if archive else [pk_field]
+    deleted = 0
+    while not run.should_stop():
+        rows = list(expired.values(*fields)[:run.batch_size])
+        if not rows:
+            break
+        if archive:
+            archive_by_day(model, time_field, rows)
+        with transaction.atomic():
+            model.objects.filter(pk__in=[row[pk_field] for row in rows]).delete()
+        deleted += len(rows)
+        if len(rows) == run.batch_size:
+            time.sleep(run.pause)
+    return deleted
+
+
+def archive_partition(month, run):
+    """
+    Archive one month of raw history in chunks, resuming a partial archive
+    left by an earlier run.
+
+    Returns True once the month's archive is complete, False if the run
+    stopped first.
+    """
+    path = os.path.join(get_archive_dir(), ProbeResult._meta.db_table, f"{month:%Y-%m}.jsonl.gz")
+    partial_path, position_path = f"{path}.partial", f"{path}.position"
+    last_id = 0
+    if os.path.exists(partial_path) and os.path.exists(position_path):
+        with open(position_path) as position:
+            last_id = int(position.read())
+    elif os.path.exists(partial_path):
+        os.remove(partial_path)
+
+    month_start = datetime.combine(month, datetime.min.time(), tzinfo=timezone.utc)
+    month_end = datetime.combine(add_months(month, 1), datetime.min.time(), tzinfo=timezone.utc)
+    fields = [field.attname for field in ProbeResult._meta.concrete_fields]
+    rows = ProbeResult.objects.filter(checked_at__gte=month_start, checked_at__lt=month_end).order_by('id')
+    while True:
+        if run.should_stop():
+            return False
+        chunk = list(rows.filter(id__gt=last_id).values(*fields)[:run.batch_size])
+        if not chunk:
+            break
+        write_archive(partial_path, chunk)
+        last_id = chunk[-1]['id']
+        with open(position_path, 'w') as position:
+            position.write(str(last_id))
+
+    if os.path.exists(partial_path):
+        os.replace(partial_path, path)
+    if os.path.exists(position_path):
+        os.remove(position_path)
+    return True
+
+
+def archive_and_drop_partitions(cutoff, run):
+    """
+    Archive and drop the monthly raw history partitions lying wholly before
+    cutoff (PostgreSQL only).
+
+    Returns the number of partitions dropped (or that would be dropped).
+    """
+    if not is_partitioned():
+        return 0
+    cutoff_month = cutoff.date().replace(day=1)
+    partitions = [name for name in list_partitions() if partition_month(name) < cutoff_month]
+    if run.dry_run:
+        return len(partitions)
+
+    dropped = 0
+    for name in partitions:
+        month = partition_month(name)
+        if not archive_partition(month, run):
+            break
+        drop_partitions_before(add_months(month, 1))
+        dropped += 1
+    return dropped
+
+
+def apply_retention(dry_run=False, force=False, batch_size=None, max_seconds=None):
+    """
+    Apply every retention tier once.
+
+    Parameters:
+    - dry_run: Only count what would be removed
+    - force: Run during business hours too
+    - batch_size: Rows per chunk (default CONNECTIVITY_RETENTION_BATCH_SIZE)
+    - max_seconds: Time budget (default CONNECTIVITY_RETENTION_MAX_SECONDS)
+
+    Returns a summary dictionary of rows removed per tier.
+    """
+    run = RetentionRun(dry_run, force, batch_size, max_seconds)
+    summary = {'dry_run': dry_run, 'status': 'completed'}
+    if not dry_run and run.should_stop():
+        summary['status'] = 'skipped'
+        return summary
+
+    current_time = now()
+
+    cutoff = get_retention_cutoff('raw', current_time)
+    if cutoff:
+        summary['raw_partitions'] = archive_and_drop_partitions(cutoff, run)
+        summary['raw'] = prune_rows(ProbeResult.objects.all(), 'checked_at', cutoff, run, archive=True)
+
+    for granularity, _ in ConnectivityRollup.GRANULARITIES:
+        days = get_retention_days(granularity)
+        if days:
+            summary[f'{granularity}_rollups'] = prune_rows(
+                ConnectivityRollup.objects.filter(granularity=granularity), 'bucket_start',
+                current_time - timedelta(days=days), run
+            )
+
+    event_days = get_retention_days('events')
+    if event_days:
+        cutoff = current_time - timedelta(days=event_days)
+        summary['events'] = prune_rows(StatusTransitionEvent.objects.all(), 'occurred_at', cutoff, run, archive=True)
+        summary['intervals'] = prune_rows(StatusInterval.objects.all(), 'ended_at', cutoff, run, archive=True)
+
+    if run.stopped:
+        summary['status'] = 'partial'
+    logger.info(f"Probe data retention: {summary}")
+    return summary
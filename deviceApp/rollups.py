@@ -0,0 +1,300 @@
+# deviceApp/rollups.py
+"""
+Incremental uptime and latency rollups (the ConnectivityRollup model).
+
+Every batch of probe results written to the history (see history.py) is
+folded into per-minute, per-hour and per-day buckets for each device or
+router, its school and its province. Only the buckets touched by the batch
+are updated: missing rows are created, the affected rows are locked in key
+order and their counts merged, so concurrent sweep chunks can update the
+same school or province bucket safely.
+
+Latency percentiles come from a fixed histogram (LATENCY_BUCKETS_MS), which
+merges by addition; p95 is reported as the upper bound of the bucket holding
+the 95th percentile, capped at the bucket's maximum latency.
+
+rebuild_rollups() recomputes the buckets of a time window from the raw
+history; the backfill_rollups command runs it over many day windows in
+parallel. Raw results are kept for less time than the hour and day rollups
+(see retention.py), so only buckets the raw history still fully covers are
+rebuilt. Dashboards and reports should read ConnectivityRollup rather than
+ProbeResult.
+"""
+import bisect
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Q
+
+from schoolApp.models import School
+from .models import ConnectivityRollup, ProbeResult
+
+GRANULARITIES = ['minute', 'hour', 'day']
+
+BUCKET_LENGTHS = {
+    'minute': timedelta(minutes=1),
+    'hour': timedelta(hours=1),
+    'day': timedelta(days=1),
+}
+
+# Upper bounds of the latency histogram buckets; the last bucket holds everything slower
+LATENCY_BUCKETS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000]
+
+STAT_FIELDS = ['probe_count', 'online_count', 'latency_count', 'latency_sum',
+               'latency_min', 'latency_max', 'latency_histogram']
+
+
+def truncate(timestamp, granularity):
+    """Start of the bucket a timestamp falls in (timestamps are UTC)"""
+    if granularity == 'minute':
+        return timestamp.replace(second=0, microsecond=0)
+    if granularity == 'hour':
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def empty_stats():
+    return {
+        'probe_count': 0,
+        'online_count': 0,
+        'latency_count': 0,
+        'latency_sum': 0.0,
+        'latency_min': None,
+        'latency_max': None,
+        'latency_histogram': [0] * (len(LATENCY_BUCKETS_MS) + 1)
+    }
+
+
+def merge_stats(stats, other):
+    """Add the counts in `other` to `stats` in place"""
+    for field in ('probe_count', 'online_count', 'latency_count', 'latency_sum'):
+        stats[field] += other[field]
+    if other['latency_min'] is not None:
+        stats['latency_min'] = other['latency_min'] if stats['latency_min'] is None \
+            else min(stats['latency_min'], other['latency_min'])
+    if other['latency_max'] is not None:
+        stats['latency_max'] = other['latency_max'] if stats['latency_max'] is None \
+            else max(stats['latency_max'], other['latency_max'])
+
+    histogram = stats['latency_histogram'] or [0] * (len(LATENCY_BUCKETS_MS) + 1)
+    stats['latency_histogram'] = [count + added for count, added in zip(histogram, other['latency_histogram'])]
+    return stats
+
+
+def histogram_percentile(histogram, percentile, latency_max=None):
+    """
+    Approximate a latency percentile from a histogram.
+
+    Returns the upper bound of the bucket holding the percentile (capped at
+    latency_max), or None for an empty histogram.
+    """
+    total = sum(histogram or [])
+    if not total:
+        return None
+
+    rank = total * percentile / 100
+    seen = 0
+    for index, count in enumerate(histogram):
+        seen += count
+        if seen >= rank:
+            if index < len(LATENCY_BUCKETS_MS):
+                bound = LATENCY_BUCKETS_MS[index]
+                return min(bound, latency_max) if latency_max is not None else bound
+            return latency_max
+    return latency_max
+
+
+def add_probe(stats, status, latency_ms):
+    stats['probe_count'] += 1
+    if status == 'online':
+        stats['online_count'] += 1
+    if latency_ms is not None:
+        stats['latency_count'] += 1
+        stats['latency_sum'] += latency_ms
+        stats['latency_min'] = latency_ms if stats['latency_min'] is None else min(stats['latency_min'], latency_ms)
+        stats['latency_max'] = latency_ms if stats['latency_max'] is None else max(stats['latency_max'], latency_ms)
+        stats['latency_histogram'][bisect.bisect_left(LATENCY_BUCKETS_MS, latency_ms)] += 1
+
+
+def aggregate_probe_results(probe_results, provinces=None, deltas=None):
+    """
+    Fold probe results into per-bucket statistics.
+
+    Parameters:
+    - probe_results: Iterable of ProbeResult instances (saved or not)
+    - provinces: Optional dictionary of school ID to province; looked up when missing
+    - deltas: Optional dictionary to add to, for aggregating in several passes
+
+    Returns a dictionary mapping (granularity, scope, scope_key, bucket_start)
+    to a statistics dictionary.
+    """
+    probe_results = list(probe_results)
+    if deltas is None:
+        deltas = defaultdict(empty_stats)
+    if provinces is None:
+        provinces = {}
+    missing = {row.school_id for row in probe_results if row.school_id and row.school_id not in provinces}
+    if missing:
+        provinces.update(School.objects.filter(id__in=missing).values_list('id', 'province'))
+
+    for row in probe_results:
+        scopes = [(row.target_type, str(row.target_id))]
+        if row.school_id:
+            scopes.append(('school', str(row.school_id)))
+            if provinces.get(row.school_id):
+                scopes.append(('province', provinces[row.school_id]))
+
+        for granularity in GRANULARITIES:
+            bucket_start = truncate(row.checked_at, granularity)
+            for scope, scope_key in scopes:
+                add_probe(deltas[(granularity, scope, scope_key, bucket_start)], row.status, row.latency_ms)
+
+    return deltas
+
+
+def _key_filters(keys, groups_per_query=100):
+    """
+    Q objects matching the rollup rows for the given keys, grouped by bucket
+    and split so no single query grows too large
+    """
+    grouped = defaultdict(set)
+    for granularity, scope, scope_key, bucket_start in keys:
+        grouped[(granularity, scope, bucket_start)].add(scope_key)
+
+    groups = sorted(grouped.items())
+    for index in range(0, len(groups), groups_per_query):
+        condition = Q(pk__in=[])
+        for (granularity, scope, bucket_start), scope_keys in groups[index:index + groups_per_query]:
+            condition |= Q(granularity=granularity, scope=scope, bucket_start=bucket_start,
+                           scope_key__in=scope_keys)
+        yield condition
+
+
+def apply_rollup_deltas(deltas):
+    """
+    Merge per-bucket statistics into the stored rollups, creating buckets as
+    needed. Returns the number of buckets updated.
+    """
+    if not deltas:
+        return 0
+
+    keys = sorted(deltas)
+    with transaction.atomic():
+        ConnectivityRollup.objects.bulk_create([
+            ConnectivityRollup(granularity=granularity, scope=scope, scope_key=scope_key,
+                               bucket_start=bucket_start, latency_histogram=empty_stats()['latency_histogram'])
+            for granularity, scope, scope_key, bucket_start in keys
+        ], ignore_conflicts=True, batch_size=1000)
+
+        # Lock in key order so concurrent batches cannot deadlock
+        rollups = []
+        for condition in _key_filters(keys):
+            rollups += ConnectivityRollup.objects.select_for_update().filter(condition).order_by(
+                'granularity', 'scope', 'bucket_start', 'scope_key'
+            )
+        for rollup in rollups:
+            stats = {field: getattr(rollup, field) for field in STAT_FIELDS}
+            merge_stats(stats, deltas[(rollup.granularity, rollup.scope, rollup.scope_key, rollup.bucket_start)])
+            for field, value in stats.items():
+                setattr(rollup, field, value)
+
+        ConnectivityRollup.objects.bulk_update(rollups, STAT_FIELDS, batch_size=1000)
+    return len(rollups)
+
+
+def update_rollups(probe_results):
+    """Fold a batch of new probe results into the rollups"""
+    return apply_rollup_deltas(aggregate_probe_results(probe_results))
+
+
+def _pop_complete_buckets(deltas, seen_until):
+    """Remove and return the buckets that end at or before seen_until"""
+    complete = [key for key in deltas if key[3] + BUCKET_LENGTHS[key[0]] <= seen_until]
+    return {key: deltas.pop(key) for key in complete}
+
+
+def _create_rollups(deltas):
+    ConnectivityRollup.objects.bulk_create([
+        ConnectivityRollup(granularity=granularity, scope=scope, scope_key=scope_key,
+                           bucket_start=bucket_start, **stats)
+        for (granularity, scope, scope_key, bucket_start), stats in deltas.items()
+    ], batch_size=1000)
+    return len(deltas)
+
+
+def rebuild_starts(window_start, window_end):
+    """
+    Start of the first bucket of each granularity in [window_start,
+    window_end) that the raw history fully covers, i.e. that begins at or
+    after the raw retention cutoff. Granularities without such a bucket are
+    left out.
+    """
+    from .retention import get_retention_cutoff
+
+    cutoff = get_retention_cutoff('raw')
+    starts = {}
+    for granularity in GRANULARITIES:
+        start = window_start
+        if cutoff is not None:
+            first_covered = truncate(cutoff, granularity)
+            if first_covered < cutoff:
+                first_covered += BUCKET_LENGTHS[granularity]
+            start = max(start, first_covered)
+        if start < window_end:
+            starts[granularity] = start
+    return starts
+
+
+def _drop_uncovered_buckets(deltas, starts):
+    """Remove the buckets that rebuild_rollups() must leave alone"""
+    for key in [key for key in deltas if key[0] not in starts or key[3] < starts[key[0]]]:
+        del deltas[key]
+
+
+def rebuild_rollups(window_start, window_end, batch_size=5000):
+    """
+    Recompute the rollup buckets starting in [window_start, window_end) from
+    the probe history. The window must be aligned to whole days so no bucket
+    straddles its edges.
+
+    Buckets starting before the raw retention cutoff are left as they are
+    (see rebuild_starts()): their raw results may already be gone, and
+    rebuilding them would erase or shrink rollups kept for longer than the
+    raw history.
+
+    The history is read in time order, batch_size rows at a time, and each
+    bucket is written as soon as the history has moved past its end, so only
+    the buckets still open are held in memory.
+
+    Returns the number of buckets written.
+    """
+    starts = rebuild_starts(window_start, window_end)
+    if not starts:
+        return 0
+
+    deltas = defaultdict(empty_stats)
+    provinces = {}
+    history = ProbeResult.objects.filter(
+        checked_at__gte=min(starts.values()), checked_at__lt=window_end
+    ).only('target_type', 'target_id', 'school_id', 'checked_at', 'status', 'latency_ms').order_by('checked_at')
+
+    written = 0
+    with transaction.atomic():
+        covered = Q(pk__in=[])
+        for granularity, start in starts.items():
+            covered |= Q(granularity=granularity, bucket_start__gte=start, bucket_start__lt=window_end)
+        ConnectivityRollup.objects.filter(covered).delete()
+
+        batch = []
+        for row in history.iterator(chunk_size=batch_size):
+            batch.append(row)
+            if len(batch) >= batch_size:
+                aggregate_probe_results(batch, provinces, deltas)
+                _drop_uncovered_buckets(deltas, starts)
+                written += _create_rollups(_pop_complete_buckets(deltas, batch[-1].checked_at))
+                batch = []
+        aggregate_probe_results(batch, provinces, deltas)
+        _drop_uncovered_buckets(deltas, starts)
+        written += _create_rollups(deltas)
+    return written
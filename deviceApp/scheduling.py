@@ -0,0 +1,270 @@
+# deviceApp/scheduling.py
+"""
+Adaptive per-target probe scheduling.
+
+Every device and router carries its own probe interval and next-due time
+(stored in its probe_state row, see state.py).
+A target that keeps reporting the same status backs off towards
+CONNECTIVITY_MAX_INTERVAL; a target that just changed status, or changed
+within the last CONNECTIVITY_FLAP_WINDOW seconds, is probed every
+CONNECTIVITY_MIN_INTERVAL seconds. The sweep tasks only probe targets that
+are due, at most CONNECTIVITY_MAX_PROBES_PER_CYCLE per run.
+
+In the default 'spread' mode (CONNECTIVITY_SCHEDULER_MODE) each target also
+gets a stable phase offset hashed from its id, and its due times are aligned
+to that phase. Probes are therefore spread evenly over the interval instead
+of the whole fleet firing on the same tick. A sweep whose chunks run in
+parallel also picks up targets falling due a little ahead and starts each
+probe at its own due time, but only as late as leaves room for the probe's
+worst-case duration (its timeout, ping count and retries, see
+get_probe_allowance()) before the cycle's deadline and the next tick. A
+delayed probe can still finish late if it has to wait for rate-limit tokens
+or a concurrency slot. Sweeps that run their
+chunks one after another only take targets that are already due. The
+'adaptive' mode skips the phase alignment.
+"""
+import zlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils.timezone import now
+
+SCHEDULER_MODE_SPREAD = 'spread'
+SCHEDULER_MODE_ADAPTIVE = 'adaptive'
+
+# Fields written by schedule_next_check()
+SCHEDULE_FIELDS = ['last_status', 'last_status_change', 'probe_interval', 'next_check_due']
+
+
+def get_min_interval():
+    return getattr(settings, 'CONNECTIVITY_MIN_INTERVAL', 60)
+
+
+def get_max_interval():
+    return getattr(settings, 'CONNECTIVITY_MAX_INTERVAL', 900)
+
+
+def get_default_interval():
+    return getattr(settings, 'CONNECTIVITY_DEFAULT_INTERVAL', 180)
+
+
+def get_max_probes_per_cycle():
+    return getattr(settings, 'CONNECTIVITY_MAX_PROBES_PER_CYCLE', 5000)
+
+
+def get_scheduler_mode():
+    return getattr(settings, 'CONNECTIVITY_SCHEDULER_MODE', SCHEDULER_MODE_SPREAD)
+
+
+def get_sweep_tick():
+    """Seconds between sweep runs (the beat schedule)"""
+    return getattr(settings, 'CONNECTIVITY_SWEEP_TICK', 60)
+
+
+def get_probe_allowance(target=None):
+    """
+    Seconds reserved for the probe itself after a delayed start: its
+    worst-case duration with the target's probe settings, or with the
+    default settings when no target is given
+    """
+    from .probes import probe_time_bound
+
+    if target is None:
+        return probe_time_bound()
+    return probe_time_bound(target.check_ports, target.use_ping_fallback, target.ping_count,
+                            target.timeout, target.retry_count)
+
+
+def is_spread_mode():
+    return get_scheduler_mode() == SCHEDULER_MODE_SPREAD
+
+
+def spread_lookahead(time_left):
+    """
+    Seconds ahead of now a spread-mode sweep may schedule delayed probes,
+    given the time left in its budget: a probe with the default settings
+    started then can still run to its worst case within the budget, and
+    no later than the next tick. start_delay() takes targets with slower
+    settings correspondingly earlier.
+    """
+    if not is_spread_mode():
+        return 0
+    return max(0.0, min(get_sweep_tick(), time_left) - get_probe_allowance())
+
+
+def phase_offset(target, interval):
+    """
+    Stable offset in seconds within the interval for this target,
+    hashed from its model and id so devices and routers spread independently.
+    """
+    key = f"{target._meta.label_lower}:{target.pk}".encode()
+    return zlib.crc32(key) % max(int(interval), 1)
+
+
+def next_phase_slot(target, interval, after, min_gap=None):
+    """
+    First due time after `after` that falls on the target's phase and is at
+    least min_gap seconds away (default half an interval, so consecutive
+    probes of one target are never bunched up).
+    """
+    interval = max(int(interval), 1)
+    min_gap = interval / 2 if min_gap is None else min_gap
+    offset = phase_offset(target, interval)
+    timestamp = after.timestamp()
+    slot = (int((timestamp - offset) // interval) + 1) * interval + offset
+    if slot - timestamp < min_gap:
+        slot += interval
+    return after + timedelta(seconds=slot - timestamp)
+
+
+def next_probe_interval(previous_interval, status_changed, stable_for):
+    """
+    Compute the next probe interval in seconds.
+
+    Parameters:
+    - previous_interval: Current interval in seconds (None if never scheduled)
+    - status_changed: Whether the latest probe changed the target's status
+    - stable_for: Seconds since the target's status last changed (None if never)
+    """
+    min_interval = get_min_interval()
+    max_interval = get_max_interval()
+
+    # Just changed or still flapping: watch it closely
+    flap_window = getattr(settings, 'CONNECTIVITY_FLAP_WINDOW', 900)
+    if status_changed or (stable_for is not None and stable_for < flap_window):
+        return min_interval
+
+    if not previous_interval:
+        return get_default_interval()
+
+    backoff = getattr(settings, 'CONNECTIVITY_INTERVAL_BACKOFF', 1.5)
+    return int(min(max_interval, max(min_interval, previous_interval * backoff)))
+
+
+def schedule_next_check(target, status, checked_at=None):
+    """
+    Update the target's status tracking and next-due time after a probe.
+
+    Parameters:
+    - target: Device or Router instance
+    - status: Status reported by the probe ('online', 'offline', ...)
+    - checked_at: When the probe ran (defaults to now)
+
+    Returns the list of model fields that were changed.
+    """
+    checked_at = checked_at or now()
+
+    status_changed = target.last_status is not None and target.last_status != status
+    if status_changed or target.last_status_change is None:
+        target.last_status_change = checked_at
+    stable_for = (checked_at - target.last_status_change).total_seconds()
+
+    target.probe_interval = next_probe_interval(target.probe_interval, status_changed, stable_for)
+    target.last_status = status
+    if is_spread_mode():
+        target.next_check_due = next_phase_slot(target, target.probe_interval, checked_at)
+    else:
+        target.next_check_due = checked_at + timedelta(seconds=target.probe_interval)
+
+    return SCHEDULE_FIELDS
+
+
+def assign_initial_slots(queryset, current_time=None):
+    """
+    Give never-scheduled targets a first due time on their phase slot, so a
+    freshly added fleet is spread over the default interval instead of being
+    probed all at once. Only used in spread mode.
+
+    Returns the number of targets scheduled.
+    """
+    from .state import upsert_probe_states
+
+    current_time = current_time or now()
+    interval = get_default_interval()
+    unscheduled = queryset.select_related(None).filter(probe_state__next_check_due__isnull=True).only('id')
+    state_model = queryset.model.probe_state_model()
+    states = [
+        state_model(target_id=target.pk,
+                    next_check_due=next_phase_slot(target, interval, current_time, min_gap=0))
+        for target in unscheduled
+    ]
+    upsert_probe_states(state_model, states, ['next_check_due'])
+    return len(states)
+
+
+def due_queryset(queryset, limit=None, current_time=None, lookahead=0):
+    """
+    Restrict a Device or Router queryset to targets that are due for a probe,
+    longest-waiting first, capped at CONNECTIVITY_MAX_PROBES_PER_CYCLE.
+
+    In spread mode this includes targets falling due within the next
+    `lookahead` seconds (see spread_lookahead()); start_delay() tells the
+    probe engine when to start each of them.
+
+    Targets whose stored schedule is due but whose schedule cached since the
+    last heartbeat is not (see writepolicy.py) are left out.
+    """
+    current_time = current_time or now()
+    limit = limit or get_max_probes_per_cycle()
+
+    if is_spread_mode():
+        assign_initial_slots(queryset, current_time)
+        horizon = current_time + timedelta(seconds=lookahead)
+        candidates = queryset.filter(
+            probe_state__next_check_due__lte=horizon
+        ).order_by('probe_state__next_check_due', 'id')
+    else:
+        horizon = current_time
+        candidates = queryset.filter(
+            Q(probe_state__next_check_due__isnull=True) | Q(probe_state__next_check_due__lte=current_time)
+        ).order_by(F('probe_state__next_check_due').asc(nulls_first=True), 'id')
+
+    not_due = _deferred_not_due(candidates, horizon, limit)
+    if not_due:
+        candidates = candidates.exclude(pk__in=not_due)
+    return candidates[:limit]
+
+
+def _deferred_not_due(candidates, horizon, limit):
+    """
+    Keys of candidates whose cached schedule is due only after horizon,
+    looking at pages of candidates until `limit` really due ones are seen
+    """
+    from .writepolicy import deferred_not_due
+
+    not_due = []
+    offset = 0
+    while True:
+        page = list(candidates.values_list('pk', flat=True)[offset:offset + limit])
+        not_due += deferred_not_due(candidates.model, page, horizon)
+        offset += len(page)
+        if len(page) < limit or offset - len(not_due) >= limit:
+            return not_due
+
+
+def start_delay(target, current_time=None, max_delay=0):
+    """
+    Seconds the probe engine should wait before probing this target, so
+    spread-mode probes start at their own due time, but at most max_delay
+    (a spread_lookahead()), less however much longer this target's probe
+    can take than a default one.
+    """
+    if not max_delay or not is_spread_mode() or target.next_check_due is None:
+        return 0
+    current_time = current_time or now()
+    max_delay -= max(0, get_probe_allowance(target) - get_probe_allowance())
+    return max(0.0, min(max_delay, (target.next_check_due - current_time).total_seconds()))
+
+
+def fleet_probe_rate(*querysets):
+    """
+    Expected steady-state probes per minute for the given Device/Router
+    querysets, from each target's current interval.
+    """
+    default_interval = get_default_interval()
+    rate = 0.0
+    for queryset in querysets:
+        for interval in queryset.values_list('probe_state__probe_interval', flat=True).iterator():
+            rate += 60.0 / (interval or default_interval)
+    return round(rate, 2)
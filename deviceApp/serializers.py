@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import Device
+from .models import ConnectivityRollup, Device, StatusTransitionEvent
 from userApp.models import CustomUser
 from schoolApp.models import School
 from django.db import IntegrityError
@@ -20,6 +20,11 @@ class SchoolSerializer(serializers.ModelSerializer):
 
 
 
+def nested_columns(path, serializer_class):
+    """only() arguments for the columns a nested serializer reads through `path`"""
+    return [f'{path}__{field}' for field in serializer_class.Meta.fields]
+
+
 # In serializers.py, update the DeviceSerializer:
 
 class DeviceSerializer(serializers.ModelSerializer):
@@ -37,15 +42,38 @@ class DeviceSerializer(serializers.ModelSerializer):
         required=False  # Make it not required since you set it in the view
     )
     status = serializers.SerializerMethodField()
+    status_checked_at = serializers.DateTimeField(read_only=True)
+    status_age_seconds = serializers.SerializerMethodField()
+    status_stale = serializers.SerializerMethodField()
     connectivity_details = serializers.SerializerMethodField()
+    # Probe state fields are read through the probe_state row
+    last_connectivity = serializers.DateTimeField(read_only=True)
+    last_check_attempt = serializers.DateTimeField(read_only=True)
+    connectivity_error = serializers.CharField(read_only=True)
     
     class Meta:
         model = Device
         fields = ['id', 'name', 'mac_address', 'ip_address', 'type',
-                 'check_ports', 'use_ping_fallback', 'created_by', 'created_by_id', 'status', 'connectivity_details',
+                 'check_ports', 'use_ping_fallback', 'created_by', 'created_by_id', 'status',
+                 'status_checked_at', 'status_age_seconds', 'status_stale', 'connectivity_details',
                  'school', 'school_id', 'created_at', 'last_updated',
                  'last_connectivity', 'last_check_attempt', 'connectivity_error']
     
+    @staticmethod
+    def setup_eager_loading(queryset):
+        """
+        Load devices with their school, users and probe state in one query,
+        reading only the user and school columns this serializer uses
+        """
+        return queryset.select_related('created_by', 'school__created_by', 'probe_state').only(
+            *[field.name for field in Device._meta.concrete_fields],
+            *nested_columns('created_by', CustomUserSerializer),
+            *nested_columns('school', SchoolSerializer),
+            *nested_columns('school__created_by', CustomUserSerializer),
+            # Read by get_probe_params() when ?refresh=true probes the page
+            'school__probe_rate_limit'
+        )
+    
     def create(self, validated_data):
         # If there's no context or request, just use the validated data as is
         if 'request' not in self.context and 'created_by' not in validated_data:
@@ -59,36 +87,17 @@ class DeviceSerializer(serializers.ModelSerializer):
         return super().create(validated_data)
     
     def get_status(self, obj):
-        """Get real-time status by checking device connectivity"""
-        try:
-            # Check if the method exists
-            if not hasattr(obj, 'check_connectivity'):
-                return 'error'
-                
-            # Force a new connectivity check
-            result = obj.check_connectivity()
-            
-            # Check status from the result dictionary
-            if isinstance(result, dict) and 'status' in result:
-                status = result['status']
-            else:
-                # Fall back to boolean interpretation if result is not a dict
-                is_online = bool(result)
-                status = 'online' if is_online else 'offline'
-            
-            # Check if it's reachable but has connectivity error
-            if status == 'online':
-                return 'online'
-            elif obj.connectivity_error and 'reachable but has no internet' in obj.connectivity_error:
-                return 'no_internet'  # New status for devices that are up but can't access internet
-            elif obj.connectivity_error and 'reachable but appears to be offline' in obj.connectivity_error:
-                return 'offline'  # Device is technically reachable but failing deeper checks
-            else:
-                return 'offline'
-        except Exception as e:
-            obj.connectivity_error = str(e)
-            obj.save(update_fields=['connectivity_error'])
-            return 'error'
+        """
+        Last known status from the probe state. Reading never probes; the
+        sweeps keep the status current and ?refresh=true probes on demand.
+        """
+        return obj.stored_status()
+    
+    def get_status_age_seconds(self, obj):
+        return obj.status_age_seconds()
+    
+    def get_status_stale(self, obj):
+        return obj.is_status_stale()
     
     def get_connectivity_details(self, obj):
         """Return detailed connectivity information"""
@@ -172,4 +181,24 @@ class DeviceSerializer(serializers.ModelSerializer):
     
     
     
-    
\ No newline at end of file
+    
+
+
+class ConnectivityRollupSerializer(serializers.ModelSerializer):
+    uptime_ratio = serializers.FloatField(read_only=True)
+    min_latency_ms = serializers.FloatField(source='latency_min', read_only=True)
+    avg_latency_ms = serializers.FloatField(read_only=True)
+    max_latency_ms = serializers.FloatField(source='latency_max', read_only=True)
+    p95_latency_ms = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = ConnectivityRollup
+        fields = ['granularity', 'scope', 'scope_key', 'bucket_start', 'probe_count', 'online_count',
+                  'uptime_ratio', 'min_latency_ms', 'avg_latency_ms', 'max_latency_ms', 'p95_latency_ms']
+
+
+class StatusTransitionEventSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = StatusTransitionEvent
+        fields = ['id', 'target_type', 'target_id', 'school_id', 'kind', 'previous_status', 'status',
+                  'occurred_at', 'confirmed_at', 'confirmations', 'error']
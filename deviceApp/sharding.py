@@ -0,0 +1,101 @@
+# deviceApp/sharding.py
+"""
+Splitting a device sweep into chunks that Celery workers process in parallel.
+
+Devices are sharded by /24 subnet so every chunk holds whole subnets and the
+per-subnet sampling in the sweep still works. Chunk size adapts to how long
+recent chunks took: the sweep aims for chunks of about
+CONNECTIVITY_SWEEP_CHUNK_TARGET_SECONDS each, so adding workers shortens the
+sweep instead of leaving them idle.
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+from .utils import is_valid_ipv4
+
+CHUNK_SIZE_CACHE_KEY = 'connectivity:sweep:chunk_size'
+
+# Summary keys that are summed across chunks
+COUNT_KEYS = ['total', 'online', 'offline', 'errors', 'no_internet', 'upstream_unreachable', 'carried_over']
+
+
+def get_chunk_size():
+    """Current adaptive chunk size, starting from CONNECTIVITY_SWEEP_CHUNK_SIZE"""
+    return cache.get(CHUNK_SIZE_CACHE_KEY) or getattr(settings, 'CONNECTIVITY_SWEEP_CHUNK_SIZE', 200)
+
+
+def record_chunk_duration(size, seconds):
+    """
+    Adjust the chunk size towards the target duration after a chunk finishes.
+    Moves halfway to the ideal size each time so one slow chunk does not swing it.
+
+    Parameters:
+    - size: Number of devices in the chunk
+    - seconds: Time the chunk spent probing, not counting spread-mode waits
+    """
+    if size <= 0:
+        return get_chunk_size()
+
+    target = getattr(settings, 'CONNECTIVITY_SWEEP_CHUNK_TARGET_SECONDS', 30)
+    min_size = getattr(settings, 'CONNECTIVITY_SWEEP_MIN_CHUNK_SIZE', 20)
+    max_size = getattr(settings, 'CONNECTIVITY_SWEEP_MAX_CHUNK_SIZE', 2000)
+
+    current = get_chunk_size()
+    ideal = size * target / max(seconds, 0.001)
+    new_size = int(min(max_size, max(min_size, (current + ideal) / 2)))
+    cache.set(CHUNK_SIZE_CACHE_KEY, new_size, timeout=None)
+    return new_size
+
+
+def subnet_of(ip_address):
+    """Shard key for a device: its /24 network, or 'others'"""
+    if ip_address and is_valid_ipv4(ip_address):
+        return '.'.join(ip_address.split('.')[:3])
+    return 'others'
+
+
+def shard_devices(device_rows, chunk_size):
+    """
+    Split devices into chunks of whole subnets.
+
+    Parameters:
+    - device_rows: Iterable of (device id, ip address) pairs, longest-waiting
+      first; chunks keep that order (by each subnet's longest-waiting device)
+    - chunk_size: Target number of devices per chunk; subnets larger than
+      this are split on their own
+
+    Returns a list of device id lists.
+    """
+    subnets = {}
+    for device_id, ip_address in device_rows:
+        subnets.setdefault(subnet_of(ip_address), []).append(device_id)
+
+    chunks = []
+    current = []
+    # Dictionaries keep insertion order, so subnets come longest-waiting first
+    for subnet in subnets:
+        device_ids = subnets[subnet]
+        if current and len(current) + len(device_ids) > chunk_size:
+            chunks.append(current)
+            current = []
+        while len(device_ids) > chunk_size:
+            chunks.append(device_ids[:chunk_size])
+            device_ids = device_ids[chunk_size:]
+        current.extend(device_ids)
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def merge_sweep_results(chunk_results):
+    """Combine per-chunk sweep summaries into one summary dictionary"""
+    merged = {key: 0 for key in COUNT_KEYS}
+    merged['details'] = []
+    merged['chunks'] = len(chunk_results)
+
+    for chunk_result in chunk_results:
+        for key in COUNT_KEYS:
+            merged[key] += chunk_result.get(key, 0)
+        merged['details'].extend(chunk_result.get('details', []))
+
+    return merged
@@ -0,0 +1,159 @@
+# deviceApp/sla.py
+"""
+Fleet-wide SLA computation from the status intervals.
+
+Confirmed status periods of every device and router are stored as
+StatusInterval rows (see transitions.py), with the current, still open
+period in each probe state row. For a report window the overlapping
+intervals are loaded once into a pandas frame and everything else is
+vectorized: intervals are clipped to the window, split into up (online) and
+down (any other status) seconds, and summed per target or per school.
+
+- uptime_pct: up seconds / observed seconds * 100
+- outages: down periods overlapping the window; consecutive down
+  intervals of one target (e.g. offline then no_internet) count once
+- mttr_seconds: down seconds / outages
+- mtbf_seconds: up seconds / outages
+
+Time before a target's first interval is not observed and counts
+neither as up nor as down.
+"""
+import numpy as np
+import pandas as pd
+from django.utils.timezone import now
+
+from schoolApp.models import School
+from .models import DeviceProbeState, StatusInterval
+
+INTERVAL_COLUMNS = ['target_type', 'target_id', 'school_id', 'status', 'started_at', 'ended_at']
+
+GROUPINGS = {
+    'target': ['target_type', 'target_id', 'school_id'],
+    'school': ['school_id'],
+}
+
+
+def _open_intervals(window_start, window_end, target_type=None, school_id=None):
+    """Current status periods from the probe state tables, ending now (or at window_end)"""
+    from routerApp.models import RouterProbeState
+
+    sources = [
+        ('device', DeviceProbeState, 'target__school_id'),
+        ('router', RouterProbeState, 'target__access_point__school_id'),
+    ]
+    ended_at = min(window_end, now())
+    rows = []
+    for source_type, state_model, school_field in sources:
+        if target_type and target_type != source_type:
+            continue
+        states = state_model.objects.filter(
+            confirmed_status__isnull=False, status_since__lt=ended_at
+        )
+        if school_id is not None:
+            states = states.filter(**{school_field: school_id})
+        rows += [
+            (source_type, target_id, target_school_id, status, started_at, ended_at)
+            for target_id, target_school_id, status, started_at in states.values_list(
+                'target_id', school_field, 'confirmed_status', 'status_since'
+            ).iterator()
+        ]
+    return rows
+
+
+def load_intervals(window_start, window_end, target_type=None, school_id=None):
+    """
+    Load every status interval overlapping [window_start, window_end),
+    including the open ones.
+
+    Returns a DataFrame with INTERVAL_COLUMNS; started_at and ended_at are
+    UTC epoch seconds.
+    """
+    closed = StatusInterval.objects.filter(ended_at__gt=window_start, started_at__lt=window_end)
+    if target_type:
+        closed = closed.filter(target_type=target_type)
+    if school_id is not None:
+        closed = closed.filter(school_id=school_id)
+
+    rows = list(closed.values_list(*INTERVAL_COLUMNS).iterator(chunk_size=10000))
+    rows += _open_intervals(window_start, window_end, target_type, school_id)
+
+    frame = pd.DataFrame(rows, columns=INTERVAL_COLUMNS)
+    for column in ('started_at', 'ended_at'):
+        frame[column] = pd.to_datetime(frame[column], utc=True).astype('int64') // 10 ** 9
+    return frame
+
+
+def compute_sla(intervals, window_start, window_end, group='target'):
+    """
+    Compute uptime, outage count, MTTR and MTBF per target or per school.
+
+    Parameters:
+    - intervals: DataFrame from load_intervals()
+    - window_start, window_end: Report window
+    - group: 'target' or 'school'
+
+    Returns a DataFrame with one row per group.
+    """
+    keys = GROUPINGS[group]
+    start_ts, end_ts = int(window_start.timestamp()), int(window_end.timestamp())
+
+    frame = intervals.sort_values(['target_type', 'target_id', 'started_at'], ignore_index=True)
+    started = np.clip(frame['started_at'].to_numpy(), start_ts, end_ts)
+    ended = np.clip(frame['ended_at'].to_numpy(), start_ts, end_ts)
+    duration = np.maximum(ended - started, 0)
+    up = frame['status'].to_numpy() == 'online'
+    down = ~up & (duration > 0)
+
+    # A down interval starts an outage unless the target's previous interval was down too
+    previous_down = pd.Series(down).groupby(
+        [frame['target_type'], frame['target_id']]
+    ).shift(1, fill_value=False).to_numpy(dtype=bool)
+
+    frame = frame.assign(
+        targets=1,
+        up_seconds=np.where(up, duration, 0),
+        down_seconds=np.where(up, 0, duration),
+        outages=(down & ~previous_down).astype(np.int64)
+    )
+
+    if group == 'school':
+        frame['targets'] = ~frame.duplicated(['target_type', 'target_id'])
+    summary = frame.groupby(keys, dropna=False)[
+        ['targets', 'up_seconds', 'down_seconds', 'outages']
+    ].sum().reset_index()
+    if group == 'target':
+        summary = summary.drop(columns='targets')
+    # Grouping on a key with missing values turns it into floats
+    summary['school_id'] = summary['school_id'].astype('Int64')
+
+    observed = summary['up_seconds'] + summary['down_seconds']
+    outages = summary['outages'].replace(0, np.nan)
+    summary['observed_seconds'] = observed
+    summary['uptime_pct'] = (100 * summary['up_seconds'] / observed.replace(0, np.nan)).round(3)
+    summary['mttr_seconds'] = (summary['down_seconds'] / outages).round(1)
+    summary['mtbf_seconds'] = (summary['up_seconds'] / outages).round(1)
+    return summary
+
+
+def sla_report(window_start, window_end, group='target', target_type=None, school_id=None):
+    """
+    SLA figures for every device and router (or school) over a window,
+    with school names and provinces attached.
+
+    Returns a DataFrame sorted by uptime, worst first.
+    """
+    intervals = load_intervals(window_start, window_end, target_type, school_id)
+    summary = compute_sla(intervals, window_start, window_end, group)
+
+    schools = pd.DataFrame(
+        list(School.objects.filter(id__in=summary['school_id'].dropna().unique().tolist())
+             .values_list('id', 'name', 'province', 'district')),
+        columns=['school_id', 'school_name', 'province', 'district']
+    )
+    summary = summary.merge(schools, on='school_id', how='left')
+    return summary.sort_values('uptime_pct', na_position='last', ignore_index=True)
+
+
+def report_records(summary):
+    """DataFrame rows as JSON-safe dictionaries (NaN becomes None)"""
+    return summary.astype(object).where(summary.notna(), None).to_dict('records')
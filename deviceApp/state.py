@@ -0,0 +1,602 @@
+# deviceApp/state.py
+"""
+Current probe state kept apart from the inventory rows.
+
+Probe results and scheduling fields live in a 1:1 table per target model
+(DeviceProbeState, RouterProbeState) rather than on Device and Router, so a
+probe never rewrites an inventory row: last_updated and the default
+ordering only change on real edits. The state rows are written with bulk
+upserts, batched per sweep chunk by writeback.probe_write_batch().
+
+ProbeStateMixin gives Device and Router read-through properties for every
+state field, so `device.last_status` and `device.next_check_due = ...`
+keep working, plus the stored status with its age and staleness for the
+API (which no longer probes on reads); query filters go through the relation
+(`probe_state__next_check_due`). Load targets with
+select_related('probe_state') to avoid one query per target.
+
+ProbeTargetMixin adds the connectivity checks themselves (single, bulk and
+derived results), shared by Device and Router.
+"""
+from datetime import datetime
+
+from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import models
+from django.db.models import F, Q
+from django.utils.timezone import now
+
+from .probememo import memoized_result, probe_memo, remember_result
+from .probes import run_probes
+from .ratelimit import get_school_rate_limit, get_subnet_rate_limit, subnet_key
+from .scheduling import SCHEDULE_FIELDS, get_default_interval, schedule_next_check, start_delay
+from .transitions import TRANSITION_FIELDS, observe_status
+from .utils import (
+    check_device_connectivity_with_params,
+    check_internet_connectivity,
+    extract_probe_metrics,
+    is_valid_ipv4
+)
+from .writeback import defer_heartbeat, pending_writes
+from .writepolicy import get_heartbeat_interval, load_deferred_heartbeats, probe_write_fields
+
+# Typed columns holding the latest probe's metrics (see utils.extract_probe_metrics)
+METRIC_FIELDS = ['latency_ms', 'packet_loss', 'ports_checked', 'ports_open', 'open_ports']
+
+PROBE_STATE_FIELDS = [
+    'last_connectivity',
+    'last_check_attempt',
+    'connectivity_error',
+    'connectivity_details',
+    'last_confirmed_at'
+] + METRIC_FIELDS + SCHEDULE_FIELDS + TRANSITION_FIELDS
+
+
+class ProbeState(models.Model):
+    """
+    Latest probe result and schedule of one target. Concrete subclasses add
+    a `target` one-to-one primary key with related_name='probe_state'.
+    """
+    last_connectivity = models.DateTimeField(null=True, blank=True)
+
+    # Status tracking fields
+    last_check_attempt = models.DateTimeField(null=True, blank=True)
+    connectivity_error = models.CharField(max_length=255, blank=True, null=True)
+    connectivity_details = models.JSONField(default=dict, blank=True)
+    last_confirmed_at = models.DateTimeField(null=True, blank=True,
+                                             help_text="When the latest probe ran (see writepolicy.py)")
+
+    # Metrics from the latest probe, written at probe time
+    latency_ms = models.FloatField(null=True, blank=True)
+    packet_loss = models.FloatField(null=True, blank=True)
+    ports_checked = models.IntegerField(null=True, blank=True)
+    ports_open = models.IntegerField(null=True, blank=True)
+    open_ports = models.JSONField(default=list, blank=True)
+
+    # Adaptive probe scheduling (see deviceApp/scheduling.py)
+    last_status = models.CharField(max_length=20, blank=True, null=True, db_index=True)
+    last_status_change = models.DateTimeField(null=True, blank=True)
+    probe_interval = models.IntegerField(null=True, blank=True,
+                                         help_text="Current probe interval in seconds")
+    next_check_due = models.DateTimeField(null=True, blank=True, db_index=True)
+
+    # Transition detection with hysteresis (see deviceApp/transitions.py)
+    confirmed_status = models.CharField(max_length=20, blank=True, null=True)
+    status_since = models.DateTimeField(null=True, blank=True,
+                                        help_text="Start of the current confirmed status")
+    pending_status = models.CharField(max_length=20, blank=True, null=True)
+    pending_since = models.DateTimeField(null=True, blank=True)
+    pending_count = models.IntegerField(default=0)
+    flapping = models.BooleanField(default=False)
+    recent_transitions = models.JSONField(default=list, blank=True,
+                                          help_text="Times of the confirmed transitions within the flap window")
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember what is stored so writepolicy can tell transitions from heartbeats
+        instance._stored_values = dict(zip(field_names, values))
+        return instance
+
+
+def upsert_probe_states(state_model, states, fields=None):
+    """
+    Insert or update state rows in bulk.
+
+    Parameters:
+    - state_model: DeviceProbeState or RouterProbeState
+    - states: Unsaved or loaded state instances with target_id set
+    - fields: Fields to overwrite on existing rows (default: all state fields)
+    """
+    if not states:
+        return
+    fields = fields or PROBE_STATE_FIELDS
+    state_model.objects.bulk_create(
+        states,
+        update_conflicts=True,
+        unique_fields=['target'],
+        update_fields=fields,
+        batch_size=500
+    )
+    for state in states:
+        stored = getattr(state, '_stored_values', None)
+        if stored is None:
+            # A new row was inserted with every field
+            state._stored_values = {field: getattr(state, field) for field in PROBE_STATE_FIELDS}
+        else:
+            stored.update((field, getattr(state, field)) for field in fields)
+
+
+def _state_property(field):
+    def getter(self):
+        return getattr(self.get_probe_state(), field)
+
+    def setter(self, value):
+        setattr(self.get_probe_state(), field, value)
+
+    return property(getter, setter, doc=f"Read-through to probe_state.{field}")
+
+
+class ProbeStateMixin:
+    """
+    Read-through access from a Device or Router to its probe state row
+    """
+
+    @classmethod
+    def probe_state_model(cls):
+        return cls.probe_state.related.related_model
+
+    def get_probe_state(self):
+        """The target's state row, created in memory if it does not exist yet"""
+        try:
+            return self.probe_state
+        except ObjectDoesNotExist:
+            state = self.probe_state_model()(target_id=self.pk)
+            self.probe_state = state
+            return state
+
+    def stored_status(self):
+        """
+        Status from the latest stored probe: 'online', 'no_internet',
+        'offline', or 'unknown' if the target was never probed
+        """
+        status = self.last_status
+        if status is None:
+            if not self.last_check_attempt:
+                return 'unknown'
+            status = 'online' if self.last_connectivity and self.last_connectivity >= self.last_check_attempt \
+                else 'offline'
+        if status == 'online':
+            return 'online'
+        if self.connectivity_error and 'reachable but has no internet' in self.connectivity_error:
+            return 'no_internet'
+        return 'offline' if status != 'unknown' else 'unknown'
+
+    @staticmethod
+    def stored_status_filter(status):
+        """
+        Q object selecting the targets whose stored_status() is `status`,
+        for filtering lists in the database instead of in Python
+        """
+        never_probed = Q(probe_state__last_status__isnull=True, probe_state__last_check_attempt__isnull=True)
+        online = Q(probe_state__last_status='online') | Q(
+            probe_state__last_status__isnull=True,
+            probe_state__last_connectivity__gte=F('probe_state__last_check_attempt')
+        )
+        no_internet = Q(probe_state__connectivity_error__contains='reachable but has no internet')
+        if status == 'online':
+            return online
+        if status == 'no_internet':
+            return ~online & ~never_probed & no_internet
+        if status == 'unknown':
+            return never_probed | (Q(probe_state__last_status='unknown') & ~no_internet)
+        if status == 'offline':
+            return ~online & ~never_probed & ~no_internet & ~Q(probe_state__last_status='unknown')
+        raise ValueError(f"Unknown status: {status}")
+
+    @property
+    def status_checked_at(self):
+        """When the stored status was last confirmed by a probe"""
+        return self.last_confirmed_at or self.last_check_attempt
+
+    def status_age_seconds(self, current_time=None):
+        """Seconds since the stored status was last confirmed, or None if never probed"""
+        if not self.status_checked_at:
+            return None
+        return max(0.0, ((current_time or now()) - self.status_checked_at).total_seconds())
+
+    def is_status_stale(self, current_time=None):
+        """
+        Whether the stored status is older than CONNECTIVITY_STALE_FACTOR probe
+        intervals, i.e. the sweeps have missed it. The stored confirmation of
+        an unchanged target is only written every heartbeat (see
+        writepolicy.py), so the interval counts as at least a heartbeat.
+        """
+        age = self.status_age_seconds(current_time)
+        if age is None:
+            return True
+        stale_factor = getattr(settings, 'CONNECTIVITY_STALE_FACTOR', 2)
+        interval = max(self.probe_interval or get_default_interval(), get_heartbeat_interval())
+        return age > stale_factor * interval
+
+    def save_probe_state(self, fields=None):
+        """Upsert this target's state row, or queue it inside a probe_write_batch()"""
+        type(self).save_probe_states([self], fields)
+
+    @classmethod
+    def save_probe_states(cls, targets, fields=None, batched=True):
+        """
+        Upsert the state rows of many targets in one statement per batch.
+        Inside a probe_write_batch() the targets are queued and written when
+        the batch is flushed, unless batched is False.
+        """
+        writes = pending_writes() if batched else None
+        if writes is not None:
+            for target in targets:
+                writes.add_state(target, fields)
+            return
+
+        states = []
+        for target in targets:
+            state = target.get_probe_state()
+            state.target_id = target.pk
+            states.append(state)
+        upsert_probe_states(cls.probe_state_model(), states, fields)
+
+
+for _field in PROBE_STATE_FIELDS:
+    setattr(ProbeStateMixin, _field, _state_property(_field))
+del _field
+
+
+class ProbeTargetMixin(ProbeStateMixin):
+    """
+    Connectivity checks shared by Device and Router. Subclasses set
+    target_type ('device' or 'router') and say which school the target
+    belongs to through get_school() and get_school_id().
+    """
+    target_type = None
+
+    def get_school(self):
+        raise NotImplementedError
+
+    def get_school_id(self):
+        raise NotImplementedError
+
+    @property
+    def status(self):
+        """
+        Dynamic property that returns the current connectivity status,
+        probing at most once per request (see deviceApp/probememo.py)
+        """
+        try:
+            latest_check = self.check_connectivity()
+            return latest_check.get('status', 'unknown')
+        except Exception as e:
+            self.connectivity_error = str(e)
+            self.save_probe_state(['connectivity_error'])
+            return 'error'
+
+    @property
+    def connection_details(self):
+        """Returns the latest connectivity check details as a dictionary"""
+        return self.connectivity_details or {}
+
+    def get_probe_params(self):
+        """Keyword arguments passed to the probe engine for this target"""
+        return {
+            'ip_address': self.ip_address,
+            'device_type': self.type,
+            'ports': self.check_ports,
+            'use_ping_fallback': self.use_ping_fallback,
+            'ping_count': self.ping_count,
+            'timeout': self.timeout,
+            'retry_count': self.retry_count,
+            'rate_limits': [
+                (f'school:{self.get_school_id()}', get_school_rate_limit(self.get_school())),
+                (subnet_key(self.ip_address), get_subnet_rate_limit())
+            ]
+        }
+
+    def _begin_connectivity_check(self, save_result=True):
+        """
+        Reset the check fields and validate the IP address.
+
+        Returns an offline result dictionary if the target cannot be probed,
+        otherwise None.
+        """
+        # Update check attempt timestamp
+        self.last_check_attempt = now()
+        self.connectivity_error = None
+
+        # Basic validation
+        if not self.ip_address:
+            self.connectivity_error = "No IP address configured"
+        elif not is_valid_ipv4(self.ip_address):
+            self.connectivity_error = "Invalid IP address format"
+        else:
+            return None
+
+        schedule_fields = schedule_next_check(self, 'offline', self.last_check_attempt)
+        self.last_confirmed_at = self.last_check_attempt
+        result = {'status': 'offline', 'error': self.connectivity_error}
+        if save_result:
+            self._observe_transition(result)
+            self._save_probe_result(['last_check_attempt', 'connectivity_error'] + schedule_fields + TRANSITION_FIELDS)
+            self._record_history(result)
+        return result
+
+    def _save_probe_result(self, fields):
+        """
+        Persist a probe result, or only cache the schedule of an unchanged
+        one until its next heartbeat (see deviceApp/writepolicy.py)
+        """
+        fields = probe_write_fields(self.get_probe_state(), fields)
+        if fields:
+            self.save_probe_state(fields)
+        else:
+            defer_heartbeat(self)
+
+    def _record_history(self, result):
+        """Append the result to the probe history (see deviceApp/history.py)"""
+        from .history import record_probe_result
+        record_probe_result(self.target_type, self.id, self.get_school_id(), result, self.last_check_attempt)
+
+    def _observe_transition(self, result):
+        """Feed the result to the transition detector (see deviceApp/transitions.py)"""
+        return observe_status(self, self.target_type, self.get_school_id(), result, self.last_check_attempt)
+
+    def _no_internet_result(self, save_result=True):
+        """Record that the host machine itself is offline"""
+        self.connectivity_error = "Host machine has no internet connection"
+        if save_result:
+            self.save_probe_state(['last_check_attempt', 'connectivity_error'])
+        return {'status': 'unknown', 'error': self.connectivity_error}
+
+    def apply_connectivity_result(self, result, save_result=True):
+        """
+        Update the status fields from a probe engine result.
+
+        Returns the result dictionary unchanged.
+        """
+        # Update the state fields based on check results
+        if result['status'] == 'online':
+            self.last_connectivity = now()
+            self.connectivity_error = None
+        else:
+            self.connectivity_error = result.get('error', 'Device is unreachable')
+
+        # Store the detailed results and their typed metrics
+        self.connectivity_details = result
+        for field, value in extract_probe_metrics(result).items():
+            setattr(self, field, value)
+
+        # Decide when to probe next based on how stable the status is
+        schedule_fields = schedule_next_check(self, result['status'], self.last_check_attempt)
+        self.last_confirmed_at = self.last_check_attempt
+
+        if save_result:
+            self._observe_transition(result)
+            fields_to_update = [
+                'last_check_attempt',
+                'connectivity_error',
+                'connectivity_details'
+            ] + METRIC_FIELDS + schedule_fields + TRANSITION_FIELDS
+
+            if result['status'] == 'online':
+                fields_to_update.append('last_connectivity')
+
+            self._save_probe_result(fields_to_update)
+            self._record_history(result)
+
+        return result
+
+    def check_connectivity(self, save_result=True):
+        """
+        Check if the target is online using both port checks and ping based on the utils module.
+        Updates the status fields and returns the detailed result dictionary.
+
+        Parameters:
+        - save_result: Whether to save the result to the database
+
+        Returns:
+        - Dictionary with detailed connectivity information
+        """
+        # Probe each target at most once per request or sweep (see deviceApp/probememo.py)
+        memoized = memoized_result(self)
+        if memoized is not None:
+            return memoized
+
+        load_deferred_heartbeats([self])
+        invalid_result = self._begin_connectivity_check(save_result)
+        if invalid_result:
+            return remember_result(self, invalid_result)
+
+        # Check if host machine has internet connectivity
+        if not check_internet_connectivity():
+            return remember_result(self, self._no_internet_result(save_result))
+
+        # Use the enhanced connectivity check function from utils
+        result = check_device_connectivity_with_params(**self.get_probe_params())
+
+        return remember_result(self, self.apply_connectivity_result(result, save_result))
+
+    def apply_derived_status(self, cause, error, save_result=True, **extra):
+        """
+        Record an offline status inferred from something upstream of the target
+        (e.g. its whole subnet or its access point being unreachable) without
+        probing it.
+
+        Parameters:
+        - cause: Short machine-readable reason, stored in the result as 'cause'
+        - error: Human-readable error message
+        - extra: Additional keys stored in the result
+
+        Returns:
+        - The derived result dictionary
+        """
+        self.last_check_attempt = now()
+        result = {
+            'ip': self.ip_address,
+            'status': 'offline',
+            'timestamp': datetime.now().isoformat(),
+            'device_type': self.type,
+            'error': error,
+            'cause': cause,
+            'port_check': None,
+            'ping_check': None,
+            **extra
+        }
+        return remember_result(self, self.apply_connectivity_result(result, save_result))
+
+    @classmethod
+    def check_connectivity_many(cls, devices, save_result=True, concurrency=None, max_start_delay=0):
+        """
+        Check many devices or routers concurrently on the asyncio probe engine.
+
+        Parameters:
+        - devices: Iterable of instances of this model
+        - save_result: Whether to save each result to the database
+        - concurrency: Maximum number of probes in flight (defaults to settings)
+        - max_start_delay: Sweeps only: in spread mode, start each probe at the
+          target's due time if that is at most this many seconds away
+          (see deviceApp/scheduling.py); by default every probe starts now
+
+        Returns:
+        - List of (device, result dictionary) tuples in input order
+        """
+        devices = list(devices)
+        results = {}
+        to_probe = []
+        repeated = []
+
+        # Write probe state and history back once for the whole batch,
+        # probing each target at most once (see deviceApp/probememo.py)
+        from .writeback import probe_write_batch
+        with probe_write_batch(), probe_memo():
+            load_deferred_heartbeats(devices)
+            seen = set()
+            for device in devices:
+                memoized = memoized_result(device)
+                if memoized is not None:
+                    results[id(device)] = memoized
+                elif device.pk in seen:
+                    repeated.append(device)
+                else:
+                    seen.add(device.pk)
+                    invalid_result = device._begin_connectivity_check(save_result)
+                    if invalid_result:
+                        results[id(device)] = remember_result(device, invalid_result)
+                    else:
+                        to_probe.append(device)
+
+            # Check the host uplink once for the whole batch
+            if to_probe and not check_internet_connectivity():
+                for device in to_probe:
+                    results[id(device)] = remember_result(device, device._no_internet_result(save_result))
+                to_probe = []
+
+            # Spread-mode schedules start each probe at its own due time
+            current_time = now()
+            targets = [
+                {**device.get_probe_params(), 'start_delay': start_delay(device, current_time, max_start_delay)}
+                for device in to_probe
+            ]
+            probe_results = run_probes(targets, concurrency)
+            for device, result in zip(to_probe, probe_results):
+                results[id(device)] = remember_result(device, device.apply_connectivity_result(result, save_result))
+
+            # The same target listed twice shares the first instance's result
+            for device in repeated:
+                results[id(device)] = memoized_result(device)
+
+        return [(device, results[id(device)]) for device in devices]
+
+    def get_connectivity_metrics(self):
+        """
+        Returns consolidated connectivity metrics based on the latest check
+        """
+        metrics = {
+            'status': self.stored_status(),
+            'last_check': self.last_check_attempt,
+            'last_online': self.last_connectivity,
+            'error': self.connectivity_error
+        }
+
+        # Ping metrics, when the latest check pinged
+        if self.latency_ms is not None or self.packet_loss is not None:
+            metrics.update({
+                'latency_ms': self.latency_ms,
+                'packet_loss': self.packet_loss
+            })
+
+        # Port check metrics, when the latest check scanned ports
+        if self.ports_checked is not None:
+            metrics.update({
+                'ports_checked': self.ports_checked,
+                'ports_open': self.ports_open,
+                'open_ports': self.open_ports
+            })
+
+        return metrics
+
+    @classmethod
+    def summarize_checks(cls, devices, describe):
+        """
+        Check a queryset of targets and summarize the results, for
+        bulk_check_devices()
+
+        Parameters:
+        - devices: Queryset of instances of this model
+        - describe: Function returning extra detail fields for one target
+
+        Returns:
+        - Dictionary with summary and individual device results
+        """
+        results = {
+            'timestamp': datetime.now().isoformat(),
+            'total_devices': devices.count(),
+            'online_count': 0,
+            'offline_count': 0,
+            'error_count': 0,
+            'details': {}
+        }
+
+        for device, device_result in cls.check_connectivity_many(devices):
+            # Update counts
+            if device_result['status'] == 'online':
+                results['online_count'] += 1
+            elif device_result['status'] == 'offline':
+                results['offline_count'] += 1
+            else:
+                results['error_count'] += 1
+
+            # Store detailed result
+            results['details'][device.id] = {
+                'name': device.name,
+                'ip': device.ip_address,
+                'type': device.type,
+                'status': device_result['status'],
+                'error': device_result.get('error'),
+                **describe(device)
+            }
+
+            # Add latency if available
+            ping_data = device_result.get('ping_check', {})
+            if ping_data and ping_data.get('latency_ms') is not None:
+                results['details'][device.id]['latency_ms'] = ping_data['latency_ms']
+
+        # Calculate summary statistics for online devices
+        online_devices = [details for _, details in results['details'].items()
+                         if details['status'] == 'online' and 'latency_ms' in details]
+
+        if online_devices:
+            latencies = [device['latency_ms'] for device in online_devices]
+            results['avg_latency_ms'] = sum(latencies) / len(latencies)
+            results['min_latency_ms'] = min(latencies)
+            results['max_latency_ms'] = max(latencies)
+
+        return results
@@ -1,38 +1,144 @@
 # deviceApp/tasks.py
 import datetime
-from celery import shared_task
+import time
+from celery import chord, current_app, shared_task
 from django.utils.timezone import now
-from .models import Device, check_device_internet_connectivity
+from .models import Device
+from django.conf import settings
+from .utils import check_device_internet_connectivity, is_valid_ipv4
+from .scheduling import due_queryset, fleet_probe_rate, spread_lookahead, start_delay
+from .cycles import (
+    SweepLock, cycle_time_left, fail_cycle, finish_cycle, get_sweep_budget,
+    record_chunk_progress, start_cycle
+)
+from .history import ensure_partitions
+from .retention import apply_retention
+from .probememo import probe_memo
+from .writeback import probe_write_batch
+from .writepolicy import load_deferred_heartbeats
+from .sharding import get_chunk_size, merge_sweep_results, record_chunk_duration, shard_devices
 import logging
 
 logger = logging.getLogger(__name__)
 
-@shared_task
-def check_all_devices_connectivity():
+UPSTREAM_UNREACHABLE = 'upstream_unreachable'
+
+
+def group_devices_by_network(devices):
     """
-    Background task to check connectivity for all devices
-    and update their last_connectivity timestamps
+    Group devices by /24 network (first three octets).
+    Devices with unusual IP formats or none at all go into the 'others'
+    group, where the check records their error and schedules their next
+    check like any other probe, so they do not stay due forever.
     """
-    devices = Device.objects.all()
-    results = {
-        'total': devices.count(),
-        'online': 0,
-        'offline': 0,
-        'errors': 0
-    }
-    
+    network_groups = {}
     for device in devices:
-        try:
-            if device.check_connectivity():
-                results['online'] += 1
-            else:
-                results['offline'] += 1
-        except Exception as e:
-            results['errors'] += 1
-            logger.error(f"Error checking connectivity for device {device.id} ({device.name}): {str(e)}")
-    
-    logger.info(f"Completed connectivity check: {results}")
-    return results
+        # Extract network part (first 3 octets for simple grouping)
+        if device.ip_address and is_valid_ipv4(device.ip_address):
+            network = '.'.join(device.ip_address.split('.')[:3])
+        else:
+            # Fallback for unusual IP formats
+            network = 'others'
+        network_groups.setdefault(network, []).append(device)
+    return network_groups
+
+
+def derived_streak(device):
+    """
+    Sweeps in a row the device was marked unreachable via upstream instead
+    of being probed (0 if its latest result came from a real probe)
+    """
+    details = device.connectivity_details or {}
+    if details.get('cause') != UPSTREAM_UNREACHABLE:
+        return 0
+    return details.get('derived_streak', 1)
+
+
+def pick_subnet_sample(network_devices, sample_size):
+    """
+    Choose which devices represent a subnet: devices that were online at
+    their last probe first, since they are the best evidence the subnet is
+    reachable, then the devices only inferred unreachable for the most
+    sweeps, so the sample rotates through the subnet instead of probing the
+    same possibly dead devices every time. Ties go to the gateway (.1), then
+    access points.
+    """
+    def priority(device):
+        is_gateway = device.ip_address.endswith('.1')
+        return (device.last_status != 'online', -derived_streak(device),
+                not is_gateway, device.type != 'access_point')
+
+    return sorted(network_devices, key=priority)[:sample_size]
+
+
+def probe_network_groups(network_groups, max_start_delay=0):
+    """
+    Probe devices subnet by subnet.
+
+    A sample of each /24 (CONNECTIVITY_SUBNET_SAMPLE_SIZE devices, see
+    pick_subnet_sample()) is probed first. When every sampled device in a
+    subnet is offline the subnet is treated as cut off upstream and its
+    remaining devices are marked offline with cause 'upstream_unreachable'
+    instead of each waiting out its own timeouts. A device already marked so
+    for CONNECTIVITY_SUBNET_DERIVE_LIMIT sweeps in a row is probed anyway, so
+    the mark always clears eventually. Devices in subnets that look healthy
+    are then probed individually.
+
+    All probes within a phase run concurrently, each starting at its
+    spread-mode due time if that is at most max_start_delay seconds away.
+    The second phase's delays are shortened by the time the first one took,
+    so it still finishes within the same budget.
+
+    Returns a list of (device, result dictionary) tuples.
+    """
+    sample_size = getattr(settings, 'CONNECTIVITY_SUBNET_SAMPLE_SIZE', 2)
+    derive_limit = getattr(settings, 'CONNECTIVITY_SUBNET_DERIVE_LIMIT', 3)
+
+    samples = {}
+    for network, network_devices in network_groups.items():
+        if network == 'others' or len(network_devices) <= sample_size:
+            samples[network] = network_devices
+        else:
+            samples[network] = pick_subnet_sample(network_devices, sample_size)
+
+    started = time.monotonic()
+    sample_results = Device.check_connectivity_many(
+        [device for sample in samples.values() for device in sample], max_start_delay=max_start_delay
+    )
+    sample_statuses = {device.id: result.get('status') for device, result in sample_results}
+
+    remaining = []
+    derived_results = []
+    for network, network_devices in network_groups.items():
+        unchecked = [device for device in network_devices if device.id not in sample_statuses]
+        if not unchecked:
+            continue
+
+        statuses = {sample_statuses[device.id] for device in samples[network]}
+        if statuses != {'offline'}:
+            remaining.extend(unchecked)
+            continue
+
+        # Devices inferred unreachable for too long get a real probe
+        overdue = [device for device in unchecked if derived_streak(device) >= derive_limit]
+        remaining.extend(overdue)
+        unchecked = [device for device in unchecked if derived_streak(device) < derive_limit]
+
+        logger.warning(f"Network {network}.0/24 looks unreachable, skipping {len(unchecked)} devices")
+        for device in unchecked:
+            derived_results.append((device, device.apply_derived_status(
+                UPSTREAM_UNREACHABLE,
+                f"Unreachable via upstream: {network}.0/24 did not respond",
+                subnet=f"{network}.0/24",
+                sampled_devices=[sampled.id for sampled in samples[network]],
+                derived_streak=derived_streak(device) + 1
+            )))
+
+    remaining_delay = max(0.0, max_start_delay - (time.monotonic() - started))
+    return sample_results + Device.check_connectivity_many(
+        remaining, max_start_delay=remaining_delay
+    ) + derived_results
+
 
 @shared_task
 def check_device_connectivity_by_id(device_id):
@@ -41,11 +147,11 @@ def check_device_connectivity_by_id(device_id):
     """
     try:
         device = Device.objects.get(id=device_id)
-        is_online = device.check_connectivity()
+        result = device.check_connectivity()
         return {
             'device_id': device_id,
             'device_name': device.name,
-            'status': 'online' if is_online else 'offline',
+            'status': result.get('status', 'offline'),
             'last_connectivity': device.last_connectivity.isoformat() if device.last_connectivity else None
         }
     except Device.DoesNotExist:
@@ -57,96 +163,266 @@ def check_device_connectivity_by_id(device_id):
 
 
 
-
-
-
-@shared_task
-def check_all_devices_connectivity():
+def sweep_devices(devices, max_start_delay=0):
     """
-    Background task to check connectivity for all devices
-    and update their last_connectivity timestamps
-    
-    Intelligently groups devices by network to optimize checks
+    Probe a list of devices and classify the results.
+    Used for every chunk of a sweep (see check_devices_chunk).
+    max_start_delay bounds how long a spread-mode probe may wait for its
+    due time (see deviceApp/scheduling.py).
+
+    Returns a summary dictionary with counts and status change details.
+    The details are the raw changes seen in this sweep; confirmed transitions
+    are stored as StatusTransitionEvent rows (see deviceApp/transitions.py).
     """
-    # First check if the host has internet connectivity
-    if not check_device_internet_connectivity():
-        logger.warning("Host machine has no internet connection, skipping device checks")
-        return {
-            'status': 'error',
-            'message': 'Host machine has no internet connection',
-            'total': 0
-        }
-    
-    devices = Device.objects.all()
     results = {
-        'total': devices.count(),
+        'total': len(devices),
         'online': 0,
         'offline': 0,
         'errors': 0,
         'no_internet': 0,
+        'upstream_unreachable': 0,
         'details': []
     }
-    
+
+    # Pick up the schedules cached since the last heartbeat (see writepolicy.py)
+    load_deferred_heartbeats(devices)
+
     # Group devices by network to optimize checks
     # (devices on same subnet likely share connectivity status)
-    network_groups = {}
-    for device in devices:
-        if not device.ip_address:
-            continue
-        
-        # Extract network part (first 3 octets for simple grouping)
-        try:
-            network = '.'.join(device.ip_address.split('.')[:3])
-            if network not in network_groups:
-                network_groups[network] = []
-            network_groups[network].append(device)
-        except:
-            # Fallback for unusual IP formats
-            network_groups.setdefault('others', []).append(device)
-    
-    # Process each network group
+    network_groups = group_devices_by_network(devices)
+
+    # Remember each device's status before this sweep overwrites it
+    previous_statuses = {}
     for network, network_devices in network_groups.items():
         logger.info(f"Checking {len(network_devices)} devices on network {network}")
-        
+
         for device in network_devices:
-            try:
-                previous_status = 'online' if device.last_connectivity and (
-                    device.last_connectivity >= device.last_check_attempt) else 'offline'
-                
-                if device.check_connectivity():
-                    results['online'] += 1
-                    status = 'online'
+            previous_statuses[device.id] = device.last_status or ('online' if device.last_connectivity and device.last_check_attempt and (
+                device.last_connectivity >= device.last_check_attempt) else 'offline')
+
+    # Probe a sample of each subnet first, then the rest of the healthy subnets
+    for device, result in probe_network_groups(network_groups, max_start_delay):
+        try:
+            if result.get('status') == 'unknown':
+                raise RuntimeError(result.get('error') or 'Unknown connectivity status')
+
+            previous_status = previous_statuses[device.id]
+
+            if result.get('status') == 'online':
+                results['online'] += 1
+                status = 'online'
+            elif result.get('cause') == UPSTREAM_UNREACHABLE:
+                results['offline'] += 1
+                results['upstream_unreachable'] += 1
+                status = 'offline'
+            else:
+                if device.connectivity_error and 'reachable but has no internet' in device.connectivity_error:
+                    results['no_internet'] += 1
+                    status = 'no_internet'
                 else:
-                    if device.connectivity_error and 'reachable but has no internet' in device.connectivity_error:
-                        results['no_internet'] += 1
-                        status = 'no_internet'
-                    else:
-                        results['offline'] += 1
-                        status = 'offline'
-                
-                # Record status change events
-                if previous_status != status:
-                    results['details'].append({
-                        'device_id': device.id,
-                        'name': device.name,
-                        'previous': previous_status,
-                        'current': status,
-                        'timestamp': datetime.now().isoformat()
-                    })
-                    
-                    logger.info(f"Device {device.name} ({device.ip_address}) changed from {previous_status} to {status}")
-                    
-                    # Possibly send notification here for status changes
-                    
-            except Exception as e:
-                results['errors'] += 1
-                logger.error(f"Error checking connectivity for device {device.id} ({device.name}): {str(e)}")
+                    results['offline'] += 1
+                    status = 'offline'
+
+            # Record status change events
+            if previous_status != status:
                 results['details'].append({
-                    'device_id': device.id, 
+                    'device_id': device.id,
                     'name': device.name,
-                    'error': str(e)
+                    'previous': previous_status,
+                    'current': status,
+                    'timestamp': datetime.datetime.now().isoformat()
                 })
-    
-    logger.info(f"Completed connectivity check: {results['online']} online, {results['offline']} offline, " 
-                f"{results['no_internet']} no internet, {results['errors']} errors")
-    return results
\ No newline at end of file
+
+                logger.info(f"Device {device.name} ({device.ip_address}) changed from {previous_status} to {status}")
+
+                # Possibly send notification here for status changes
+
+        except Exception as e:
+            results['errors'] += 1
+            logger.error(f"Error checking connectivity for device {device.id} ({device.name}): {str(e)}")
+            results['details'].append({
+                'device_id': device.id,
+                'name': device.name,
+                'error': str(e)
+            })
+
+    return results
+
+
+@shared_task
+def check_devices_chunk(device_ids, cycle_id=None):
+    """
+    Background task to check one chunk of a sweep.
+
+    Parameters:
+    - device_ids: IDs of the devices in the chunk (whole /24 subnets, see sharding.py)
+    - cycle_id: SweepCycle the chunk belongs to; once its budget is spent the
+      chunk is skipped and its devices are carried over to the next cycle
+
+    Records how long the chunk spent probing so later sweeps can adapt the
+    chunk size; time spent waiting for spread-mode due times does not count.
+    A chunk that fails is counted as errors rather than raising, so the rest
+    of the sweep is still aggregated and the sweep lock released.
+    """
+    time_left = cycle_time_left(cycle_id)
+    if time_left is not None and time_left <= 0:
+        return merge_sweep_results([{'carried_over': len(device_ids)}])
+
+    started = time.monotonic()
+    # Spread-mode probes may wait for their due time, but must finish within the cycle
+    max_start_delay = spread_lookahead(get_sweep_budget() if time_left is None else time_left)
+    try:
+        devices = list(Device.objects.select_related('school', 'probe_state').filter(id__in=device_ids))
+        # Probes start concurrently, so the longest wait is what the chunk spends idle
+        current_time = now()
+        waited = max((start_delay(device, current_time, max_start_delay) for device in devices), default=0)
+        # Write the chunk's probe state and history back in one transaction,
+        # probing each device at most once
+        with probe_write_batch(), probe_memo():
+            results = sweep_devices(devices, max_start_delay)
+    except Exception as e:
+        logger.exception(f"Error checking chunk of {len(device_ids)} devices")
+        record_chunk_progress(cycle_id, 0)
+        return {'total': len(device_ids), 'errors': len(device_ids), 'details': [{'error': str(e)}]}
+
+    elapsed = time.monotonic() - started
+    chunk_size = record_chunk_duration(len(device_ids), max(elapsed - waited, 0))
+    record_chunk_progress(cycle_id, len(devices))
+    logger.info(f"Checked chunk of {len(device_ids)} devices in {elapsed:.1f}s "
+                f"({waited:.1f}s waiting for due times), next chunk size {chunk_size}")
+    return results
+
+
+@shared_task
+def abort_device_sweep(request, exc, traceback, cycle_id=None, lock_token=None):
+    """
+    Error callback of the sweep chord, called when a chunk task dies (e.g.
+    its worker is lost): closes the sweep cycle and releases the sweep lock,
+    which aggregate_sweep_results would otherwise have done
+    """
+    try:
+        fail_cycle(cycle_id, exc)
+    finally:
+        SweepLock('devices').release(lock_token)
+
+
+@shared_task
+def aggregate_sweep_results(chunk_results, cycle_id=None, lock_token=None):
+    """
+    Background task combining the results of every chunk of a sweep into one
+    summary, then closing the sweep cycle and releasing the sweep lock
+    """
+    try:
+        results = merge_sweep_results(chunk_results)
+        results['expected_probes_per_minute'] = fleet_probe_rate(Device.objects.all())
+        finish_cycle(cycle_id, results)
+    finally:
+        SweepLock('devices').release(lock_token)
+
+    logger.info(f"Completed connectivity check: {results['online']} online, {results['offline']} offline "
+                f"({results['upstream_unreachable']} via upstream), "
+                f"{results['no_internet']} no internet, {results['errors']} errors "
+                f"in {results['chunks']} chunks, {results['carried_over']} carried over; "
+                f"steady-state rate {results['expected_probes_per_minute']} probes/min")
+    return results
+
+
+def use_sweep_fanout():
+    """
+    Whether sweep chunks are sent to Celery workers. Needs a result backend
+    so the chunk results can be aggregated.
+    """
+    return getattr(settings, 'CONNECTIVITY_SWEEP_FANOUT', True) and bool(current_app.conf.result_backend)
+
+
+@shared_task
+def check_all_devices_connectivity():
+    """
+    Background task to check connectivity for all devices that are due
+    and update their last_connectivity timestamps
+
+    Each device has its own adaptive probe interval (see scheduling.py):
+    stable devices are probed less often, devices that recently changed
+    status more often, and at most CONNECTIVITY_MAX_PROBES_PER_CYCLE
+    devices are probed per run.
+
+    Only one device sweep runs at a time, and each cycle has a time budget
+    after which the remaining devices are carried over (see cycles.py).
+
+    Due devices are split by /24 network into chunks (see sharding.py).
+    With a result backend configured the chunks run in parallel on the
+    Celery workers and aggregate_sweep_results combines them; otherwise
+    they run one after another in this task. Within a chunk all devices
+    are probed concurrently on the asyncio probe engine.
+    """
+    # First check if the host has internet connectivity
+    if not check_device_internet_connectivity():
+        logger.warning("Host machine has no internet connection, skipping device checks")
+        return {
+            'status': 'error',
+            'message': 'Host machine has no internet connection',
+            'total': 0
+        }
+
+    # Never run two device sweeps at once
+    lock = SweepLock('devices')
+    lock_token = lock.acquire()
+    if lock_token is None:
+        logger.warning("Previous device sweep is still running, skipping this one")
+        return {
+            'status': 'skipped',
+            'message': 'Previous device sweep is still running',
+            'total': 0
+        }
+
+    try:
+        # Only probe devices whose adaptive interval has elapsed, longest-waiting first.
+        # Parallel chunks also take devices falling due while they run; chunks run
+        # one after another only take devices already due, so none of them waits
+        fanout = use_sweep_fanout()
+        lookahead = spread_lookahead(get_sweep_budget()) if fanout else 0
+        due_devices = due_queryset(Device.objects.all(), lookahead=lookahead).values_list('id', 'ip_address')
+        chunks = shard_devices(due_devices, get_chunk_size())
+        cycle = start_cycle('devices', sum(len(chunk) for chunk in chunks), len(chunks))
+
+        if fanout and len(chunks) > 1:
+            chord(check_devices_chunk.s(chunk, cycle.id) for chunk in chunks)(
+                aggregate_sweep_results.s(cycle.id, lock_token).on_error(
+                    abort_device_sweep.s(cycle_id=cycle.id, lock_token=lock_token)
+                )
+            )
+            logger.info(f"Dispatched {cycle.due_count} devices in {len(chunks)} chunks")
+            return {
+                'status': 'dispatched',
+                'cycle_id': cycle.id,
+                'total': cycle.due_count,
+                'chunks': len(chunks)
+            }
+
+        return aggregate_sweep_results(
+            [check_devices_chunk(chunk, cycle.id) for chunk in chunks], cycle.id, lock_token
+        )
+    except Exception:
+        lock.release(lock_token)
+        raise
+
+
+@shared_task
+def ensure_probe_history_partitions():
+    """
+    Background task creating the probe history partitions for the coming
+    months ahead of time (PostgreSQL only, see history.py)
+    """
+    created = ensure_partitions()
+    if created:
+        logger.info(f"Created probe history partitions: {', '.join(created)}")
+    return created
+
+
+@shared_task
+def apply_probe_data_retention():
+    """
+    Archive and remove probe data past its retention tier (see deviceApp/retention.py).
+    Scheduled at night; stops by itself when business hours begin.
+    """
+    return apply_retention()
@@ -1,3 +1,1047 @@
-from django.test import TestCase
+import asyncio
+import errno
+import gzip
+import importlib
+import json
+import os
+import socket
+import struct
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone
+from itertools import product
+from unittest import mock
+
+from django.apps import apps as django_apps
+from django.core.cache import cache
+from django.db import connection
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils.timezone import now
+from rest_framework.test import APIClient
+
+from schoolApp.models import School
+from userApp.models import CustomUser
+from .cycles import SweepLock, start_cycle
+from .icmp import AsyncPinger, IcmpUnavailable, _open_socket, build_echo_request, icmp_checksum, parse_echo_reply
+from .models import ConnectivityRollup, Device, DeviceProbeState, ProbeResult, StatusInterval, StatusTransitionEvent, SweepCycle
+from .probememo import ProbeMemoMiddleware
+from .probes import async_check_port_connectivity, async_run_probes
+from .ratelimit import TokenBucket
+from . import history, rollups
+from .retention import RetentionRun, apply_retention, archive_partition, get_retention_days, prune_rows
+from .scheduling import due_queryset, get_probe_allowance, spread_lookahead, start_delay
+from .serializers import DeviceSerializer
+from .tasks import abort_device_sweep, check_all_devices_connectivity, check_devices_chunk, probe_network_groups
+from .transitions import observe_status
+from .uplink import UplinkMonitor
+from .writepolicy import load_deferred_heartbeats
 
 # Create your tests here.
+
+
+@override_settings(ALLOWED_HOSTS=['testserver'],
+                   PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class DeviceAPITestCase(TestCase):
+    """Authenticated API client and device fixtures"""
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user('Test', 'User', '0700000000', 'admin', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_devices(self, count):
+        for index in range(count):
+            # Each device gets its own school and creator so nothing is shared between rows
+            creator = CustomUser.objects.create_user('Owner', str(index), f'08{index:08d}', 'admin', password='secret')
+            school = School.objects.create(index_number=f'S{index}', name=f'School {index}',
+                                           province='Kigali', district='Gasabo', created_by=creator)
+            device = Device.objects.create(name=f'Device {index}', mac_address=f'00:00:00:00:{index // 256:02X}:{index % 256:02X}',
+                                           ip_address=f'10.0.{index // 256}.{index % 256}', type='access_point',
+                                           school=school, created_by=creator)
+            if index % 2:
+                DeviceProbeState.objects.create(target=device, last_status='online', probe_interval=180)
+
+
+class DeviceListQueryCountTests(DeviceAPITestCase):
+    """The device endpoints must not issue queries per listed device"""
+
+    def assert_list_queries(self, count):
+        self.create_devices(count)
+        with self.assertNumQueries(1):
+            response = self.client.get('/device/devices/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), count)
+
+    def test_list_with_one_device(self):
+        self.assert_list_queries(1)
+
+    def test_list_with_many_devices(self):
+        self.assert_list_queries(25)
+
+    def refresh_queries(self, count):
+        """Queries issued by a ?refresh=true list of `count` devices with the probes faked"""
+        School.objects.all().delete()
+        CustomUser.objects.exclude(id=self.user.id).delete()
+        self.create_devices(count)
+        with mock.patch('deviceApp.state.run_probes',
+                        side_effect=lambda targets, concurrency=None: [{'status': 'online'} for _ in targets]), \
+                mock.patch('deviceApp.state.check_internet_connectivity', return_value=True), \
+                CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/device/devices/?refresh=true')
+        self.assertEqual(len(response.json()['results']), count)
+        return len(queries)
+
+    def test_refresh_does_not_query_per_device(self):
+        self.assertEqual(self.refresh_queries(1), self.refresh_queries(10))
+
+    def test_detail(self):
+        self.create_devices(2)
+        device = Device.objects.latest('id')
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/device/{device.id}/')
+        self.assertEqual(response.json()['status'], 'online')
+
+
+@override_settings(API_PAGE_SIZE=10, API_MAX_PAGE_SIZE=20)
+class DeviceListPaginationTests(DeviceAPITestCase):
+    """The device list is served in cursor pages, newest first"""
+
+    def test_pages_cover_every_device_once(self):
+        self.create_devices(25)
+        seen, url = [], '/device/devices/'
+        while url:
+            with self.assertNumQueries(1):
+                page = self.client.get(url).json()
+            self.assertLessEqual(len(page['results']), 10)
+            seen += [device['id'] for device in page['results']]
+            url = page['next']
+        self.assertEqual(seen, list(Device.objects.order_by('-id').values_list('id', flat=True)))
+
+    def test_previous_page(self):
+        self.create_devices(25)
+        first = self.client.get('/device/devices/').json()
+        self.assertIsNone(first['previous'])
+        second = self.client.get(first['next']).json()
+        self.assertEqual(self.client.get(second['previous']).json()['results'], first['results'])
+
+    def test_page_size_is_capped(self):
+        self.create_devices(25)
+        self.assertEqual(len(self.client.get('/device/devices/?page_size=5').json()['results']), 5)
+        self.assertEqual(len(self.client.get('/device/devices/?page_size=1000').json()['results']), 20)
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get('/device/devices/?cursor=bogus').status_code, 404)
+
+
+class DeviceListFilterTests(DeviceAPITestCase):
+    """The device list filters in the database, status by the stored probe state"""
+
+    def test_status_filter_matches_stored_status(self):
+        self.create_devices(1)
+        school, creator = School.objects.get(), CustomUser.objects.latest('id')
+        checked_at = now()
+        combinations = product(
+            [None, 'online', 'offline', 'unknown'],
+            [None, checked_at],
+            [None, checked_at - timedelta(minutes=5), checked_at],
+            [None, 'Device is reachable but has no internet access', 'Timed out']
+        )
+        for index, (last_status, last_check_attempt, last_connectivity, error) in enumerate(combinations):
+            device = Device.objects.create(name=f'Probed {index}', mac_address=f'00:00:00:02:00:{index:02X}',
+                                           ip_address=f'10.2.0.{index}', type='router', school=school,
+                                           created_by=creator)
+            DeviceProbeState.objects.create(target=device, last_status=last_status, connectivity_error=error,
+                                            last_check_attempt=last_check_attempt,
+                                            last_connectivity=last_connectivity)
+
+        devices = Device.objects.select_related('probe_state')
+        for status in ['online', 'no_internet', 'offline', 'unknown']:
+            expected = {device.id for device in devices if device.stored_status() == status}
+            matched = set(devices.filter(Device.stored_status_filter(status)).values_list('id', flat=True))
+            self.assertEqual(matched, expected, status)
+
+    def test_filters(self):
+        self.create_devices(6)
+        school = School.objects.get(index_number='S2')
+        school.province, school.district = 'Northern', 'Musanze'
+        school.save()
+        Device.objects.filter(school__index_number='S3').update(type='router')
+
+        def listed(query):
+            with self.assertNumQueries(1):
+                response = self.client.get(f'/device/devices/?{query}')
+            return sorted(device['name'] for device in response.json()['results'])
+
+        self.assertEqual(listed('province=Northern'), ['Device 2'])
+        self.assertEqual(listed('province=Kigali&district=Musanze'), [])
+        self.assertEqual(listed(f'school={school.id}'), ['Device 2'])
+        self.assertEqual(listed('type=router'), ['Device 3'])
+        self.assertEqual(listed('status=online'), ['Device 1', 'Device 3', 'Device 5'])
+        self.assertEqual(listed('status=unknown&type=access_point'), ['Device 0', 'Device 2', 'Device 4'])
+
+    def test_invalid_filters(self):
+        self.assertEqual(self.client.get('/device/devices/?school=abc').status_code, 400)
+        self.assertEqual(self.client.get('/device/devices/?status=sleeping').status_code, 400)
+
+
+@override_settings(API_PAGE_SIZE=10)
+class DeviceSummaryTests(DeviceAPITestCase):
+    """The dashboard summary counts every device, not one list page"""
+
+    def test_summary_covers_the_whole_fleet(self):
+        self.create_devices(25)
+        Device.objects.filter(name__in=['Device 0', 'Device 2']).update(type='router')
+        DeviceProbeState.objects.create(target=Device.objects.get(name='Device 4'), last_status='offline',
+                                        last_check_attempt=now())
+        Device.objects.filter(name='Device 6').update(created_at=datetime(2020, 1, 15, tzinfo=timezone.utc))
+
+        with self.assertNumQueries(3):
+            summary = self.client.get('/device/summary/').json()
+
+        devices = Device.objects.select_related('probe_state')
+        self.assertEqual(summary['total'], 25)
+        self.assertEqual(summary['by_status'], {
+            status: sum(device.stored_status() == status for device in devices)
+            for status in ['online', 'no_internet', 'offline', 'unknown']
+        })
+        self.assertEqual(summary['by_status']['online'], 12)
+        self.assertEqual(summary['by_status']['offline'], 1)
+        self.assertEqual(summary['by_type'], {'access_point': 23, 'router': 2})
+        self.assertEqual(summary['by_month'], [
+            {'month': '2020-01', 'total': 1, 'online': 0},
+            {'month': now().strftime('%Y-%m'), 'total': 24, 'online': 12},
+        ])
+
+
+@override_settings(CONNECTIVITY_SCHEDULER_MODE='spread', CONNECTIVITY_SWEEP_TICK=60,
+                   CONNECTIVITY_SWEEP_BUDGET_SECONDS=50)
+class SpreadSweepTests(DeviceAPITestCase):
+    """Spread-mode sweeps never wait past their budget"""
+
+    # Worst case of a default probe: three 3-echo ping attempts of
+    # 5 s timeout + 5 s subprocess grace, with 1 s pauses between them
+    DEFAULT_ALLOWANCE = 32
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.create_devices(3)
+        current_time = now()
+        # Due now, in 5 s and in 25 s
+        for device, seconds in zip(Device.objects.order_by('id'), [0, 5, 25]):
+            DeviceProbeState.objects.update_or_create(target=device, defaults={
+                'next_check_due': current_time + timedelta(seconds=seconds), 'probe_interval': 180
+            })
+
+    def test_allowance_covers_the_worst_case_probe(self):
+        self.assertEqual(get_probe_allowance(), self.DEFAULT_ALLOWANCE)
+        device = Device.objects.order_by('id')[0]
+        device.check_ports, device.ping_count, device.timeout, device.retry_count = '80,443', 1, 2, 0
+        # One shared port timeout, then one ping attempt
+        self.assertEqual(get_probe_allowance(device), 2 + 2 + 5)
+
+    def test_lookahead_leaves_room_to_probe(self):
+        self.assertEqual(spread_lookahead(50), 50 - self.DEFAULT_ALLOWANCE)
+        self.assertEqual(spread_lookahead(100), 60 - self.DEFAULT_ALLOWANCE)
+        self.assertEqual(spread_lookahead(20), 0)
+        with override_settings(CONNECTIVITY_SCHEDULER_MODE='adaptive'):
+            self.assertEqual(spread_lookahead(50), 0)
+
+    def test_due_queryset_lookahead(self):
+        self.assertEqual(len(due_queryset(Device.objects.all())), 1)
+        self.assertEqual(len(due_queryset(Device.objects.all(), lookahead=10)), 2)
+
+    def test_start_delay_is_opt_in_and_capped(self):
+        device = Device.objects.select_related('probe_state').order_by('id')[2]
+        self.assertEqual(start_delay(device), 0)
+        self.assertEqual(start_delay(device, max_delay=10), 10)
+
+        # A probe with more retries than the default starts earlier
+        device.retry_count = 3
+        self.assertEqual(start_delay(device, max_delay=18), 18 - 11)
+        device.retry_count = 5
+        self.assertEqual(start_delay(device, max_delay=18), 0)
+
+    def test_second_phase_waits_only_for_the_time_left(self):
+        devices = list(Device.objects.select_related('probe_state'))
+        online = lambda targets, max_start_delay=0: [(target, {'status': 'online'}) for target in targets]
+        with override_settings(CONNECTIVITY_SUBNET_SAMPLE_SIZE=1), \
+                mock.patch.object(Device, 'check_connectivity_many', side_effect=online) as check, \
+                mock.patch('deviceApp.tasks.time.monotonic', side_effect=[100, 115]):
+            probe_network_groups({'10.0.0': devices}, max_start_delay=18)
+        # The sample took 15 of the 18 seconds
+        self.assertEqual([call.kwargs['max_start_delay'] for call in check.call_args_list], [18, 3])
+
+    def probed_delays(self, run, wait=False):
+        delays = []
+
+        def fake_run_probes(targets, concurrency=None):
+            delays.extend(target['start_delay'] for target in targets)
+            if wait:
+                time.sleep(max(target['start_delay'] for target in targets))
+            return [{'status': 'online', 'ping_check': None, 'port_check': None} for _ in targets]
+
+        with mock.patch('deviceApp.state.run_probes', fake_run_probes), \
+                mock.patch('deviceApp.state.check_internet_connectivity', return_value=True), \
+                mock.patch('deviceApp.tasks.check_device_internet_connectivity', return_value=True):
+            run()
+        return delays
+
+    def test_serial_sweep_does_not_wait(self):
+        with mock.patch('deviceApp.tasks.use_sweep_fanout', return_value=False):
+            delays = self.probed_delays(check_all_devices_connectivity)
+        self.assertEqual(delays, [0])
+        self.assertFalse(SweepLock('devices').is_held())
+
+    def test_chunk_waits_at_most_until_its_budget(self):
+        cycle = start_cycle('devices', 3, 1)
+        ids = list(Device.objects.values_list('id', flat=True))
+        delays = self.probed_delays(lambda: check_devices_chunk(ids, cycle.id))
+        self.assertEqual(len(delays), 3)
+        self.assertLessEqual(max(delays), 50 - self.DEFAULT_ALLOWANCE)
+
+    @override_settings(CONNECTIVITY_SWEEP_BUDGET_SECONDS=33)
+    def test_chunk_size_ignores_waits(self):
+        cycle = start_cycle('devices', 3, 1)
+        ids = list(Device.objects.values_list('id', flat=True))
+        with mock.patch('deviceApp.tasks.record_chunk_duration', return_value=200) as record:
+            delays = self.probed_delays(lambda: check_devices_chunk(ids, cycle.id), wait=True)
+        size, seconds = record.call_args.args
+        self.assertEqual(size, 3)
+        self.assertGreater(max(delays), 0.9)
+        self.assertLess(seconds, 0.5)
+
+    def test_failed_chunk_is_counted_as_errors(self):
+        cycle = start_cycle('devices', 3, 1)
+        with mock.patch('deviceApp.tasks.sweep_devices', side_effect=RuntimeError('boom')):
+            result = check_devices_chunk([1, 2, 3], cycle.id)
+        self.assertEqual(result['errors'], 3)
+
+    def test_chord_error_callback_closes_cycle(self):
+        lock = SweepLock('devices')
+        token = lock.acquire()
+        cycle = start_cycle('devices', 3, 2)
+        abort_device_sweep(None, RuntimeError('worker lost'), None, cycle_id=cycle.id, lock_token=token)
+        self.assertFalse(lock.is_held())
+        self.assertEqual(SweepCycle.objects.get(id=cycle.id).status, 'failed')
+
+
+@override_settings(CONNECTIVITY_SCHEDULER_MODE='adaptive')
+class DeviceSweepTests(DeviceAPITestCase):
+    """Serial device sweeps pick up and reschedule every due device"""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.school = School.objects.create(index_number='S', name='School', province='Kigali',
+                                            district='Gasabo', created_by=self.user)
+
+    def create_device(self, ip_address, device_type='access_point'):
+        index = Device.objects.count()
+        return Device.objects.create(name=f'Device {index}', mac_address=f'00:00:00:00:01:{index:02X}',
+                                     ip_address=ip_address, type=device_type, school=self.school,
+                                     created_by=self.user)
+
+    def sweep(self, offline=()):
+        """Run a serial sweep; returns its summary and the IP addresses probed"""
+        probed = []
+
+        def fake_run_probes(targets, concurrency=None):
+            probed.extend(target['ip_address'] for target in targets)
+            return [{'status': 'offline' if target['ip_address'] in offline else 'online',
+                     'ping_check': None, 'port_check': None} for target in targets]
+
+        with mock.patch('deviceApp.state.run_probes', fake_run_probes), \
+                mock.patch('deviceApp.state.check_internet_connectivity', return_value=True), \
+                mock.patch('deviceApp.tasks.check_device_internet_connectivity', return_value=True), \
+                mock.patch('deviceApp.tasks.use_sweep_fanout', return_value=False):
+            results = check_all_devices_connectivity()
+        return results, probed
+
+    def test_device_without_ip_is_rescheduled(self):
+        device = self.create_device('')
+        self.create_device('10.0.0.1')
+        results, probed = self.sweep()
+        self.assertEqual((results['total'], results['online'], results['offline']), (2, 1, 1))
+        device = Device.objects.select_related('probe_state').get(id=device.id)
+        self.assertEqual(device.connectivity_error, 'No IP address configured')
+        self.assertGreater(device.next_check_due, now())
+
+        # Not due again, so it no longer takes a slot in the next sweep
+        results, probed = self.sweep()
+        self.assertEqual(results['total'], 0)
+
+    def sweep_again(self, offline=()):
+        """Make every device due again and sweep"""
+        DeviceProbeState.objects.update(next_check_due=None)
+        # Including the schedules of unchanged devices held in the cache (see writepolicy.py)
+        cache.clear()
+        return self.sweep(offline)
+
+    def test_dead_sample_does_not_hide_a_healthy_subnet(self):
+        self.create_device('10.9.9.1', 'router')
+        self.create_device('10.9.9.2')
+        for host in range(3, 7):
+            self.create_device(f'10.9.9.{host}', 'router')
+        dead = ['10.9.9.1', '10.9.9.2']
+
+        results, probed = self.sweep(dead)
+        self.assertEqual(sorted(probed), dead)
+        self.assertEqual(results['upstream_unreachable'], 4)
+
+        # The next sample is taken from the devices that were only inferred down
+        results, probed = self.sweep_again(dead)
+        self.assertEqual(len(probed), 6)
+        self.assertEqual((results['online'], results['upstream_unreachable']), (4, 0))
+
+        # Devices last seen online represent the subnet from then on
+        results, probed = self.sweep_again(dead)
+        self.assertEqual(len(probed), 6)
+        self.assertFalse(Device.objects.filter(probe_state__connectivity_details__cause='upstream_unreachable').exists())
+
+    @override_settings(CONNECTIVITY_SUBNET_SAMPLE_SIZE=1, CONNECTIVITY_SUBNET_DERIVE_LIMIT=1)
+    def test_derived_devices_are_probed_after_the_limit(self):
+        for host in range(1, 5):
+            self.create_device(f'10.9.9.{host}', 'router')
+        dead = [f'10.9.9.{host}' for host in range(1, 5)]
+
+        results, probed = self.sweep(dead)
+        self.assertEqual((probed, results['upstream_unreachable']), (['10.9.9.1'], 3))
+
+        # One of the derived devices is the sample, the others are past the limit
+        results, probed = self.sweep_again(dead)
+        self.assertEqual(sorted(probed), dead[1:])
+        self.assertEqual(results['upstream_unreachable'], 1)
+
+
+class ProbeWriteBackTests(DeviceAPITestCase):
+    """A batch of probes is written back in a fixed number of queries"""
+
+    def check_many(self, count, queries):
+        # One school, so the rollup buckets touched do not grow with the device count
+        school = School.objects.create(index_number='S', name='School', province='Kigali',
+                                       district='Gasabo', created_by=self.user)
+        for index in range(count):
+            Device.objects.create(name=f'Device {index}', mac_address=f'00:00:00:00:00:{index:02X}',
+                                  ip_address=f'10.0.0.{index + 1}', type='access_point',
+                                  school=school, created_by=self.user)
+        devices = list(Device.objects.select_related('school', 'probe_state'))
+        with mock.patch('deviceApp.state.run_probes',
+                        side_effect=lambda targets, concurrency=None: [
+                            {'status': 'online', 'ping_check': None, 'port_check': None} for _ in targets]), \
+                mock.patch('deviceApp.state.check_internet_connectivity', return_value=True), \
+                self.assertNumQueries(queries):
+            results = Device.check_connectivity_many(devices)
+        self.assertEqual([result['status'] for _, result in results], ['online'] * count)
+        self.assertEqual(ProbeResult.objects.count(), count)
+
+    # Savepoints, the state upsert, the history insert, the province lookup
+    # and the rollup insert, lock and update
+    def test_one_device(self):
+        self.check_many(1, 10)
+
+    def test_many_devices(self):
+        self.check_many(25, 10)
+
+
+@override_settings(CONNECTIVITY_SCHEDULER_MODE='adaptive', CONNECTIVITY_HEARTBEAT_SECONDS=300)
+class WritePolicyTests(DeviceAPITestCase):
+    """Unchanged probe results write no state row until the heartbeat"""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.create_devices(1)
+
+    def probe(self, status='online', at=None):
+        """Probe the device as a sweep would; returns the number of state row writes"""
+        device = Device.objects.select_related('school', 'probe_state').get()
+        with mock.patch('deviceApp.state.run_probes', side_effect=lambda targets, concurrency=None: [
+                    {'status': status, 'ping_check': None, 'port_check': None} for _ in targets]), \
+                mock.patch('deviceApp.state.check_internet_connectivity', return_value=True), \
+                mock.patch('deviceApp.state.now', return_value=at or now()), \
+                CaptureQueriesContext(connection) as queries:
+            Device.check_connectivity_many([device])
+        return sum(1 for query in queries if 'deviceprobestate' in query['sql']
+                   and query['sql'].startswith(('INSERT', 'UPDATE')))
+
+    def stored(self):
+        return DeviceProbeState.objects.get()
+
+    def test_unchanged_probes_do_not_write(self):
+        self.assertEqual([self.probe() for _ in range(5)], [1, 0, 0, 0, 0])
+
+    def test_cached_schedule_keeps_target_out_of_sweeps(self):
+        for _ in range(3):
+            self.probe()
+        stored_due = self.stored().next_check_due
+        cached_due = Device.objects.select_related('probe_state').get()
+        load_deferred_heartbeats([cached_due])
+        self.assertGreater(cached_due.next_check_due, stored_due)
+
+        # Due by the stored schedule, not yet by the cached one
+        self.assertEqual(list(due_queryset(Device.objects.all(), current_time=stored_due)), [])
+        self.assertEqual(len(due_queryset(Device.objects.all(), current_time=cached_due.next_check_due)), 1)
+
+    def test_heartbeat_writes_the_cached_schedule(self):
+        for _ in range(3):
+            self.probe()
+        heartbeat_at = now() + timedelta(seconds=301)
+        self.assertEqual(self.probe(at=heartbeat_at), 1)
+        self.assertEqual(self.stored().last_confirmed_at, heartbeat_at)
+        self.assertGreater(self.stored().next_check_due, heartbeat_at)
+
+    def test_status_change_writes(self):
+        for _ in range(3):
+            self.probe()
+        self.assertEqual(self.probe('offline'), 1)
+
+
+class ProbeMemoTests(DeviceAPITestCase):
+    """A device is probed at most once per request"""
+
+    def setUp(self):
+        super().setUp()
+        self.create_devices(1)
+        self.device = Device.objects.get()
+        patches = [
+            mock.patch('deviceApp.state.check_device_connectivity_with_params',
+                       return_value={'status': 'online', 'ping_check': None, 'port_check': None}),
+            mock.patch('deviceApp.state.check_internet_connectivity', return_value=True)
+        ]
+        self.probe = patches[0].start()
+        patches[1].start()
+        for patch in patches:
+            self.addCleanup(patch.stop)
+
+    def test_serializing_probes_once_per_request(self):
+        def view(request):
+            device = Device.objects.get(id=self.device.id)
+            # The status property, a second instance and the serializer share one probe
+            statuses = [device.status, Device.objects.get(id=self.device.id).status]
+            return statuses, DeviceSerializer(device).data
+
+        middleware = ProbeMemoMiddleware(view)
+        statuses, data = middleware(RequestFactory().get('/'))
+        self.assertEqual(statuses, ['online', 'online'])
+        self.assertEqual(data['status'], 'online')
+        self.assertEqual(self.probe.call_count, 1)
+
+        # The memo does not outlive the request
+        middleware(RequestFactory().get('/'))
+        self.assertEqual(self.probe.call_count, 2)
+
+    def test_refresh_probes_once_per_request(self):
+        for expected_calls in [1, 2]:
+            response = self.client.get(f'/device/{self.device.id}/?refresh=true')
+            self.assertEqual(response.json()['status'], 'online')
+            self.assertEqual(self.probe.call_count, expected_calls)
+
+
+class ProbeHistoryTests(DeviceAPITestCase):
+    """Probes append to the history; partitions are a PostgreSQL-only feature"""
+
+    def test_probe_appends_history_row(self):
+        self.create_devices(1)
+        device = Device.objects.get()
+        with mock.patch('deviceApp.state.check_device_connectivity_with_params', return_value={
+                    'status': 'online', 'ping_check': {'success': True, 'latency_ms': 12.5, 'packet_loss': 0},
+                    'port_check': None}), \
+                mock.patch('deviceApp.state.check_internet_connectivity', return_value=True):
+            device.check_connectivity()
+        row = ProbeResult.objects.get()
+        self.assertEqual((row.target_type, row.target_id, row.school_id), ('device', device.id, device.school_id))
+        self.assertEqual((row.status, row.latency_ms, row.packet_loss), ('online', 12.5, 0))
+        self.assertEqual(row.checked_at, device.last_check_attempt)
+
+    @mock.patch('django.db.connection.vendor', 'sqlite')
+    def test_partitions_skipped_without_postgresql(self):
+        self.assertEqual(history.ensure_partitions(), [])
+        self.assertFalse(history.create_partition(date(2026, 1, 1)))
+        self.assertEqual(history.list_partitions(), [])
+
+        # The migration creates a plain table instead of a partitioned one
+        migration = importlib.import_module('deviceApp.migrations.0010_proberesult')
+        schema_editor = mock.Mock(connection=mock.Mock(vendor='sqlite'))
+        migration.create_probe_result_table(django_apps, schema_editor)
+        schema_editor.create_model.assert_called_once()
+        schema_editor.execute.assert_not_called()
+
+
+class RateLimitTests(TestCase):
+    """Probe rate limits are exact and never hold concurrency slots"""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_fractional_rates(self):
+        for rate, capacity, window in [(0.5, 1, 2.0), (1.5, 1, 2 / 3), (20, 20, 1.0), (2.5, 2, 0.8)]:
+            bucket = TokenBucket('test', rate)
+            self.assertEqual(bucket.capacity, capacity)
+            self.assertAlmostEqual(bucket.window, window)
+            self.assertAlmostEqual(bucket.capacity / bucket.window, rate)
+
+    def test_bucket_allows_capacity_per_window(self):
+        bucket = TokenBucket('test', 0.5)
+        self.assertEqual(bucket.try_acquire(), 0)
+        self.assertGreater(bucket.try_acquire(), 0)
+
+    def test_throttled_target_does_not_hold_a_slot(self):
+        finished = []
+
+        async def fake_check(ip_address, **params):
+            finished.append(ip_address)
+            return {'ip': ip_address, 'status': 'online'}
+
+        throttled = [('school:1', 1)]
+        targets = [
+            {'ip_address': '10.0.0.1', 'rate_limits': throttled},
+            {'ip_address': '10.0.0.2', 'rate_limits': throttled},
+            {'ip_address': '10.0.1.1', 'rate_limits': [('school:2', 1)]},
+        ]
+        with mock.patch('deviceApp.probes.async_check_device_connectivity_with_params', fake_check):
+            asyncio.run(async_run_probes(targets, concurrency=1))
+        # The second probe of the throttled school waits for the next window,
+        # without keeping the other school from the only slot
+        self.assertEqual(finished, ['10.0.0.1', '10.0.1.1', '10.0.0.2'])
+
+
+class ReportWindowTests(DeviceAPITestCase):
+    """Report endpoints accept timestamps with or without an offset"""
+
+    def test_naive_timestamps(self):
+        for url in ['/device/sla/', '/device/transitions/', '/device/rollups/?scope=school&key=1']:
+            separator = '&' if '?' in url else '?'
+            response = self.client.get(f'{url}{separator}start=2026-10-01T00:00:00&end=2026-10-02T00:00:00')
+            self.assertEqual(response.status_code, 200, url)
+            self.assertEqual(response.json()['start'], '2026-10-01T00:00:00+00:00')
+
+    def test_invalid_timestamps(self):
+        for query in ['start=yesterday', 'end=2026-13-01T00:00:00', 'start=2026-10-02T00:00:00&end=2026-10-01T00:00:00']:
+            self.assertEqual(self.client.get(f'/device/sla/?{query}').status_code, 400, query)
+
+    def test_sla_school_ids_are_integers(self):
+        self.create_devices(1)
+        school = School.objects.get()
+        end = now()
+        # An interval without a school must not turn the other school IDs into floats
+        for target_id, school_id in [(1, school.id), (2, None)]:
+            StatusInterval.objects.create(target_type='device', target_id=target_id, school_id=school_id,
+                                          status='online', started_at=end - timedelta(hours=2),
+                                          ended_at=end - timedelta(hours=1))
+        for group in ['target', 'school']:
+            results = self.client.get(f'/device/sla/?group={group}').json()['results']
+            self.assertEqual(sorted(row['school_id'] or 0 for row in results), [0, school.id])
+            self.assertIsInstance(results[0]['school_id'] or results[1]['school_id'], int)
+
+
+def echo_reply(request):
+    """The echo reply a host sends back for an echo request"""
+    reply = bytes([0, 0, 0, 0]) + request[4:]
+    return reply[:2] + struct.pack('!H', icmp_checksum(reply)) + reply[4:]
+
+
+class PortCheckTests(TestCase):
+    """Port scans run in parallel, stop at the first open port and share one timeout"""
+
+    def scan(self, behaviour, timeout=1):
+        """
+        Scan with each port's connection faked: 'open' and 'closed' answer
+        after behaviour's delay, 'hang' never answers
+        """
+        async def fake_connect(ip_address, port):
+            outcome, delay = behaviour[port]
+            if outcome == 'hang':
+                await asyncio.sleep(60)
+            await asyncio.sleep(delay)
+            if outcome == 'closed':
+                raise ConnectionRefusedError(port)
+            return port
+
+        started = time.monotonic()
+        with mock.patch('deviceApp.probes._connect_port', fake_connect):
+            result = asyncio.run(async_check_port_connectivity('10.0.0.1', list(behaviour), timeout=timeout))
+        return result, time.monotonic() - started
+
+    def test_stops_at_first_open_port(self):
+        result, elapsed = self.scan({22: ('closed', 0), 80: ('open', 0.01), 443: ('hang', 0)})
+        self.assertEqual(result['status'], 'online')
+        self.assertEqual((result['open_ports'], result['closed_ports'], result['skipped_ports']), ([80], [22], [443]))
+        self.assertLess(elapsed, 0.5)
+
+    def test_closed_ports(self):
+        result, _ = self.scan({22: ('closed', 0), 80: ('closed', 0.01)})
+        self.assertEqual(result['status'], 'offline')
+        self.assertEqual((result['ports_checked'], result['closed_ports'], result['skipped_ports']), (2, [22, 80], []))
+
+    def test_ports_share_one_timeout(self):
+        result, elapsed = self.scan({port: ('hang', 0) for port in [22, 80, 443, 8080]}, timeout=0.2)
+        self.assertEqual(result['status'], 'offline')
+        self.assertEqual(result['closed_ports'], [22, 80, 443, 8080])
+        # One timeout for the whole scan, not one per port
+        self.assertLess(elapsed, 0.6)
+
+
+class FakeIcmpSocket:
+    """
+    Datagram ICMP socket that answers echo requests through answer(packet, address),
+    which returns (reply, source address) or None for no reply. Queued errors are
+    raised from recvfrom() before any reply.
+    """
+
+    def __init__(self, answer, errors=()):
+        self.answer = answer
+        self.errors = list(errors)
+        self.inbox = []
+        # A real socket pair makes the event loop see the fake become readable,
+        # with one byte per queued error or reply
+        self.reader, self.writer = socket.socketpair()
+        self.writer.send(b'x' * len(self.errors))
+
+    def fileno(self):
+        return self.reader.fileno()
+
+    def sendto(self, packet, address):
+        reply = self.answer(packet, address)
+        if reply is not None:
+            self.inbox.append(reply)
+            self.writer.send(b'x')
+        return len(packet)
+
+    def recvfrom(self, size):
+        if not self.errors and not self.inbox:
+            raise BlockingIOError
+        self.reader.recv(1)
+        if self.errors:
+            raise self.errors.pop(0)
+        return self.inbox.pop(0)
+
+    def close(self):
+        self.reader.close()
+        self.writer.close()
+
+
+class IcmpTests(TestCase):
+    """In-process ping: packets, reply matching and socket failures"""
+
+    def ping_many(self, sock, ip_addresses, timeout=0.2):
+        async def run():
+            with mock.patch('deviceApp.icmp._open_socket', return_value=(sock, False)):
+                pinger = AsyncPinger()
+            try:
+                return await pinger.ping_many(ip_addresses, timeout=timeout), pinger.closed
+            finally:
+                pinger.close()
+        return asyncio.run(run())
+
+    def test_checksum(self):
+        # Example from RFC 1071 section 3
+        self.assertEqual(icmp_checksum(bytes.fromhex('0001f203f4f5f6f7')), 0x220D)
+        self.assertEqual(icmp_checksum(b'\x01'), 0xFEFF)
+        # A packet carrying its own checksum sums to zero
+        self.assertEqual(icmp_checksum(build_echo_request(0x1234, 7)), 0)
+
+    def test_build_and_parse(self):
+        request = build_echo_request(0x1234, 7)
+        self.assertEqual(struct.unpack('!BBHHH', request[:8])[0::3], (8, 0x1234))
+        self.assertEqual(request[8:], bytes(range(56)))
+        self.assertIsNone(parse_echo_reply(request, False))
+
+        reply = echo_reply(request)
+        self.assertEqual(parse_echo_reply(reply, False), (0x1234, 7))
+        ip_header = bytes([0x45]) + bytes(19)
+        self.assertEqual(parse_echo_reply(ip_header + reply, True), (0x1234, 7))
+        self.assertIsNone(parse_echo_reply(reply[:6], False))
+        self.assertIsNone(parse_echo_reply(ip_header[:10], True))
+
+    def test_replies_matched_by_address_and_sequence(self):
+        def answer(packet, address):
+            if address[0] == '10.0.0.2':
+                return echo_reply(packet), ('10.0.0.9', 0)  # Reply from another host
+            if address[0] == '10.0.0.3':
+                sequence = struct.unpack('!H', packet[6:8])[0]
+                return echo_reply(packet[:6] + struct.pack('!H', sequence + 1) + packet[8:]), address
+            return echo_reply(packet), address
+
+        results, _ = self.ping_many(FakeIcmpSocket(answer), ['10.0.0.1', '10.0.0.2', '10.0.0.3'])
+        self.assertIsNotNone(results['10.0.0.1']['latency_ms'])
+        self.assertEqual(results['10.0.0.1']['packet_loss'], 0)
+        for ip_address in ['10.0.0.2', '10.0.0.3']:
+            self.assertIsNone(results[ip_address]['latency_ms'])
+            self.assertEqual(results[ip_address]['error'], "No reply received from host")
+
+    def test_destination_error_keeps_socket(self):
+        sock = FakeIcmpSocket(lambda packet, address: (echo_reply(packet), address),
+                              errors=[OSError(errno.EHOSTUNREACH, 'No route to host')])
+        results, closed = self.ping_many(sock, ['10.0.0.1'])
+        self.assertIsNotNone(results['10.0.0.1']['latency_ms'])
+        self.assertFalse(closed)
+
+    def test_socket_error_fails_pending_pings(self):
+        sock = FakeIcmpSocket(lambda packet, address: None, errors=[OSError(errno.EBADF, 'Bad file descriptor')])
+        started = time.monotonic()
+        results, closed = self.ping_many(sock, ['10.0.0.1', '10.0.0.2'], timeout=5)
+        # The broken socket fails both pings at once instead of spinning until the timeout
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertTrue(closed)
+        for result in results.values():
+            self.assertTrue(result['error'].startswith('Ping error'))
+
+    def test_falls_back_to_raw_socket(self):
+        raw = mock.Mock()
+        with mock.patch('deviceApp.icmp.socket.socket', side_effect=[PermissionError('not permitted'), raw]) as opened:
+            self.assertEqual(_open_socket(), (raw, True))
+        self.assertEqual([call.args[1] for call in opened.call_args_list], [socket.SOCK_DGRAM, socket.SOCK_RAW])
+        raw.setblocking.assert_called_once_with(False)
+
+        with mock.patch('deviceApp.icmp.socket.socket', side_effect=PermissionError('not permitted')):
+            with self.assertRaises(IcmpUnavailable):
+                _open_socket()
+
+
+class TransitionTests(DeviceAPITestCase):
+    """Confirmed transitions, flap suppression and the intervals between transitions"""
+
+    def setUp(self):
+        super().setUp()
+        self.create_devices(1)
+        self.device = Device.objects.get()
+        self.start = now() - timedelta(hours=2)
+
+    def observe(self, statuses, first_minute=0):
+        """Feed one probe per minute; returns the kinds of the events recorded"""
+        events = []
+        for minute, status in enumerate(statuses, first_minute):
+            result = {'status': status} if status == 'online' else {'status': 'offline', 'error': 'Host is unreachable'}
+            event = observe_status(self.device, 'device', self.device.school_id, result,
+                                   self.start + timedelta(minutes=minute))
+            if event is not None:
+                events.append(event.kind)
+        return events
+
+    def intervals(self):
+        return list(StatusInterval.objects.order_by('started_at').values_list('status', 'started_at', 'ended_at'))
+
+    @override_settings(CONNECTIVITY_TRANSITION_CONFIRMATIONS=2)
+    def test_transition_needs_consecutive_confirmations(self):
+        # A single lost probe, and two lost probes with a reply between them, are not transitions
+        self.assertEqual(self.observe(['online', 'offline', 'online', 'offline', 'online']), [])
+        self.assertEqual(self.observe(['offline', 'offline'], first_minute=5), ['transition'])
+
+        event = StatusTransitionEvent.objects.get()
+        self.assertEqual((event.previous_status, event.status, event.confirmations), ('online', 'offline', 2))
+        # Timestamped when the new status was first seen, confirmed a probe later
+        self.assertEqual(event.occurred_at, self.start + timedelta(minutes=5))
+        self.assertEqual(event.confirmed_at, self.start + timedelta(minutes=6))
+        state = self.device.get_probe_state()
+        self.assertEqual((state.confirmed_status, state.status_since), ('offline', event.occurred_at))
+
+    @override_settings(CONNECTIVITY_TRANSITION_CONFIRMATIONS=1, CONNECTIVITY_FLAP_THRESHOLD=3,
+                       CONNECTIVITY_FLAP_WINDOW=900)
+    def test_flapping_is_suppressed(self):
+        self.assertEqual(self.observe(['online', 'offline', 'online', 'offline']),
+                         ['transition', 'transition', 'flap_start'])
+        # Further transitions while flapping write no events
+        self.assertEqual(self.observe(['online', 'offline'], first_minute=4), [])
+        self.assertTrue(self.device.get_probe_state().flapping)
+
+        # Holding one status for a whole flap window ends the flapping period
+        self.assertEqual(self.observe(['offline'], first_minute=10), [])
+        self.assertEqual(self.observe(['offline'], first_minute=20), ['flap_end'])
+        flap_end = StatusTransitionEvent.objects.get(kind='flap_end')
+        self.assertEqual((flap_end.status, flap_end.occurred_at), ('offline', self.start + timedelta(minutes=5)))
+        self.assertFalse(self.device.get_probe_state().flapping)
+
+    @override_settings(CONNECTIVITY_TRANSITION_CONFIRMATIONS=1, CONNECTIVITY_FLAP_THRESHOLD=3)
+    def test_every_transition_closes_an_interval(self):
+        self.assertEqual(self.observe(['online', 'online', 'offline', 'online', 'offline', 'online', 'online']),
+                         ['transition', 'transition', 'flap_start'])
+        minute = lambda n: self.start + timedelta(minutes=n)
+        # The suppressed fourth transition still closes its interval
+        self.assertEqual(self.intervals(), [
+            ('online', minute(0), minute(2)),
+            ('offline', minute(2), minute(3)),
+            ('online', minute(3), minute(4)),
+            ('offline', minute(4), minute(5)),
+        ])
+        state = self.device.get_probe_state()
+        self.assertEqual((state.confirmed_status, state.status_since), ('online', minute(5)))
+
+
+class RetentionTests(TestCase):
+    """Tier cut-offs and chunked, budgeted pruning"""
+
+    def setUp(self):
+        archive_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(archive_dir.cleanup)
+        self.archive_dir = archive_dir.name
+        settings = override_settings(CONNECTIVITY_ARCHIVE_DIR=self.archive_dir, CONNECTIVITY_RETENTION_BATCH_PAUSE=0)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def create_results(self, times):
+        return ProbeResult.objects.bulk_create([
+            ProbeResult(target_type='device', target_id=1, school_id=1, checked_at=checked_at, status='online')
+            for checked_at in times
+        ])
+
+    def archived_ids(self, *path):
+        with gzip.open(os.path.join(self.archive_dir, ProbeResult._meta.db_table, *path)) as archive:
+            return [json.loads(line)['id'] for line in archive]
+
+    def archive_day(self, result):
+        """Name of the daily archive file a pruned result goes to"""
+        return f"{result.checked_at.astimezone(timezone.utc):%Y-%m-%d}.jsonl.gz"
+
+    @override_settings(CONNECTIVITY_RAW_RETENTION_DAYS=30, CONNECTIVITY_MINUTE_ROLLUP_RETENTION_DAYS=7,
+                       CONNECTIVITY_HOUR_ROLLUP_RETENTION_DAYS=365, CONNECTIVITY_DAY_ROLLUP_RETENTION_DAYS=0)
+    def test_coarser_tiers_outlive_finer_ones(self):
+        self.assertEqual([get_retention_days(tier) for tier in ['raw', 'minute', 'hour', 'day']], [30, 30, 365, 0])
+        with override_settings(CONNECTIVITY_RAW_RETENTION_DAYS=0):
+            self.assertEqual(get_retention_days('minute'), 0)
+        with override_settings(CONNECTIVITY_HOUR_ROLLUP_RETENTION_DAYS=10):
+            self.assertEqual(get_retention_days('hour'), 30)
+
+    @override_settings(CONNECTIVITY_RAW_RETENTION_DAYS=30, CONNECTIVITY_MINUTE_ROLLUP_RETENTION_DAYS=40,
+                       CONNECTIVITY_HOUR_ROLLUP_RETENTION_DAYS=365, CONNECTIVITY_DAY_ROLLUP_RETENTION_DAYS=0,
+                       CONNECTIVITY_EVENT_RETENTION_DAYS=730)
+    def test_tier_cutoffs(self):
+        current_time = now()
+        kept, expired = self.create_results([current_time - timedelta(days=29), current_time - timedelta(days=31)])
+        for granularity, age in product(['minute', 'hour', 'day'], [39, 41, 364, 366, 5000]):
+            ConnectivityRollup.objects.create(granularity=granularity, scope='school', scope_key='1',
+                                              bucket_start=current_time - timedelta(days=age))
+
+        summary = apply_retention(force=True)
+        self.assertEqual(summary['status'], 'completed')
+        self.assertEqual(list(ProbeResult.objects.values_list('id', flat=True)), [kept.id])
+        self.assertEqual(self.archived_ids(self.archive_day(expired)), [expired.id])
+        remaining = {
+            granularity: sorted((current_time - bucket_start).days for bucket_start in
+                                ConnectivityRollup.objects.filter(granularity=granularity)
+                                .values_list('bucket_start', flat=True))
+            for granularity in ['minute', 'hour', 'day']
+        }
+        self.assertEqual(remaining, {'minute': [39], 'hour': [39, 41, 364], 'day': [39, 41, 364, 366, 5000]})
+
+    def test_pruning_in_chunks_stops_with_the_budget(self):
+        results = self.create_results([now() - timedelta(days=40, minutes=index) for index in range(5)])
+        cutoff = now() - timedelta(days=30)
+        run = RetentionRun(force=True, batch_size=2)
+        with mock.patch.object(run, 'should_stop', side_effect=[False, True]):
+            self.assertEqual(prune_rows(ProbeResult.objects.all(), 'checked_at', cutoff, run, archive=True), 2)
+        self.assertEqual(ProbeResult.objects.count(), 3)
+
+        # The next run carries on from there
+        self.assertEqual(prune_rows(ProbeResult.objects.all(), 'checked_at', cutoff,
+                                    RetentionRun(force=True, batch_size=2), archive=True), 3)
+        self.assertFalse(ProbeResult.objects.exists())
+        days = {self.archive_day(result) for result in results}
+        archived = [result_id for day in days for result_id in self.archived_ids(day)]
+        self.assertEqual(sorted(archived), sorted(result.id for result in results))
+
+    def test_partition_archive_resumes_within_budget(self):
+        month = date(2026, 1, 1)
+        results = self.create_results([datetime(2026, 1, day, tzinfo=timezone.utc) for day in range(1, 6)])
+        self.create_results([datetime(2026, 2, 1, tzinfo=timezone.utc)])
+
+        run = RetentionRun(force=True, batch_size=2)
+        with mock.patch.object(run, 'should_stop', side_effect=[False, True]):
+            self.assertFalse(archive_partition(month, run))
+        self.assertFalse(os.path.exists(os.path.join(self.archive_dir, ProbeResult._meta.db_table, '2026-01.jsonl.gz')))
+
+        self.assertTrue(archive_partition(month, RetentionRun(force=True, batch_size=2)))
+        self.assertEqual(self.archived_ids('2026-01.jsonl.gz'), [result.id for result in results])
+        self.assertEqual(os.listdir(os.path.join(self.archive_dir, ProbeResult._meta.db_table)), ['2026-01.jsonl.gz'])
+
+
+@override_settings(CONNECTIVITY_UPLINK_TIMEOUT=1, CONNECTIVITY_UPLINK_TARGETS=['192.0.2.1:53'])
+class UplinkMonitorTests(TestCase):
+    """Only one process checks the uplink at a time, even before its first answer"""
+
+    def setUp(self):
+        cache.clear()
+        self.monitor = UplinkMonitor()
+
+    def test_first_check_probes_once(self):
+        with mock.patch.object(self.monitor, '_probe', return_value=True) as probe:
+            self.assertTrue(self.monitor.is_up())
+            self.assertTrue(self.monitor.is_up())
+        probe.assert_called_once()
+        self.assertIsNone(cache.get(UplinkMonitor.LOCK_KEY))
+
+    def test_waits_for_the_first_check_in_progress(self):
+        # Another process holds the refresh lock and stores its answer shortly
+        cache.add(UplinkMonitor.LOCK_KEY, True)
+        state = {'up': False, 'checked_at': time.time(), 'consecutive_failures': 1,
+                 'circuit': 'closed', 'open_until': None}
+        threading.Timer(0.2, cache.set, [UplinkMonitor.CACHE_KEY, state]).start()
+        with mock.patch.object(self.monitor, '_probe', return_value=True) as probe:
+            self.assertFalse(self.monitor.is_up())
+        probe.assert_not_called()
+
+    def test_probes_when_the_first_check_is_abandoned(self):
+        cache.add(UplinkMonitor.LOCK_KEY, True)
+        threading.Timer(0.2, cache.delete, [UplinkMonitor.LOCK_KEY]).start()
+        with mock.patch.object(self.monitor, '_probe', return_value=True) as probe:
+            self.assertTrue(self.monitor.is_up())
+        probe.assert_called_once()
+
+
+@override_settings(CONNECTIVITY_RAW_RETENTION_DAYS=0)
+class RollupRebuildTests(TestCase):
+    """Rebuilding rollups writes closed buckets as it goes, and only what the raw history covers"""
+
+    def setUp(self):
+        user = CustomUser.objects.create_user('Test', 'User', '0700000000', 'admin', password='secret')
+        self.school = School.objects.create(index_number='S1', name='School', province='Kigali',
+                                            district='Gasabo', created_by=user)
+        self.day = datetime(2026, 10, 1, tzinfo=timezone.utc)
+        ProbeResult.objects.bulk_create([
+            ProbeResult(target_type='device', target_id=index % 3, school_id=self.school.id,
+                        checked_at=self.day + timedelta(minutes=7 * index), status='online' if index % 4 else 'offline',
+                        latency_ms=index * 3.5 if index % 4 else None)
+            for index in range(40)
+        ])
+
+    def rebuild(self, batch_size):
+        rollups.rebuild_rollups(self.day, self.day + timedelta(days=1), batch_size=batch_size)
+        return {
+            (rollup.granularity, rollup.scope, rollup.scope_key, rollup.bucket_start):
+                {field: getattr(rollup, field) for field in rollups.STAT_FIELDS}
+            for rollup in ConnectivityRollup.objects.all()
+        }
+
+    def test_batched_rebuild_matches_single_pass(self):
+        expected = self.rebuild(batch_size=1000)
+        written = []
+        create_rollups = rollups._create_rollups
+        with mock.patch('deviceApp.rollups._create_rollups',
+                        side_effect=lambda deltas: written.append(len(deltas)) or create_rollups(deltas)):
+            self.assertEqual(self.rebuild(batch_size=4), expected)
+        # Closed buckets were written batch by batch, each exactly once
+        self.assertGreater(len(written), 2)
+        self.assertEqual(sum(written), len(expected))
+        # The last write holds only the buckets still open at the end of the history
+        self.assertLess(written[-1], len(expected) / 2)
+
+    @override_settings(CONNECTIVITY_RAW_RETENTION_DAYS=30)
+    def test_buckets_older_than_the_raw_history_are_kept(self):
+        kept = [
+            ConnectivityRollup.objects.create(granularity=granularity, scope='school', scope_key=str(self.school.id),
+                                              bucket_start=bucket_start, probe_count=999)
+            for granularity, bucket_start in [('day', self.day), ('hour', self.day + timedelta(hours=1))]
+        ]
+        cutoff = self.day + timedelta(hours=2, minutes=30)
+        with mock.patch('deviceApp.retention.now', return_value=cutoff + timedelta(days=30)):
+            rebuilt = self.rebuild(batch_size=1000)
+
+        for rollup in kept:
+            key = (rollup.granularity, 'school', rollup.scope_key, rollup.bucket_start)
+            self.assertEqual(rebuilt[key]['probe_count'], 999)
+        hours = sorted(key[3] for key in rebuilt if key[:2] == ('hour', 'school'))
+        self.assertEqual(hours, [self.day + timedelta(hours=hour) for hour in [1, 3, 4]])
+        minutes = [key[3] for key in rebuilt if key[0] == 'minute']
+        self.assertGreaterEqual(min(minutes), cutoff)
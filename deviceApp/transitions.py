@@ -0,0 +1,170 @@
+# deviceApp/transitions.py
+"""
+Confirmed status transitions with hysteresis and flap suppression, and the
+up/down intervals between them.
+
+Every saved probe of a device or router is fed to observe_status(). A
+status different from the target's confirmed status only becomes a
+transition after CONNECTIVITY_TRANSITION_CONFIRMATIONS consecutive probes
+agree on it; a single lost probe therefore never produces an event. Each
+confirmed transition appends one StatusTransitionEvent, timestamped when
+the new status was first seen.
+
+A target with CONNECTIVITY_FLAP_THRESHOLD or more confirmed transitions
+within CONNECTIVITY_FLAP_WINDOW seconds is flapping: one 'flap_start'
+event is written and further transitions are suppressed until the target
+has kept one status for a whole flap window, when a 'flap_end' event
+records the status it settled on.
+
+Every confirmed transition, suppressed or not, also closes the target's
+current StatusInterval, the period it held its previous status. Intervals
+are append-only; the open one is the probe state's confirmed_status since
+status_since. The SLA engine (sla.py) works from these intervals.
+
+The detector's state lives in the probe state row (TRANSITION_FIELDS).
+Events and intervals are queued in the current writeback.probe_write_batch()
+like the rest of the probe writes.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils.dateparse import parse_datetime
+
+from .writeback import pending_writes
+
+# Probe state fields written by observe_status()
+TRANSITION_FIELDS = ['confirmed_status', 'status_since', 'pending_status', 'pending_since',
+                     'pending_count', 'flapping', 'recent_transitions']
+
+
+def get_required_confirmations():
+    return max(getattr(settings, 'CONNECTIVITY_TRANSITION_CONFIRMATIONS', 2), 1)
+
+
+def get_flap_threshold():
+    return getattr(settings, 'CONNECTIVITY_FLAP_THRESHOLD', 3)
+
+
+def get_flap_window():
+    return getattr(settings, 'CONNECTIVITY_FLAP_WINDOW', 900)
+
+
+def classify_status(result):
+    """Status tracked for transitions: 'online', 'no_internet' or 'offline'"""
+    if result.get('status') == 'online':
+        return 'online'
+    if 'reachable but has no internet' in (result.get('error') or ''):
+        return 'no_internet'
+    return 'offline'
+
+
+def _append(row):
+    writes = pending_writes()
+    if writes is not None:
+        writes.add_row(row)
+    else:
+        row.save()
+    return row
+
+
+def _record_interval(target_type, target_id, school_id, status, started_at, ended_at):
+    from .models import StatusInterval
+
+    return _append(StatusInterval(
+        target_type=target_type,
+        target_id=target_id,
+        school_id=school_id,
+        status=status,
+        started_at=started_at,
+        ended_at=ended_at
+    ))
+
+
+def _record_event(target_type, target_id, school_id, kind, previous_status, status,
+                  occurred_at, confirmed_at, confirmations, error):
+    from .models import StatusTransitionEvent
+
+    return _append(StatusTransitionEvent(
+        target_type=target_type,
+        target_id=target_id,
+        school_id=school_id,
+        kind=kind,
+        previous_status=previous_status,
+        status=status,
+        occurred_at=occurred_at,
+        confirmed_at=confirmed_at,
+        confirmations=confirmations,
+        error=(error or '')[:255] or None
+    ))
+
+
+def observe_status(target, target_type, school_id, result, checked_at):
+    """
+    Feed one probe result to the target's transition detector.
+
+    Parameters:
+    - target: Device or Router instance
+    - target_type: 'device' or 'router'
+    - school_id: ID of the school the target belongs to
+    - result: Result dictionary from the probe engine
+    - checked_at: When the probe ran
+
+    Returns the event recorded, or None.
+    """
+    state = target.get_probe_state()
+    status = classify_status(result)
+    window = timedelta(seconds=get_flap_window())
+    event_args = (target_type, target.pk, school_id)
+
+    if state.confirmed_status is None:
+        # First observation: nothing to transition from
+        state.confirmed_status = status
+        state.status_since = checked_at
+        return None
+
+    if status == state.confirmed_status:
+        state.pending_status = None
+        state.pending_since = None
+        state.pending_count = 0
+
+        last_transition = parse_datetime(state.recent_transitions[-1]) if state.recent_transitions else None
+        if state.flapping and (last_transition is None or checked_at - last_transition >= window):
+            state.flapping = False
+            state.recent_transitions = []
+            return _record_event(*event_args, 'flap_end', None, status, last_transition or checked_at,
+                                 checked_at, 0, result.get('error'))
+        return None
+
+    if status != state.pending_status:
+        state.pending_status = status
+        state.pending_since = checked_at
+        state.pending_count = 0
+    state.pending_count += 1
+    if state.pending_count < get_required_confirmations():
+        return None
+
+    # Confirmed
+    previous_status = state.confirmed_status
+    occurred_at = state.pending_since
+    confirmations = state.pending_count
+    if state.status_since is not None:
+        _record_interval(*event_args, previous_status, state.status_since, occurred_at)
+    state.confirmed_status = status
+    state.status_since = occurred_at
+    state.pending_status = None
+    state.pending_since = None
+    state.pending_count = 0
+    state.recent_transitions = [
+        timestamp for timestamp in state.recent_transitions
+        if checked_at - parse_datetime(timestamp) < window
+    ] + [occurred_at.isoformat()]
+
+    if state.flapping:
+        return None
+    if len(state.recent_transitions) >= get_flap_threshold():
+        state.flapping = True
+        kind = 'flap_start'
+    else:
+        kind = 'transition'
+    return _record_event(*event_args, kind, previous_status, status, occurred_at,
+                         checked_at, confirmations, result.get('error'))
@@ -0,0 +1,181 @@
+# deviceApp/uplink.py
+"""
+Shared health check for this host's own uplink.
+
+Every connectivity check first asks whether the monitoring host itself can
+reach the internet. Instead of opening TCP connections for each device, the
+answer is cached in the Django cache (shared by every thread and, with a
+shared cache backend, every worker process) for CONNECTIVITY_UPLINK_TTL
+seconds. Only one process refreshes it at a time, holding a lock taken with
+cache.add(); the others keep using the stale answer, or wait for the first
+one when there is none yet. After CONNECTIVITY_UPLINK_FAILURE_THRESHOLD
+consecutive failed checks the circuit opens and the uplink is reported down
+without probing for CONNECTIVITY_UPLINK_OPEN_SECONDS, after which one trial
+check is made.
+"""
+import logging
+import socket
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_UPLINK_TARGETS = ['8.8.8.8:53', '1.1.1.1:53']
+
+CIRCUIT_CLOSED = 'closed'
+CIRCUIT_OPEN = 'open'
+CIRCUIT_HALF_OPEN = 'half_open'
+
+
+def parse_target(target):
+    """Convert 'host:port' (or a (host, port) pair) to a (host, port) tuple"""
+    if isinstance(target, str):
+        host, _, port = target.rpartition(':')
+        return host, int(port)
+    host, port = target
+    return host, int(port)
+
+
+class UplinkMonitor:
+    """
+    TTL-cached, circuit-broken check of whether the host has internet access.
+    """
+
+    CACHE_KEY = 'connectivity:uplink:state'
+    LOCK_KEY = 'connectivity:uplink:lock'
+
+    def __init__(self):
+        # Single-flight refreshes within this process
+        self._lock = threading.Lock()
+
+    @property
+    def targets(self):
+        targets = getattr(settings, 'CONNECTIVITY_UPLINK_TARGETS', DEFAULT_UPLINK_TARGETS)
+        return [parse_target(target) for target in targets]
+
+    @property
+    def ttl(self):
+        return getattr(settings, 'CONNECTIVITY_UPLINK_TTL', 30)
+
+    @property
+    def timeout(self):
+        return getattr(settings, 'CONNECTIVITY_UPLINK_TIMEOUT', 3)
+
+    @property
+    def failure_threshold(self):
+        return getattr(settings, 'CONNECTIVITY_UPLINK_FAILURE_THRESHOLD', 3)
+
+    @property
+    def open_seconds(self):
+        return getattr(settings, 'CONNECTIVITY_UPLINK_OPEN_SECONDS', 60)
+
+    def _probe(self):
+        """Try each target in turn. Returns True if any accepts a TCP connection."""
+        for host, port in self.targets:
+            try:
+                with socket.create_connection((host, port), timeout=self.timeout):
+                    return True
+            except OSError:
+                continue
+        return False
+
+    def _is_fresh(self, state, current_time):
+        if not state:
+            return False
+        if state['circuit'] == CIRCUIT_OPEN:
+            return current_time < state['open_until']
+        return current_time < state['checked_at'] + self.ttl
+
+    def get_state(self):
+        """
+        Return the cached uplink state dictionary, or None if never checked.
+
+        Keys: up, checked_at, consecutive_failures, circuit, open_until
+        """
+        return cache.get(self.CACHE_KEY)
+
+    def is_up(self):
+        """
+        Returns True if the host has internet access, using the cached answer while it is fresh
+        """
+        state = self.get_state()
+        if self._is_fresh(state, time.time()):
+            return state['up']
+
+        with self._lock:
+            # Another thread may have refreshed the state while we waited
+            state = self.get_state()
+            if self._is_fresh(state, time.time()):
+                return state['up']
+
+            # Let only one process refresh at a time; the others use the stale
+            # answer, or wait for the first one when there is none yet
+            lock_timeout = self.timeout * max(len(self.targets), 1) + 1
+            locked = cache.add(self.LOCK_KEY, True, timeout=lock_timeout)
+            if not locked:
+                if state:
+                    return state['up']
+                state = self._wait_for_state(lock_timeout)
+                if state:
+                    return state['up']
+
+            try:
+                return self._refresh(state)
+            finally:
+                if locked:
+                    cache.delete(self.LOCK_KEY)
+
+    def _wait_for_state(self, timeout):
+        """
+        Wait up to timeout seconds for the process holding the refresh lock
+        to store a state. Returns it, or None if the lock went away without one.
+        """
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            state = self.get_state()
+            if state or cache.get(self.LOCK_KEY) is None:
+                return state
+            time.sleep(0.05)
+        return self.get_state()
+
+    def _refresh(self, previous_state):
+        up = self._probe()
+        current_time = time.time()
+        failures = 0 if up else (previous_state or {}).get('consecutive_failures', 0) + 1
+
+        state = {
+            'up': up,
+            'checked_at': current_time,
+            'consecutive_failures': failures,
+            'circuit': CIRCUIT_CLOSED,
+            'open_until': None
+        }
+        if failures >= self.failure_threshold:
+            state['circuit'] = CIRCUIT_OPEN
+            state['open_until'] = current_time + self.open_seconds
+
+        if previous_state and previous_state['up'] != up:
+            logger.warning(f"Host uplink is now {'up' if up else 'down'}")
+
+        # Keep the failure count around long enough for the breaker to use it
+        cache.set(self.CACHE_KEY, state, timeout=max(self.ttl, self.open_seconds) * 2)
+        return up
+
+    def circuit_state(self):
+        """Return 'closed', 'open' or 'half_open' (open period over, next check is a trial)"""
+        state = self.get_state()
+        if not state or state['circuit'] == CIRCUIT_CLOSED:
+            return CIRCUIT_CLOSED
+        if time.time() < state['open_until']:
+            return CIRCUIT_OPEN
+        return CIRCUIT_HALF_OPEN
+
+    def reset(self):
+        """Forget the cached state so the next call checks the uplink again"""
+        cache.delete_many([self.CACHE_KEY, self.LOCK_KEY])
+
+
+uplink_monitor = UplinkMonitor()
@@ -5,8 +5,13 @@ from . import views
 urlpatterns = [
     path('get_device_page/', views.get_device_page, name='get_device_page'),
     path('devices/', views.get_device_list, name='get-all-devices'),
+    path('summary/', views.get_device_summary, name='device-summary'),
     path('create/', views.create_device, name='create-device'),
     path('<int:device_id>/', views.get_device_detail, name='get-device-by-id'),
     path('update/<int:device_id>/', views.update_device, name='update-device'),
     path('delete/<int:device_id>/', views.delete_device, name='delete-device'),
+    path('scheduler/', views.get_scheduler_stats, name='scheduler-stats'),
+    path('rollups/', views.get_connectivity_rollups, name='connectivity-rollups'),
+    path('transitions/', views.get_status_transitions, name='status-transitions'),
+    path('sla/', views.get_sla_report, name='sla-report'),
 ]
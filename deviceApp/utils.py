@@ -27,6 +27,85 @@ def is_valid_ipv4(ip):
     
     return True
 
+def build_ping_command(ip_address, count, timeout, is_windows):
+    """Build the platform specific ping command line."""
+    param = '-n' if is_windows else '-c'
+    timeout_param = '-w' if is_windows else '-W'
+    timeout_value = str(timeout * 1000) if is_windows else str(timeout)
+    
+    return ['ping', param, str(count), timeout_param, timeout_value, ip_address]
+
+def parse_ping_output(stdout_str, result, is_windows):
+    """
+    Parse ping output into the result dictionary.
+    
+    Sets 'packet_loss' and either 'latency_ms' or 'error'.
+    Returns True when a latency could be extracted.
+    """
+    # Check for packet loss
+    if is_windows:
+        loss_pattern = r'(\d+)% loss'
+    else:
+        loss_pattern = r'(\d+)% packet loss'
+    loss_match = re.search(loss_pattern, stdout_str)
+    if loss_match:
+        result['packet_loss'] = int(loss_match.group(1))
+    
+    # Check if device is reachable first (look for reply indicators)
+    if is_windows:
+        if "Reply from" in stdout_str:
+            # Device is reachable, now extract time
+            time_pattern = r'time[=<](\d+\.?\d*)ms'
+            time_matches = re.findall(time_pattern, stdout_str)
+            
+            if time_matches:
+                # Calculate average of all responses
+                latencies = [float(match) for match in time_matches]
+                result['latency_ms'] = sum(latencies) / len(latencies)
+                return True
+            elif "time<1ms" in stdout_str:
+                # Special case for very fast responses
+                result['latency_ms'] = 0.5  # Approximate as 0.5ms
+                return True
+            else:
+                result['error'] = "Could not parse ping time from output"
+        else:
+            result['error'] = "No reply received from host"
+    else:
+        # Unix format: "64 bytes from 8.8.8.8: icmp_seq=1 ttl=115 time=14.6 ms"
+        if "bytes from" in stdout_str:
+            pattern = r'time=(\d+\.?\d*)\s*ms'
+            times = re.findall(pattern, stdout_str)
+            
+            if times:
+                # Calculate average of all responses
+                latencies = [float(t) for t in times]
+                result['latency_ms'] = sum(latencies) / len(latencies)
+                return True
+            else:
+                result['error'] = "Could not parse ping time from output"
+        else:
+            result['error'] = "No reply received from host"
+    
+    return False
+
+def extract_probe_metrics(result):
+    """
+    Pull the typed metrics out of a probe result dictionary.
+    
+    Returns a dictionary with latency_ms, packet_loss, ports_checked,
+    ports_open and open_ports (None / empty when the check did not run).
+    """
+    ping_check = result.get('ping_check') or {}
+    port_check = result.get('port_check') or {}
+    return {
+        'latency_ms': ping_check.get('latency_ms'),
+        'packet_loss': ping_check.get('packet_loss'),
+        'ports_checked': port_check.get('ports_checked'),
+        'ports_open': port_check.get('ports_open'),
+        'open_ports': port_check.get('open_ports') or []
+    }
+
 def measure_ping_latency(ip_address, count=1, timeout=5, retry_count=2):
     """
     Measure ping latency to the specified IP address with retry mechanism.
@@ -37,96 +116,18 @@ def measure_ping_latency(ip_address, count=1, timeout=5, retry_count=2):
     - timeout: Timeout in seconds
     - retry_count: Number of retries if ping fails
     
-    Returns a dictionary with latency in milliseconds.
+    Returns a dictionary with latency in milliseconds. Pings are sent from an
+    in-process ICMP socket when the host allows it (see probes.py), in which case
+    'rtts_ms' also lists the per-packet round trip times.
     """
-    result = {
-        'latency_ms': None,
-        'error': None,
-        'packet_loss': None
-    }
-    
-    if not is_valid_ipv4(ip_address):
-        result['error'] = "Invalid IP address format"
-        return result
+    from .probes import run_sync, async_measure_ping_latency
     
-    # Try multiple times if needed
-    for attempt in range(retry_count + 1):
-        try:
-            param = '-n' if platform.system().lower() == 'windows' else '-c'
-            timeout_param = '-w' if platform.system().lower() == 'windows' else '-W'
-            timeout_value = str(timeout * 1000) if platform.system().lower() == 'windows' else str(timeout)
-            
-            command = ['ping', param, str(count), timeout_param, timeout_value, ip_address]
-            
-            process = subprocess.Popen(
-                command, 
-                stdout=subprocess.PIPE, 
-                stderr=subprocess.PIPE
-            )
-            stdout, stderr = process.communicate(timeout=timeout + 5)  # Add buffer time
-            stdout_str = stdout.decode(errors='ignore')
-            
-            # Check for packet loss
-            if platform.system().lower() == 'windows':
-                loss_pattern = r'(\d+)% loss'
-                loss_match = re.search(loss_pattern, stdout_str)
-                if loss_match:
-                    result['packet_loss'] = int(loss_match.group(1))
-            else:
-                loss_pattern = r'(\d+)% packet loss'
-                loss_match = re.search(loss_pattern, stdout_str)
-                if loss_match:
-                    result['packet_loss'] = int(loss_match.group(1))
-            
-            # Check if device is reachable first (look for reply indicators)
-            if platform.system().lower() == 'windows':
-                if "Reply from" in stdout_str:
-                    # Device is reachable, now extract time
-                    time_pattern = r'time[=<](\d+\.?\d*)ms'
-                    time_matches = re.findall(time_pattern, stdout_str)
-                    
-                    if time_matches:
-                        # Calculate average of all responses
-                        latencies = []
-                        for match in time_matches:
-                            latencies.append(float(match))
-                        result['latency_ms'] = sum(latencies) / len(latencies)
-                        # Success, break retry loop
-                        break
-                    elif "time<1ms" in stdout_str:
-                        # Special case for very fast responses
-                        result['latency_ms'] = 0.5  # Approximate as 0.5ms
-                        break
-                    else:
-                        result['error'] = "Could not parse ping time from output"
-                else:
-                    result['error'] = "No reply received from host"
-            else:
-                # Unix format: "64 bytes from 8.8.8.8: icmp_seq=1 ttl=115 time=14.6 ms"
-                if "bytes from" in stdout_str:
-                    pattern = r'time=(\d+\.?\d*)\s*ms'
-                    times = re.findall(pattern, stdout_str)
-                    
-                    if times:
-                        # Calculate average of all responses
-                        latencies = [float(t) for t in times]
-                        result['latency_ms'] = sum(latencies) / len(latencies)
-                        break
-                    else:
-                        result['error'] = "Could not parse ping time from output"
-                else:
-                    result['error'] = "No reply received from host"
-                
-        except (subprocess.TimeoutExpired, subprocess.SubprocessError) as e:
-            result['error'] = f"Ping error: {str(e)}"
-        except Exception as e:
-            result['error'] = f"Error: {str(e)}"
-        
-        # If we reach here and it's not the last attempt, try again
-        if attempt < retry_count:
-            time.sleep(1)  # Wait a bit before retrying
-        
-    return result
+    return run_sync(async_measure_ping_latency(
+        ip_address,
+        count=count,
+        timeout=timeout,
+        retry_count=retry_count
+    ))
 
 def check_device_connectivity(ip_address, location="unknown", ping_count=3, timeout=5, retry_count=2):
     """
@@ -178,22 +179,13 @@ def check_internet_connectivity():
     """
     Check if the host machine has internet connectivity
     Returns True if it has internet access, False otherwise
+    
+    The answer comes from the shared uplink monitor in deviceApp/uplink.py,
+    which caches it for CONNECTIVITY_UPLINK_TTL seconds.
     """
-    try:
-        # Try to connect to Google's DNS server
-        socket.create_connection(("8.8.8.8", 53), timeout=3)
-        return True
-    except OSError:
-        pass
-    
-    try:
-        # Try to connect to Cloudflare's DNS server as a backup
-        socket.create_connection(("1.1.1.1", 53), timeout=3)
-        return True
-    except OSError:
-        pass
-        
-    return False
+    from .uplink import uplink_monitor
+    
+    return uplink_monitor.is_up()
 
 def check_port_connectivity(ip_address, ports, timeout=3):
     """
@@ -204,49 +196,17 @@ def check_port_connectivity(ip_address, ports, timeout=3):
     - ports: List of port numbers to check
     - timeout: Connection timeout in seconds
     
+    All ports are tried in parallel and the check stops at the first open
+    port, so it takes at most one timeout.
+    
     Returns a dictionary with port status results
     """
-    if not ports:
-        return {'ports_checked': 0, 'ports_open': 0, 'status': 'skipped'}
+    from .probes import run_sync, async_check_port_connectivity
     
-    # Convert string of ports to a list if needed
-    if isinstance(ports, str):
-        try:
-            ports = [int(p.strip()) for p in ports.split(',') if p.strip()]
-        except ValueError:
-            return {'error': 'Invalid port format', 'status': 'error'}
-    
-    results = {
-        'ports_checked': len(ports),
-        'ports_open': 0,
-        'open_ports': [],
-        'closed_ports': [],
-        'status': 'offline'
-    }
-    
-    for port in ports:
-        try:
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            sock.settimeout(timeout)
-            result = sock.connect_ex((ip_address, port))
-            if result == 0:  # Port is open
-                results['ports_open'] += 1
-                results['open_ports'].append(port)
-            else:
-                results['closed_ports'].append(port)
-            sock.close()
-        except Exception as e:
-            results['error'] = f"Error checking port {port}: {str(e)}"
-            results['closed_ports'].append(port)
-    
-    # Consider device online if at least one port is open
-    if results['ports_open'] > 0:
-        results['status'] = 'online'
-    
-    return results
+    return run_sync(async_check_port_connectivity(ip_address, ports, timeout))
 
 def check_device_connectivity_with_params(ip_address, device_type=None, ports=None, use_ping_fallback=True,
-                                         ping_count=3, timeout=5, retry_count=2):
+                                         ping_count=3, timeout=5, retry_count=2, rate_limits=None):
     """
     Enhanced device connectivity check supporting both port and ping checks
     
@@ -256,57 +216,25 @@ def check_device_connectivity_with_params(ip_address, device_type=None, ports=No
     - ports: Comma-separated string or list of ports to check
     - use_ping_fallback: Whether to use ping if port check fails
     - ping_count, timeout, retry_count: Parameters for ping check
+    - rate_limits: Optional list of (key, probes per second) pairs to throttle on,
+      e.g. [('school:12', 20), ('subnet:10.0.3', 10)]
     
-    Returns a dictionary with connectivity status and detailed results
+    Returns a dictionary with connectivity status and detailed results.
+    Runs on the asyncio probe engine in probes.py; use probes.run_probes
+    to check many devices at once.
     """
-    result = {
-        'ip': ip_address,
-        'status': 'offline',
-        'timestamp': datetime.now().isoformat(),
-        'device_type': device_type,
-        'error': None,
-        'port_check': None,
-        'ping_check': None
-    }
-    
-    # First try port check if ports are specified
-    if ports:
-        port_result = check_port_connectivity(ip_address, ports, timeout)
-        result['port_check'] = port_result
-        
-        # If port check shows device is online, we're done
-        if port_result['status'] == 'online':
-            result['status'] = 'online'
-            return result
-    
-    # If port check failed or wasn't performed, and ping fallback is enabled
-    if use_ping_fallback:
-        ping_result = measure_ping_latency(
-            ip_address,
-            count=ping_count,
-            timeout=timeout,
-            retry_count=retry_count
-        )
-        
-        result['ping_check'] = {
-            'latency_ms': ping_result['latency_ms'],
-            'packet_loss': ping_result['packet_loss'],
-            'error': ping_result['error']
-        }
-        
-        if ping_result['latency_ms'] is not None:
-            result['status'] = 'online'
-    
-    # If we got this far and status is still offline, record an error
-    if result['status'] == 'offline':
-        if result.get('port_check') and result.get('port_check', {}).get('error'):
-            result['error'] = result['port_check']['error']
-        elif result.get('ping_check') and result.get('ping_check', {}).get('error'):
-            result['error'] = result['ping_check']['error']
-        else:
-            result['error'] = "Device is unreachable"
+    from .probes import run_sync, async_check_device_connectivity_with_params
     
-    return result
+    return run_sync(async_check_device_connectivity_with_params(
+        ip_address,
+        device_type=device_type,
+        ports=ports,
+        use_ping_fallback=use_ping_fallback,
+        ping_count=ping_count,
+        timeout=timeout,
+        retry_count=retry_count,
+        rate_limits=rate_limits
+    ))
 
 def check_ips_connectivity(ip_addresses, locations=None, ping_count=3, timeout=5, retry_count=2):
     """
@@ -382,23 +310,13 @@ def check_device_internet_connectivity():
     """
     Check if the host machine has internet connectivity
     Returns True if it has internet access, False otherwise
+    
+    The answer comes from the shared uplink monitor in deviceApp/uplink.py,
+    which caches it for CONNECTIVITY_UPLINK_TTL seconds.
     """
-    import socket
-    try:
-        # Try to connect to Google's DNS server
-        socket.create_connection(("8.8.8.8", 53), timeout=3)
-        return True
-    except OSError:
-        pass
-    
-    try:
-        # Try to connect to Cloudflare's DNS server as a backup
-        socket.create_connection(("1.1.1.1", 53), timeout=3)
-        return True
-    except OSError:
-        pass
-        
-    return False
+    from .uplink import uplink_monitor
+    
+    return uplink_monitor.is_up()
 
 
 
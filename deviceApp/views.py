@@ -1,32 +1,122 @@
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
-from django.utils.timezone import now
+from django.utils.timezone import is_naive, make_aware, now
 from django.shortcuts import get_object_or_404, render
 from rest_framework.parsers import JSONParser
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
-from .models import Device
-from .serializers import DeviceSerializer
+from datetime import timedelta
+from django.db.models import Count
+from django.db.models.functions import TruncMonth
+from django.utils.dateparse import parse_datetime
+from backend.pagination import page_data, paginate
+from .models import ConnectivityRollup, Device, StatusTransitionEvent
+from .rollups import empty_stats, histogram_percentile, merge_stats, STAT_FIELDS
+from .serializers import ConnectivityRollupSerializer, DeviceSerializer, StatusTransitionEventSerializer
+from .scheduling import fleet_probe_rate, get_scheduler_mode, get_sweep_tick
+from .sla import GROUPINGS, report_records, sla_report
 
 def get_device_page(request):
     return render(request, 'device/manage.html')
 
 
+def parse_window(request, default_length):
+    """
+    Report window from the ?start= and ?end= ISO timestamps; timestamps
+    without an offset are taken in the server's time zone.
+    
+    Parameters:
+    - request: The request
+    - default_length: timedelta before end used when start is missing
+    
+    Raises ValueError if either is not a valid timestamp.
+    """
+    def parse(value):
+        timestamp = parse_datetime(value)
+        if timestamp is None:
+            raise ValueError(value)
+        return make_aware(timestamp) if is_naive(timestamp) else timestamp
+    
+    end = parse(request.GET['end']) if request.GET.get('end') else now()
+    start = parse(request.GET['start']) if request.GET.get('start') else end - default_length
+    return start, end
+
+
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_device_list(request):
+    """
+    List devices with their last known status, newest first, one cursor
+    page at a time (?cursor=, ?page_size=; see backend/pagination.py).
+    With ?refresh=true every device on the page is probed first
+    (concurrently), otherwise no probe runs.
+    
+    Query parameters (filters):
+    - province, district: School location
+    - school: School ID
+    - type: Device type
+    - status: 'online', 'no_internet', 'offline' or 'unknown', matched
+      against the stored status
+    """
     devices = Device.objects.all()
+    if request.GET.get('province'):
+        devices = devices.filter(school__province=request.GET['province'])
+    if request.GET.get('district'):
+        devices = devices.filter(school__district=request.GET['district'])
+    if request.GET.get('type'):
+        devices = devices.filter(type=request.GET['type'])
+    try:
+        if request.GET.get('school'):
+            devices = devices.filter(school_id=int(request.GET['school']))
+        if request.GET.get('status'):
+            devices = devices.filter(Device.stored_status_filter(request.GET['status']))
+    except ValueError:
+        return JsonResponse({'error': 'school must be an integer and status one of online, no_internet, '
+                                      'offline or unknown'}, status=400)
+    
+    paginator, devices = paginate(request, DeviceSerializer.setup_eager_loading(devices))
+    if request.GET.get('refresh') == 'true':
+        Device.check_connectivity_many(devices)
     serializer = DeviceSerializer(devices, many=True)
     
     # print(f"\n\n Retrived devices data: {serializer.data.name}\n\n")
-    return JsonResponse(serializer.data, safe=False)
+    return JsonResponse(page_data(paginator, serializer.data))
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_device_summary(request):
+    """
+    Device counts for the dashboard, over the whole fleet: the total, by
+    stored status, by type, and by month added with how many of those are
+    online now. Counted in the database, so no device list is loaded.
+    """
+    statuses = ['online', 'no_internet', 'offline', 'unknown']
+    devices = Device.objects.order_by()
+    totals = devices.aggregate(
+        total=Count('id'),
+        **{status: Count('id', filter=Device.stored_status_filter(status)) for status in statuses}
+    )
+    by_month = devices.annotate(month=TruncMonth('created_at')).values('month').annotate(
+        total=Count('id'), online=Count('id', filter=Device.stored_status_filter('online'))
+    ).order_by('month')
+    return JsonResponse({
+        'total': totals['total'],
+        'by_status': {status: totals[status] for status in statuses},
+        'by_type': {row['type']: row['count']
+                    for row in devices.values('type').annotate(count=Count('id')).order_by('type')},
+        'by_month': [{'month': row['month'].strftime('%Y-%m'), 'total': row['total'], 'online': row['online']}
+                     for row in by_month]
+    })
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_device_detail(request, device_id):
-    device = get_object_or_404(Device, id=device_id)
+    """Device with its last known status; ?refresh=true probes it first"""
+    device = get_object_or_404(DeviceSerializer.setup_eager_loading(Device.objects.all()), id=device_id)
+    if request.GET.get('refresh') == 'true':
+        device.check_connectivity()
     serializer = DeviceSerializer(device)
     return JsonResponse(serializer.data)
 
@@ -173,6 +263,160 @@ def delete_device(request, device_id):
     device.delete()
     return JsonResponse({'message': 'Device deleted successfully'}, status=204)
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_scheduler_stats(request):
+    """
+    Report the probe scheduler mode and the steady-state probe rate it produces
+    """
+    from routerApp.models import Router
+    
+    device_rate = fleet_probe_rate(Device.objects.all())
+    router_rate = fleet_probe_rate(Router.objects.all())
+    return JsonResponse({
+        'mode': get_scheduler_mode(),
+        'tick_seconds': get_sweep_tick(),
+        'expected_probes_per_minute': {
+            'devices': device_rate,
+            'routers': router_rate,
+            'total': round(device_rate + router_rate, 2)
+        }
+    })
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_connectivity_rollups(request):
+    """
+    Uptime and latency buckets for a device, router, school or province,
+    read from the pre-aggregated rollups.
+    
+    Query parameters:
+    - scope: 'device', 'router', 'school' or 'province'
+    - key: Device, router or school ID, or the province name
+    - granularity: 'minute', 'hour' (default) or 'day'
+    - start, end: ISO timestamps (default: the last 24 hours)
+    """
+    scope = request.GET.get('scope')
+    key = request.GET.get('key')
+    granularity = request.GET.get('granularity', 'hour')
+    
+    if scope not in dict(ConnectivityRollup.SCOPES) or not key:
+        return JsonResponse({'error': 'scope (device, router, school or province) and key are required'}, status=400)
+    if granularity not in dict(ConnectivityRollup.GRANULARITIES):
+        return JsonResponse({'error': 'granularity must be minute, hour or day'}, status=400)
+    
+    try:
+        start, end = parse_window(request, timedelta(days=1))
+    except ValueError:
+        return JsonResponse({'error': 'start and end must be ISO timestamps'}, status=400)
+    
+    rollups = list(ConnectivityRollup.objects.filter(
+        granularity=granularity, scope=scope, scope_key=key,
+        bucket_start__gte=start, bucket_start__lt=end
+    ).order_by('bucket_start'))
+    
+    # Totals over the whole range
+    totals = empty_stats()
+    for rollup in rollups:
+        merge_stats(totals, {field: getattr(rollup, field) for field in STAT_FIELDS})
+    
+    return JsonResponse({
+        'scope': scope,
+        'key': key,
+        'granularity': granularity,
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'summary': {
+            'probe_count': totals['probe_count'],
+            'online_count': totals['online_count'],
+            'uptime_ratio': totals['online_count'] / totals['probe_count'] if totals['probe_count'] else None,
+            'min_latency_ms': totals['latency_min'],
+            'avg_latency_ms': totals['latency_sum'] / totals['latency_count'] if totals['latency_count'] else None,
+            'max_latency_ms': totals['latency_max'],
+            'p95_latency_ms': histogram_percentile(totals['latency_histogram'], 95, totals['latency_max'])
+        },
+        'buckets': ConnectivityRollupSerializer(rollups, many=True).data
+    })
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_status_transitions(request):
+    """
+    Confirmed status transitions and flapping periods, newest first
+    (see deviceApp/transitions.py).
+    
+    Query parameters:
+    - school: School ID
+    - target_type, target_id: A single device or router
+    - kind: 'transition', 'flap_start' or 'flap_end'
+    - start, end: ISO timestamps (default: the last 7 days)
+    - limit: Maximum number of events (default 500, at most 5000)
+    """
+    try:
+        start, end = parse_window(request, timedelta(days=7))
+    except ValueError:
+        return JsonResponse({'error': 'start and end must be ISO timestamps'}, status=400)
+    
+    try:
+        limit = min(int(request.GET.get('limit', 500)), 5000)
+        events = StatusTransitionEvent.objects.filter(occurred_at__gte=start, occurred_at__lt=end)
+        if request.GET.get('school'):
+            events = events.filter(school_id=int(request.GET['school']))
+        if request.GET.get('target_type'):
+            events = events.filter(target_type=request.GET['target_type'])
+        if request.GET.get('target_id'):
+            events = events.filter(target_id=int(request.GET['target_id']))
+    except ValueError:
+        return JsonResponse({'error': 'school, target_id and limit must be integers'}, status=400)
+    if request.GET.get('kind'):
+        events = events.filter(kind=request.GET['kind'])
+    
+    events = list(events.order_by('-occurred_at')[:limit])
+    return JsonResponse({
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'count': len(events),
+        'events': StatusTransitionEventSerializer(events, many=True).data
+    })
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_sla_report(request):
+    """
+    Uptime %, outage count, MTTR and MTBF per device and router, or per
+    school, computed from the status intervals (see deviceApp/sla.py).
+    
+    Query parameters:
+    - group: 'target' (default) or 'school'
+    - school: School ID
+    - target_type: 'device' or 'router'
+    - start, end: ISO timestamps (default: the last 30 days)
+    """
+    group = request.GET.get('group', 'target')
+    if group not in GROUPINGS:
+        return JsonResponse({'error': 'group must be target or school'}, status=400)
+    
+    try:
+        start, end = parse_window(request, timedelta(days=30))
+        if start >= end:
+            raise ValueError(start)
+    except ValueError:
+        return JsonResponse({'error': 'start and end must be ISO timestamps with start before end'}, status=400)
+    
+    try:
+        school_id = int(request.GET['school']) if request.GET.get('school') else None
+    except ValueError:
+        return JsonResponse({'error': 'school must be an integer'}, status=400)
+    
+    report = sla_report(start, end, group, request.GET.get('target_type') or None, school_id)
+    return JsonResponse({
+        'group': group,
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'count': len(report),
+        'results': report_records(report)
+    })
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def check_device_status(request, device_id):
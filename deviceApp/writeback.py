@@ -0,0 +1,115 @@
+# deviceApp/writeback.py
+"""
+Batched write-back of probe results.
+
+Inside a probe_write_batch() block, probe state upserts (state.py), probe
+history rows (history.py) and status transition events and intervals
+(transitions.py) are collected in memory instead of being written one
+target at a time. When the block ends everything is flushed in one
+transaction: one upsert per state model and field set per 500 targets, one
+bulk insert per appended model, and one rollup update. The schedules of
+unchanged targets then go to the cache in one call (see writepolicy.py).
+The sweeps wrap each chunk in a batch, so a sweep costs a handful of round
+trips per chunk rather than one or more per device.
+
+Nested blocks join the outermost batch. Outside a batch, writes happen
+immediately.
+"""
+import contextvars
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.db import transaction
+
+# Writes collected by the outermost probe_write_batch(), or None outside a batch
+_pending_writes = contextvars.ContextVar('probe_pending_writes', default=None)
+
+
+class PendingWrites:
+    """Probe state and history writes waiting to be flushed"""
+
+    def __init__(self):
+        # (state model, target id) -> (target, fields to write)
+        self.states = {}
+        self.history = []
+        # Other append-only rows (transition events, intervals), by model
+        self.rows = defaultdict(list)
+        # Unchanged targets whose schedule is only cached
+        self.heartbeats = []
+
+    def add_state(self, target, fields=None):
+        from .state import PROBE_STATE_FIELDS
+
+        key = (type(target), target.pk)
+        _, pending_fields = self.states.get(key, (target, set()))
+        pending_fields.update(fields or PROBE_STATE_FIELDS)
+        self.states[key] = (target, pending_fields)
+
+    def add_history(self, row):
+        self.history.append(row)
+
+    def add_row(self, row):
+        self.rows[type(row)].append(row)
+
+    def add_heartbeat(self, target):
+        self.heartbeats.append(target)
+
+    def flush(self):
+        from .models import ProbeResult
+        from .rollups import update_rollups
+        from .writepolicy import defer_heartbeats
+
+        # Targets writing the same fields share an upsert
+        targets_by_fields = defaultdict(list)
+        for (model, _), (target, fields) in self.states.items():
+            targets_by_fields[(model, tuple(sorted(fields)))].append(target)
+
+        with transaction.atomic():
+            for (model, fields), targets in targets_by_fields.items():
+                model.save_probe_states(targets, list(fields), batched=False)
+            if self.history:
+                ProbeResult.objects.bulk_create(self.history, batch_size=1000)
+                update_rollups(self.history)
+            for model, rows in self.rows.items():
+                model.objects.bulk_create(rows, batch_size=1000)
+        defer_heartbeats(self.heartbeats)
+
+        self.states = {}
+        self.history = []
+        self.rows = defaultdict(list)
+        self.heartbeats = []
+
+
+def defer_heartbeat(target):
+    """Cache an unchanged target's schedule, at the end of the current batch if any"""
+    from .writepolicy import defer_heartbeats
+
+    writes = pending_writes()
+    if writes is not None:
+        writes.add_heartbeat(target)
+    else:
+        defer_heartbeats([target])
+
+
+def pending_writes():
+    """The current batch, or None when writes should happen immediately"""
+    return _pending_writes.get()
+
+
+@contextmanager
+def probe_write_batch():
+    """
+    Collect probe state and history writes made inside the block and flush
+    them in one transaction at the end
+    """
+    if _pending_writes.get() is not None:
+        yield
+        return
+
+    writes = PendingWrites()
+    token = _pending_writes.set(writes)
+    try:
+        yield
+    finally:
+        _pending_writes.reset(token)
+        writes.flush()
@@ -0,0 +1,113 @@
+# deviceApp/writepolicy.py
+"""
+Write coalescing for probe results.
+
+Most targets report the same status sweep after sweep, so writing the probe
+state row for every probe wastes writes. A probe result is persisted only
+when it is a transition: the status, error or transition detector state
+changed (see transitions.py), or the target has no stored state yet. The
+full snapshot of an unchanged target is refreshed at most every
+CONNECTIVITY_HEARTBEAT_SECONDS; the probes in between write no row at all.
+
+What an unchanged probe does change, its HEARTBEAT_FIELDS (last_confirmed_at
+and the schedule), is held in the cache until the next heartbeat writes it
+with the rest of the row. due_queryset() (see scheduling.py) skips targets
+whose cached schedule is not due yet, and the sweeps load the cached values
+before probing again, so the schedule advances as if it had been written.
+Multi-process deployments need a shared cache (CACHE_URL), as for the sweep
+lock. If an entry is lost the target falls back to its stored schedule and
+is at worst probed early once.
+
+Every probe still lands in the history and rollups, so no measurement is
+lost; the stored snapshot's latency, last_check_attempt and
+last_confirmed_at may lag by up to one heartbeat interval.
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+from .scheduling import get_max_interval
+from .transitions import TRANSITION_FIELDS
+
+# Fields an unchanged result updates, held in the cache between heartbeats
+HEARTBEAT_FIELDS = ['last_confirmed_at', 'probe_interval', 'next_check_due']
+
+HEARTBEAT_CACHE_PREFIX = 'connectivity:heartbeat'
+
+
+def get_heartbeat_interval():
+    """Seconds between full snapshot writes for a target whose status is unchanged"""
+    return getattr(settings, 'CONNECTIVITY_HEARTBEAT_SECONDS', 300)
+
+
+def heartbeat_cache_key(model, pk):
+    return f"{HEARTBEAT_CACHE_PREFIX}:{model._meta.label_lower}:{pk}"
+
+
+def is_transition(state):
+    """
+    Whether the in-memory state differs from the stored row in status,
+    error or transition detector state
+    """
+    stored = getattr(state, '_stored_values', None)
+    if not stored:
+        return True
+    return any(stored.get(field) != getattr(state, field)
+               for field in ['last_status', 'connectivity_error'] + TRANSITION_FIELDS)
+
+
+def probe_write_fields(state, full_fields):
+    """
+    Choose which state fields to persist for a probe result.
+
+    Parameters:
+    - state: The target's probe state, already updated with the new result
+    - full_fields: Fields a full write would persist
+
+    Returns full_fields plus last_confirmed_at for transitions and due
+    heartbeats, otherwise an empty list: the result is not written and its
+    HEARTBEAT_FIELDS go to the cache (see defer_heartbeats()).
+    """
+    if is_transition(state):
+        return full_fields + ['last_confirmed_at']
+
+    last_full_write = state._stored_values.get('last_check_attempt')
+    if last_full_write is None or state.last_check_attempt is None or \
+            (state.last_check_attempt - last_full_write).total_seconds() >= get_heartbeat_interval():
+        return full_fields + ['last_confirmed_at']
+
+    return []
+
+
+def defer_heartbeats(targets):
+    """
+    Hold the HEARTBEAT_FIELDS of unchanged targets in the cache until their
+    next full write. Entries outlive the heartbeat by one maximum interval,
+    so they last until the probe that writes the heartbeat.
+    """
+    if not targets:
+        return
+    cache.set_many({
+        heartbeat_cache_key(type(target), target.pk): {field: getattr(target, field) for field in HEARTBEAT_FIELDS}
+        for target in targets
+    }, timeout=get_heartbeat_interval() + get_max_interval())
+
+
+def load_deferred_heartbeats(targets):
+    """Apply cached HEARTBEAT_FIELDS newer than the stored row to the targets"""
+    targets = {heartbeat_cache_key(type(target), target.pk): target for target in targets}
+    if not targets:
+        return
+    for key, values in cache.get_many(list(targets)).items():
+        target = targets[key]
+        if target.last_confirmed_at is None or values['last_confirmed_at'] > target.last_confirmed_at:
+            for field, value in values.items():
+                setattr(target, field, value)
+
+
+def deferred_not_due(model, pks, horizon):
+    """Keys among pks whose cached schedule is due only after horizon"""
+    keys = {heartbeat_cache_key(model, pk): pk for pk in pks}
+    if not keys:
+        return []
+    return [keys[key] for key, values in cache.get_many(list(keys)).items()
+            if values['next_check_due'] and values['next_check_due'] > horizon]
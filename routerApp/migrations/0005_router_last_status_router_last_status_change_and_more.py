@@ -0,0 +1,33 @@
+# Generated by Django 4.2.17 on 2026-10-18 08:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('routerApp', '0004_router_type'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='router',
+            name='last_status',
+            field=models.CharField(blank=True, max_length=20, null=True),
+        ),
+        migrations.AddField(
+            model_name='router',
+            name='last_status_change',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='router',
+            name='next_check_due',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='router',
+            name='probe_interval',
+            field=models.IntegerField(blank=True, help_text='Current probe interval in seconds', null=True),
+        ),
+    ]
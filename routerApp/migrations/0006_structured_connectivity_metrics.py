@@ -0,0 +1,89 @@
+# Generated by Django 4.2.17 on 2026-10-18 08:59
+
+import json
+
+from django.db import migrations, models
+
+
+def parse_connectivity_details(apps, schema_editor):
+    """Move the JSON text of the latest result into the JSON column and fill the metric columns"""
+    Router = apps.get_model('routerApp', 'Router')
+    routers = []
+    for router in Router.objects.exclude(connectivity_details_text__isnull=True).exclude(connectivity_details_text='').iterator():
+        try:
+            result = json.loads(router.connectivity_details_text)
+        except json.JSONDecodeError:
+            continue
+        if not isinstance(result, dict):
+            continue
+
+        ping_check = result.get('ping_check') or {}
+        port_check = result.get('port_check') or {}
+        router.connectivity_details = result
+        router.latency_ms = ping_check.get('latency_ms')
+        router.packet_loss = ping_check.get('packet_loss')
+        router.ports_checked = port_check.get('ports_checked')
+        router.ports_open = port_check.get('ports_open')
+        router.open_ports = port_check.get('open_ports') or []
+        routers.append(router)
+
+    Router.objects.bulk_update(routers, ['connectivity_details', 'latency_ms', 'packet_loss',
+                                       'ports_checked', 'ports_open', 'open_ports'], batch_size=500)
+
+
+def dump_connectivity_details(apps, schema_editor):
+    Router = apps.get_model('routerApp', 'Router')
+    routers = list(Router.objects.all())
+    for router in routers:
+        router.connectivity_details_text = json.dumps(router.connectivity_details) if router.connectivity_details else None
+    Router.objects.bulk_update(routers, ['connectivity_details_text'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('routerApp', '0005_router_last_status_router_last_status_change_and_more'),
+    ]
+
+    operations = [
+        migrations.RenameField(
+            model_name='router',
+            old_name='connectivity_details',
+            new_name='connectivity_details_text',
+        ),
+        migrations.AddField(
+            model_name='router',
+            name='connectivity_details',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='router',
+            name='latency_ms',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='router',
+            name='open_ports',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddField(
+            model_name='router',
+            name='packet_loss',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='router',
+            name='ports_checked',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='router',
+            name='ports_open',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.RunPython(parse_connectivity_details, dump_connectivity_details),
+        migrations.RemoveField(
+            model_name='router',
+            name='connectivity_details_text',
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.2.17 on 2026-10-18 09:04
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def initialise_last_confirmed_at(apps, schema_editor):
+    # Every probe so far was written in full, so the last attempt is the last confirmation
+    RouterProbeState = apps.get_model('routerApp', 'RouterProbeState')
+    RouterProbeState.objects.update(last_confirmed_at=F('last_check_attempt'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('routerApp', '0007_probe_state'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='routerprobestate',
+            name='last_confirmed_at',
+            field=models.DateTimeField(blank=True, help_text='When the latest probe ran (see writepolicy.py)', null=True),
+        ),
+        migrations.RunPython(initialise_last_confirmed_at, migrations.RunPython.noop),
+    ]
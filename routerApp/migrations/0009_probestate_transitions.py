@@ -0,0 +1,54 @@
+# Generated by Django 4.2.17 on 2026-10-18 09:07
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def initialise_confirmed_status(apps, schema_editor):
+    # Start every detector from the status of the latest probe (see transitions.classify_status)
+    RouterProbeState = apps.get_model('routerApp', 'RouterProbeState')
+    RouterProbeState.objects.update(confirmed_status=F('last_status'))
+    RouterProbeState.objects.filter(
+        last_status='offline', connectivity_error__contains='reachable but has no internet'
+    ).update(confirmed_status='no_internet')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('routerApp', '0008_probestate_last_confirmed_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='routerprobestate',
+            name='confirmed_status',
+            field=models.CharField(blank=True, max_length=20, null=True),
+        ),
+        migrations.AddField(
+            model_name='routerprobestate',
+            name='flapping',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='routerprobestate',
+            name='pending_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='routerprobestate',
+            name='pending_since',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='routerprobestate',
+            name='pending_status',
+            field=models.CharField(blank=True, max_length=20, null=True),
+        ),
+        migrations.AddField(
+            model_name='routerprobestate',
+            name='recent_transitions',
+            field=models.JSONField(blank=True, default=list, help_text='Times of the confirmed transitions within the flap window'),
+        ),
+        migrations.RunPython(initialise_confirmed_status, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.2.17 on 2026-10-18 09:08
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def initialise_status_since(apps, schema_editor):
+    # Best estimate of when the current status started
+    RouterProbeState = apps.get_model('routerApp', 'RouterProbeState')
+    RouterProbeState.objects.filter(confirmed_status__isnull=False).update(status_since=F('last_status_change'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('routerApp', '0009_probestate_transitions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='routerprobestate',
+            name='status_since',
+            field=models.DateTimeField(blank=True, help_text='Start of the current confirmed status', null=True),
+        ),
+        migrations.RunPython(initialise_status_since, migrations.RunPython.noop),
+    ]
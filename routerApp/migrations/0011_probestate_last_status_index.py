@@ -0,0 +1,18 @@
+# Generated by Django 4.2.17 on 2026-10-18 09:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('routerApp', '0010_probestate_status_since'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='routerprobestate',
+            name='last_status',
+            field=models.CharField(blank=True, db_index=True, max_length=20, null=True),
+        ),
+    ]
@@ -1,17 +1,10 @@
 from django.db import models
 from django.utils.timezone import now
 from userApp.models import CustomUser
-from datetime import datetime
-import json
 from deviceApp.models import Device
+from deviceApp.state import ProbeState, ProbeTargetMixin
 
-from .utils import (
-    check_device_connectivity_with_params,
-    check_internet_connectivity,
-    is_valid_ipv4
-)
-
-class Router(models.Model):
+class Router(ProbeTargetMixin, models.Model):
     
     name = models.CharField(max_length=255)
     access_point = models.ForeignKey(Device, on_delete=models.CASCADE, related_name='access_point')
@@ -20,7 +13,6 @@ class Router(models.Model):
     created_by = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='router')
     created_at = models.DateTimeField(default=now)
     last_updated = models.DateTimeField(auto_now=True)
-    last_connectivity = models.DateTimeField(null=True, blank=True)
     # Add the missing type field
     type = models.CharField(max_length=100, default='router')
     
@@ -32,10 +24,9 @@ class Router(models.Model):
     timeout = models.IntegerField(default=5)
     retry_count = models.IntegerField(default=2)
     
-    # Status tracking fields
-    last_check_attempt = models.DateTimeField(null=True, blank=True)
-    connectivity_error = models.CharField(max_length=255, blank=True, null=True)
-    connectivity_details = models.TextField(blank=True, null=True)
+    # Probe status and schedule live in the probe_state row, connectivity
+    # checks are shared with Device (see deviceApp/state.py)
+    target_type = 'router'
     
     class Meta:
         ordering = ['-last_updated']
@@ -46,130 +37,11 @@ class Router(models.Model):
     def __str__(self):
         return f"{self.name} ({self.type}) - {self.access_point.name}"
     
-    @property
-    def status(self):
-        """Dynamic property that returns the current connectivity status"""
-        try:
-            latest_check = self.check_connectivity()
-            return latest_check.get('status', 'unknown')
-        except Exception as e:
-            self.connectivity_error = str(e)
-            self.save(update_fields=['connectivity_error'])
-            return 'error'
-    
-    @property
-    def connection_details(self):
-        """Returns the latest connectivity check details as a dictionary"""
-        if self.connectivity_details:
-            try:
-                return json.loads(self.connectivity_details)
-            except json.JSONDecodeError:
-                return {}
-        return {}
-    
-    def check_connectivity(self, save_result=True):
-        """
-        Check if the device is online using both port checks and ping based on the utils module.
-        Updates device status fields and returns the detailed result dictionary.
-        
-        Parameters:
-        - save_result: Whether to save the result to the database
-        
-        Returns: 
-        - Dictionary with detailed connectivity information
-        """
-        # Update check attempt timestamp
-        self.last_check_attempt = now()
-        self.connectivity_error = None
-        
-        # Basic validation
-        if not self.ip_address:
-            self.connectivity_error = "No IP address configured"
-            if save_result:
-                self.save(update_fields=['last_check_attempt', 'connectivity_error'])
-            return {'status': 'offline', 'error': self.connectivity_error}
-            
-        if not is_valid_ipv4(self.ip_address):
-            self.connectivity_error = "Invalid IP address format"
-            if save_result:
-                self.save(update_fields=['last_check_attempt', 'connectivity_error'])
-            return {'status': 'offline', 'error': self.connectivity_error}
-        
-        # Check if host machine has internet connectivity
-        if not check_internet_connectivity():
-            self.connectivity_error = "Host machine has no internet connection"
-            if save_result:
-                self.save(update_fields=['last_check_attempt', 'connectivity_error'])
-            return {'status': 'unknown', 'error': self.connectivity_error}
-        
-        # Use the enhanced connectivity check function from utils
-        result = check_device_connectivity_with_params(
-            ip_address=self.ip_address,
-            device_type=self.type,
-            ports=self.check_ports,
-            use_ping_fallback=self.use_ping_fallback,
-            ping_count=self.ping_count,
-            timeout=self.timeout,
-            retry_count=self.retry_count
-        )
-        
-        # Update device fields based on check results
-        if result['status'] == 'online':
-            self.last_connectivity = now()
-            self.connectivity_error = None
-        else:
-            self.connectivity_error = result.get('error', 'Device is unreachable')
-        
-        # Store the detailed results 
-        self.connectivity_details = json.dumps(result)
-        
-        if save_result:
-            fields_to_update = [
-                'last_check_attempt', 
-                'connectivity_error', 
-                'connectivity_details'
-            ]
-            
-            if result['status'] == 'online':
-                fields_to_update.append('last_connectivity')
-                
-            self.save(update_fields=fields_to_update)
-        
-        return result
+    def get_school(self):
+        return self.access_point.school
     
-    def get_connectivity_metrics(self):
-        """
-        Returns consolidated connectivity metrics based on the latest check
-        """
-        details = self.connection_details
-        
-        metrics = {
-            'status': self.status,
-            'last_check': self.last_check_attempt,
-            'last_online': self.last_connectivity,
-            'error': self.connectivity_error
-        }
-        
-        # Extract ping metrics if available
-        if details and 'ping_check' in details:
-            ping_data = details['ping_check']
-            if ping_data:
-                metrics.update({
-                    'latency_ms': ping_data.get('latency_ms'),
-                    'packet_loss': ping_data.get('packet_loss')
-                })
-        
-        # Extract port check metrics if available
-        if details and 'port_check' in details:
-            port_data = details['port_check']
-            if port_data:
-                metrics.update({
-                    'ports_checked': port_data.get('ports_checked'),
-                    'ports_open': port_data.get('ports_open'),
-                    'open_ports': port_data.get('open_ports')
-                })
-        
-        return metrics
+    def get_school_id(self):
+        return self.access_point.school_id
     
     @classmethod  # Fixed: Changed from instance method to class method
     def bulk_check_devices(cls, access_point_id=None, device_type=None):
@@ -188,51 +60,14 @@ class Router(models.Model):
         if device_type:
             filters['type'] = device_type
             
-        devices = cls.objects.filter(**filters)
-        
-        results = {
-            'timestamp': datetime.now().isoformat(),
-            'total_devices': devices.count(),
-            'online_count': 0,
-            'offline_count': 0,
-            'error_count': 0,
-            'details': {}
-        }
-        
-        for device in devices:
-            device_result = device.check_connectivity()
-            
-            # Update counts
-            if device_result['status'] == 'online':
-                results['online_count'] += 1
-            elif device_result['status'] == 'offline':
-                results['offline_count'] += 1
-            else:
-                results['error_count'] += 1
-                
-            # Store detailed result
-            results['details'][device.id] = {
-                'name': device.name,
-                'ip': device.ip_address,
-                'type': device.type,
-                'status': device_result['status'],
-                'error': device_result.get('error'),
-                'access_point': device.access_point.name
-            }
-            
-            # Add latency if available
-            ping_data = device_result.get('ping_check', {})
-            if ping_data and ping_data.get('latency_ms') is not None:
-                results['details'][device.id]['latency_ms'] = ping_data['latency_ms']
-        
-        # Calculate summary statistics for online devices
-        online_devices = [details for _, details in results['details'].items() 
-                         if details['status'] == 'online' and 'latency_ms' in details]
-        
-        if online_devices:
-            latencies = [device['latency_ms'] for device in online_devices]
-            results['avg_latency_ms'] = sum(latencies) / len(latencies)
-            results['min_latency_ms'] = min(latencies)
-            results['max_latency_ms'] = max(latencies)
-        
-        return results
\ No newline at end of file
+        devices = cls.objects.filter(**filters).select_related('access_point', 'access_point__school', 'probe_state')
+        return cls.summarize_checks(devices, lambda device: {'access_point': device.access_point.name})
+
+
+class RouterProbeState(ProbeState):
+    """Current probe state of a router (see deviceApp/state.py)"""
+    target = models.OneToOneField(Router, on_delete=models.CASCADE, primary_key=True,
+                                  related_name='probe_state')
+
+    def __str__(self):
+        return f"Probe state of router {self.target_id}: {self.last_status}"
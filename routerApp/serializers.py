@@ -21,6 +21,11 @@ class SchoolSerializer(serializers.ModelSerializer):
 
 
 
+def nested_columns(path, serializer_class):
+    """only() arguments for the columns a nested serializer reads through `path`"""
+    return [f'{path}__{field}' for field in serializer_class.Meta.fields]
+
+
 # In serializers.py, update the DeviceSerializer:
 
 class DeviceSerializer(serializers.ModelSerializer):
@@ -38,12 +43,20 @@ class DeviceSerializer(serializers.ModelSerializer):
         required=False  # Make it not required since you set it in the view
     )
     status = serializers.SerializerMethodField()
+    status_checked_at = serializers.DateTimeField(read_only=True)
+    status_age_seconds = serializers.SerializerMethodField()
+    status_stale = serializers.SerializerMethodField()
     connectivity_details = serializers.SerializerMethodField()
+    # Probe state fields are read through the probe_state row
+    last_connectivity = serializers.DateTimeField(read_only=True)
+    last_check_attempt = serializers.DateTimeField(read_only=True)
+    connectivity_error = serializers.CharField(read_only=True)
     
     class Meta:
         model = Device
         fields = ['id', 'name', 'mac_address', 'ip_address', 'type',
-                 'check_ports', 'use_ping_fallback', 'created_by', 'created_by_id', 'status', 'connectivity_details',
+                 'check_ports', 'use_ping_fallback', 'created_by', 'created_by_id', 'status',
+                 'status_checked_at', 'status_age_seconds', 'status_stale', 'connectivity_details',
                  'school', 'school_id', 'created_at', 'last_updated',
                  'last_connectivity', 'last_check_attempt', 'connectivity_error']
     
@@ -60,36 +73,17 @@ class DeviceSerializer(serializers.ModelSerializer):
         return super().create(validated_data)
     
     def get_status(self, obj):
-        """Get real-time status by checking device connectivity"""
-        try:
-            # Check if the method exists
-            if not hasattr(obj, 'check_connectivity'):
-                return 'error'
-                
-            # Force a new connectivity check
-            result = obj.check_connectivity()
-            
-            # Check status from the result dictionary
-            if isinstance(result, dict) and 'status' in result:
-                status = result['status']
-            else:
-                # Fall back to boolean interpretation if result is not a dict
-                is_online = bool(result)
-                status = 'online' if is_online else 'offline'
-            
-            # Check if it's reachable but has connectivity error
-            if status == 'online':
-                return 'online'
-            elif obj.connectivity_error and 'reachable but has no internet' in obj.connectivity_error:
-                return 'no_internet'  # New status for devices that are up but can't access internet
-            elif obj.connectivity_error and 'reachable but appears to be offline' in obj.connectivity_error:
-                return 'offline'  # Device is technically reachable but failing deeper checks
-            else:
-                return 'offline'
-        except Exception as e:
-            obj.connectivity_error = str(e)
-            obj.save(update_fields=['connectivity_error'])
-            return 'error'
+        """
+        Last known status from the probe state. Reading never probes; the
+        sweeps keep the status current and ?refresh=true probes on demand.
+        """
+        return obj.stored_status()
+    
+    def get_status_age_seconds(self, obj):
+        return obj.status_age_seconds()
+    
+    def get_status_stale(self, obj):
+        return obj.is_status_stale()
     
     def get_connectivity_details(self, obj):
         """Return detailed connectivity information"""
@@ -156,17 +150,43 @@ class RouterSerializer(serializers.ModelSerializer):
         required=False  # Make it not required since you set it in the view
     )
     status = serializers.SerializerMethodField()
+    status_checked_at = serializers.DateTimeField(read_only=True)
+    status_age_seconds = serializers.SerializerMethodField()
+    status_stale = serializers.SerializerMethodField()
     connectivity_details = serializers.SerializerMethodField()
+    # Probe state fields are read through the probe_state row
+    last_connectivity = serializers.DateTimeField(read_only=True)
     
     
     
     class Meta:
         model = Router
-        fields = ['id', 'name', 'status', 'access_point', 'access_point_id', 'mac_address', 'ip_address',
+        fields = ['id', 'name', 'status', 'status_checked_at', 'status_age_seconds', 'status_stale',
+                 'access_point', 'access_point_id', 'mac_address', 'ip_address',
                 'created_by', 'created_by_id',  'connectivity_details',
                  'created_at', 'last_updated',
                  'last_connectivity']
     
+    @staticmethod
+    def setup_eager_loading(queryset):
+        """
+        Load routers with their access point, its school, the users and both
+        probe states in one query, reading only the columns this serializer uses
+        """
+        return queryset.select_related(
+            'created_by', 'probe_state',
+            'access_point__created_by', 'access_point__school__created_by', 'access_point__probe_state'
+        ).only(
+            *[field.name for field in Router._meta.concrete_fields],
+            *nested_columns('created_by', CustomUserSerializer),
+            *[f'access_point__{field.name}' for field in Device._meta.concrete_fields],
+            *nested_columns('access_point__created_by', CustomUserSerializer),
+            *nested_columns('access_point__school', SchoolSerializer),
+            *nested_columns('access_point__school__created_by', CustomUserSerializer),
+            # Read by get_probe_params() when ?refresh=true probes the page
+            'access_point__school__probe_rate_limit'
+        )
+    
     def create(self, validated_data):
         # If there's no context or request, just use the validated data as is
         if 'request' not in self.context and 'created_by' not in validated_data:
@@ -180,36 +200,17 @@ class RouterSerializer(serializers.ModelSerializer):
         return super().create(validated_data)
     
     def get_status(self, obj):
-        """Get real-time status by checking device connectivity"""
-        try:
-            # Check if the method exists
-            if not hasattr(obj, 'check_connectivity'):
-                return 'error'
-                
-            # Force a new connectivity check
-            result = obj.check_connectivity()
-            
-            # Check status from the result dictionary
-            if isinstance(result, dict) and 'status' in result:
-                status = result['status']
-            else:
-                # Fall back to boolean interpretation if result is not a dict
-                is_online = bool(result)
-                status = 'online' if is_online else 'offline'
-            
-            # Check if it's reachable but has connectivity error
-            if status == 'online':
-                return 'online'
-            elif obj.connectivity_error and 'reachable but has no internet' in obj.connectivity_error:
-                return 'no_internet'  # New status for devices that are up but can't access internet
-            elif obj.connectivity_error and 'reachable but appears to be offline' in obj.connectivity_error:
-                return 'offline'  # Device is technically reachable but failing deeper checks
-            else:
-                return 'offline'
-        except Exception as e:
-            obj.connectivity_error = str(e)
-            obj.save(update_fields=['connectivity_error'])
-            return 'error'
+        """
+        Last known status from the probe state. Reading never probes; the
+        sweeps keep the status current and ?refresh=true probes on demand.
+        """
+        return obj.stored_status()
+    
+    def get_status_age_seconds(self, obj):
+        return obj.status_age_seconds()
+    
+    def get_status_stale(self, obj):
+        return obj.is_status_stale()
     
     def get_connectivity_details(self, obj):
         """Return detailed connectivity information"""
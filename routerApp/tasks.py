@@ -1,152 +1,244 @@
-# deviceApp/tasks.py
+# routerApp/tasks.py
 import datetime
 from celery import shared_task
+from django.conf import settings
 from django.utils.timezone import now
-from .models import Device, check_device_internet_connectivity
+from deviceApp.cycles import (
+    SweepLock, cycle_expired, fail_cycle, finish_cycle, record_chunk_progress, start_cycle
+)
+from deviceApp.models import Device
+from deviceApp.probememo import probe_memo
+from deviceApp.writeback import probe_write_batch
+from deviceApp.writepolicy import load_deferred_heartbeats
+from deviceApp.scheduling import due_queryset, fleet_probe_rate
+from deviceApp.sharding import get_chunk_size
+from .models import Router
+from .utils import check_device_internet_connectivity
 import logging
 
 logger = logging.getLogger(__name__)
 
-@shared_task
-def check_all_devices_connectivity():
+PARENT_DOWN = 'parent_down'
+
+
+def last_known_result(device, max_age):
     """
-    Background task to check connectivity for all devices
-    and update their last_connectivity timestamps
+    Return the stored result of the device's latest check if it was made
+    within max_age seconds, otherwise None.
     """
-    devices = Device.objects.all()
-    results = {
-        'total': devices.count(),
-        'online': 0,
-        'offline': 0,
-        'errors': 0
-    }
-    
-    for device in devices:
-        try:
-            if device.check_connectivity():
-                results['online'] += 1
-            else:
-                results['offline'] += 1
-        except Exception as e:
-            results['errors'] += 1
-            logger.error(f"Error checking connectivity for device {device.id} ({device.name}): {str(e)}")
-    
-    logger.info(f"Completed connectivity check: {results}")
-    return results
+    # last_confirmed_at moves on every probe; last_check_attempt only on full writes
+    checked_at = device.last_confirmed_at or device.last_check_attempt
+    if not checked_at:
+        return None
+    if (now() - checked_at).total_seconds() > max_age:
+        return None
 
-@shared_task
-def check_device_connectivity_by_id(device_id):
+    result = device.connection_details
+    if result.get('status'):
+        return result
+    # Checks that failed validation store only the error
+    return {'status': 'offline', 'error': device.connectivity_error}
+
+
+def resolve_access_point_statuses(access_points):
+    """
+    Get the current status of each access point, parents first.
+
+    Access points checked within CONNECTIVITY_PARENT_STATUS_MAX_AGE seconds
+    (normally by the device sweep) reuse that result; the rest are probed
+    concurrently now.
+
+    Returns a dictionary mapping access point id to its result dictionary.
     """
-    Background task to check connectivity for a specific device
+    max_age = getattr(settings, 'CONNECTIVITY_PARENT_STATUS_MAX_AGE', 180)
+
+    statuses = {}
+    stale = []
+    for access_point in access_points:
+        result = last_known_result(access_point, max_age)
+        if result is None:
+            stale.append(access_point)
+        else:
+            statuses[access_point.id] = result
+
+    for access_point, result in Device.check_connectivity_many(stale):
+        statuses[access_point.id] = result
+
+    return statuses
+
+
+def is_down(access_point_result):
     """
-    try:
-        device = Device.objects.get(id=device_id)
-        is_online = device.check_connectivity()
+    Whether an access point result shows it down: a probe that failed, or an
+    outage derived from upstream. An access point that could not be probed
+    at all (no IP address, or an invalid one) says nothing about its routers.
+    """
+    if access_point_result.get('status') != 'offline':
+        return False
+    return bool(access_point_result.get('cause')) or any(
+        access_point_result.get(check) is not None for check in ('ping_check', 'port_check')
+    )
+
+
+def root_cause(access_point, access_point_result):
+    """
+    Describe the ancestor responsible for an access point being down.
+    If the access point was itself derived offline (e.g. its subnet is
+    unreachable), that upstream cause is reported instead.
+    """
+    if access_point_result.get('cause'):
         return {
-            'device_id': device_id,
-            'device_name': device.name,
-            'status': 'online' if is_online else 'offline',
-            'last_connectivity': device.last_connectivity.isoformat() if device.last_connectivity else None
+            'type': access_point_result['cause'],
+            'subnet': access_point_result.get('subnet'),
+            'via_access_point': access_point.id
         }
-    except Device.DoesNotExist:
-        logger.error(f"Device with ID {device_id} not found")
-        return {'error': f'Device with ID {device_id} not found'}
-    except Exception as e:
-        logger.error(f"Error checking connectivity for device {device_id}: {str(e)}")
-        return {'error': str(e)}
+    return {
+        'type': 'access_point',
+        'id': access_point.id,
+        'name': access_point.name,
+        'ip': access_point.ip_address
+    }
+
 
+def sweep_routers(routers, access_point_statuses):
+    """
+    Probe one chunk of routers along the Router -> access point topology.
 
+    Parameters:
+    - routers: Routers with their access points loaded
+    - access_point_statuses: Access point results already resolved in this
+      sweep, by access point id; the chunk's missing ones are added
 
+    Returns a list of (router, result dictionary) tuples.
+    """
+    # Pick up the schedules cached since the last heartbeat (see deviceApp/writepolicy.py)
+    load_deferred_heartbeats(routers)
+    access_points = {router.access_point_id: router.access_point for router in routers
+                     if router.access_point_id not in access_point_statuses}
+    access_point_statuses.update(resolve_access_point_statuses(access_points.values()))
 
+    to_probe = []
+    router_results = []
+    for router in routers:
+        access_point = router.access_point
+        access_point_result = access_point_statuses[access_point.id]
+
+        if is_down(access_point_result):
+            cause = root_cause(access_point, access_point_result)
+            router_results.append((router, router.apply_derived_status(
+                PARENT_DOWN,
+                f"Parent access point {access_point.name} is down",
+                root_cause=cause
+            )))
+        else:
+            to_probe.append(router)
+
+    return router_results + Router.check_connectivity_many(to_probe)
 
 
 @shared_task
-def check_all_devices_connectivity():
+def check_all_routers_connectivity():
     """
-    Background task to check connectivity for all devices
-    and update their last_connectivity timestamps
-    
-    Intelligently groups devices by network to optimize checks
+    Background task to check connectivity for all routers that are due
+    (see deviceApp/scheduling.py).
+
+    Probes along the Router -> access point topology: each router's access
+    point is resolved first, and routers behind an access point that is down
+    are recorded offline with cause 'parent_down' and the ancestor that
+    caused the outage instead of being probed themselves.
+
+    Like the device sweep, only one router sweep runs at a time and each run
+    is recorded as a SweepCycle with a time budget (see deviceApp/cycles.py).
+    Due routers are probed longest-waiting first in chunks; once the budget
+    is spent the remaining chunks are carried over to the next sweep.
     """
     # First check if the host has internet connectivity
     if not check_device_internet_connectivity():
-        logger.warning("Host machine has no internet connection, skipping device checks")
+        logger.warning("Host machine has no internet connection, skipping router checks")
         return {
             'status': 'error',
             'message': 'Host machine has no internet connection',
             'total': 0
         }
-    
-    devices = Device.objects.all()
-    results = {
-        'total': devices.count(),
-        'online': 0,
-        'offline': 0,
-        'errors': 0,
-        'no_internet': 0,
-        'details': []
-    }
-    
-    # Group devices by network to optimize checks
-    # (devices on same subnet likely share connectivity status)
-    network_groups = {}
-    for device in devices:
-        if not device.ip_address:
-            continue
-        
-        # Extract network part (first 3 octets for simple grouping)
-        try:
-            network = '.'.join(device.ip_address.split('.')[:3])
-            if network not in network_groups:
-                network_groups[network] = []
-            network_groups[network].append(device)
-        except:
-            # Fallback for unusual IP formats
-            network_groups.setdefault('others', []).append(device)
-    
-    # Process each network group
-    for network, network_devices in network_groups.items():
-        logger.info(f"Checking {len(network_devices)} devices on network {network}")
-        
-        for device in network_devices:
-            try:
-                previous_status = 'online' if device.last_connectivity and (
-                    device.last_connectivity >= device.last_check_attempt) else 'offline'
-                
-                if device.check_connectivity():
-                    results['online'] += 1
-                    status = 'online'
-                else:
-                    if device.connectivity_error and 'reachable but has no internet' in device.connectivity_error:
-                        results['no_internet'] += 1
-                        status = 'no_internet'
-                    else:
-                        results['offline'] += 1
-                        status = 'offline'
-                
-                # Record status change events
-                if previous_status != status:
+
+    # Never run two router sweeps at once
+    lock = SweepLock('routers')
+    lock_token = lock.acquire()
+    if lock_token is None:
+        logger.warning("Previous router sweep is still running, skipping this one")
+        return {
+            'status': 'skipped',
+            'message': 'Previous router sweep is still running',
+            'total': 0
+        }
+
+    cycle = None
+    try:
+        # Only probe routers whose adaptive interval has elapsed, longest-waiting first
+        routers = list(due_queryset(Router.objects.select_related(
+            'access_point', 'access_point__school', 'access_point__probe_state', 'probe_state'
+        )))
+        chunk_size = get_chunk_size()
+        chunks = [routers[index:index + chunk_size] for index in range(0, len(routers), chunk_size)]
+        cycle = start_cycle('routers', len(routers), chunk_count=len(chunks))
+        results = {
+            'total': len(routers),
+            'online': 0,
+            'offline': 0,
+            'parent_down': 0,
+            'errors': 0,
+            'chunks': 0,
+            'carried_over': 0,
+            'details': []
+        }
+
+        # Probe each router and access point at most once per sweep, and write
+        # each chunk's probe state and history back in one transaction
+        access_point_statuses = {}
+        router_results = []
+        with probe_memo():
+            for index, chunk in enumerate(chunks):
+                if cycle_expired(cycle.id):
+                    results['carried_over'] = sum(len(skipped) for skipped in chunks[index:])
+                    break
+                with probe_write_batch():
+                    router_results += sweep_routers(chunk, access_point_statuses)
+                record_chunk_progress(cycle.id, len(chunk))
+                results['chunks'] += 1
+
+        for router, result in router_results:
+            status = result.get('status')
+            if status == 'online':
+                results['online'] += 1
+            elif status == 'offline':
+                results['offline'] += 1
+                if result.get('cause') == PARENT_DOWN:
+                    results['parent_down'] += 1
                     results['details'].append({
-                        'device_id': device.id,
-                        'name': device.name,
-                        'previous': previous_status,
-                        'current': status,
-                        'timestamp': datetime.now().isoformat()
+                        'router_id': router.id,
+                        'name': router.name,
+                        'cause': PARENT_DOWN,
+                        'root_cause': result.get('root_cause'),
+                        'timestamp': datetime.datetime.now().isoformat()
                     })
-                    
-                    logger.info(f"Device {device.name} ({device.ip_address}) changed from {previous_status} to {status}")
-                    
-                    # Possibly send notification here for status changes
-                    
-            except Exception as e:
+            else:
                 results['errors'] += 1
-                logger.error(f"Error checking connectivity for device {device.id} ({device.name}): {str(e)}")
                 results['details'].append({
-                    'device_id': device.id, 
-                    'name': device.name,
-                    'error': str(e)
+                    'router_id': router.id,
+                    'name': router.name,
+                    'error': result.get('error')
                 })
-    
-    logger.info(f"Completed connectivity check: {results['online']} online, {results['offline']} offline, " 
-                f"{results['no_internet']} no internet, {results['errors']} errors")
-    return results
\ No newline at end of file
+
+        results['expected_probes_per_minute'] = fleet_probe_rate(Router.objects.all())
+        finish_cycle(cycle.id, results)
+    except Exception as e:
+        # Close the cycle rather than leave it 'running' forever
+        fail_cycle(cycle.id if cycle else None, e)
+        raise
+    finally:
+        lock.release(lock_token)
+
+    logger.info(f"Completed router connectivity check: {results['online']} online, {results['offline']} offline "
+                f"({results['parent_down']} behind a down access point), {results['errors']} errors "
+                f"in {results['chunks']} chunks, {results['carried_over']} carried over")
+    return results
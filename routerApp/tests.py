@@ -1,3 +1,165 @@
-from django.test import TestCase
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from deviceApp.cycles import SweepLock
+from deviceApp.models import Device, DeviceProbeState, SweepCycle
+from schoolApp.models import School
+from userApp.models import CustomUser
+from .models import Router, RouterProbeState
+from .tasks import PARENT_DOWN, check_all_routers_connectivity
 
 # Create your tests here.
+
+
+@override_settings(ALLOWED_HOSTS=['testserver'],
+                   PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class RouterListQueryCountTests(TestCase):
+    """The router endpoints must not issue queries per listed router"""
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user('Test', 'User', '0700000000', 'admin', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        school = School.objects.create(index_number='S1', name='School', province='Kigali',
+                                       district='Gasabo', created_by=self.user)
+        self.access_point = Device.objects.create(name='AP', mac_address='00:00:00:00:00:01', ip_address='10.0.0.1',
+                                                  type='access_point', school=school, created_by=self.user)
+        DeviceProbeState.objects.create(target=self.access_point, last_status='online', probe_interval=180)
+
+    def create_routers(self, count):
+        for index in range(count):
+            creator = CustomUser.objects.create_user('Owner', str(index), f'08{index:08d}', 'admin', password='secret')
+            router = Router.objects.create(name=f'Router {index}', mac_address=f'00:00:00:01:{index // 256:02X}:{index % 256:02X}',
+                                           ip_address=f'10.1.{index // 256}.{index % 256}',
+                                           access_point=self.access_point, created_by=creator)
+            if index % 2:
+                RouterProbeState.objects.create(target=router, last_status='offline', probe_interval=60)
+
+    def assert_list_queries(self, count):
+        self.create_routers(count)
+        # One query for the access point, one for its routers
+        with self.assertNumQueries(2):
+            response = self.client.get(f'/router/{self.access_point.id}/routers/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), count)
+
+    def test_list_with_one_router(self):
+        self.assert_list_queries(1)
+
+    def test_list_with_many_routers(self):
+        self.assert_list_queries(25)
+
+    def test_refresh_requires_authentication(self):
+        self.create_routers(1)
+        client = APIClient()
+        with mock.patch('deviceApp.state.run_probes') as run_probes:
+            response = client.get(f'/router/{self.access_point.id}/routers/?refresh=true')
+        self.assertEqual(response.status_code, 401)
+        run_probes.assert_not_called()
+        self.assertEqual(client.get(f'/router/{self.access_point.id}/routers/').status_code, 200)
+
+    def test_status_filter(self):
+        self.create_routers(4)
+        response = self.client.get(f'/router/{self.access_point.id}/routers/?status=offline')
+        self.assertEqual([router['status'] for router in response.json()['results']], ['offline', 'offline'])
+        self.assertEqual(self.client.get(f'/router/{self.access_point.id}/routers/?status=bogus').status_code, 400)
+
+    def refresh_queries(self, count):
+        """Queries issued by a ?refresh=true list of `count` routers with the probes faked"""
+        CustomUser.objects.exclude(id=self.user.id).delete()
+        self.create_routers(count)
+        with mock.patch('deviceApp.state.run_probes',
+                        side_effect=lambda targets, concurrency=None: [{'status': 'online'} for _ in targets]), \
+                mock.patch('deviceApp.state.check_internet_connectivity', return_value=True), \
+                CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f'/router/{self.access_point.id}/routers/?refresh=true')
+        self.assertEqual(len(response.json()['results']), count)
+        return len(queries)
+
+    def test_refresh_does_not_query_per_router(self):
+        self.assertEqual(self.refresh_queries(1), self.refresh_queries(10))
+
+    def test_detail(self):
+        self.create_routers(2)
+        router = Router.objects.latest('id')
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/router/{router.id}/')
+        self.assertEqual(response.json()['status'], 'offline')
+        self.assertEqual(response.json()['access_point']['status'], 'online')
+
+
+@override_settings(CONNECTIVITY_SCHEDULER_MODE='adaptive')
+class RouterSweepTests(TestCase):
+    """Router sweeps derive parent outages only from real probes and keep to their budget"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user('Test', 'User', '0700000000', 'admin', password='secret')
+        self.school = School.objects.create(index_number='S1', name='School', province='Kigali',
+                                            district='Gasabo', created_by=self.user)
+
+    def create_routers(self, count, access_point_ip='10.0.0.1'):
+        access_point = Device.objects.create(name='AP', mac_address='00:00:00:00:00:01', ip_address=access_point_ip,
+                                             type='access_point', school=self.school, created_by=self.user)
+        for index in range(count):
+            Router.objects.create(name=f'Router {index}', mac_address=f'00:00:00:01:00:{index:02X}',
+                                  ip_address=f'10.1.0.{index + 1}', access_point=access_point, created_by=self.user)
+
+    def sweep(self, access_point_status='online'):
+        """Run a router sweep; returns its summary and the IP addresses probed"""
+        probed = []
+
+        def fake_run_probes(targets, concurrency=None):
+            probed.extend(target['ip_address'] for target in targets)
+            return [{'status': 'online' if target['ip_address'].startswith('10.1.') else access_point_status,
+                     'ping_check': {'success': False}, 'port_check': None} for target in targets]
+
+        with mock.patch('deviceApp.state.run_probes', fake_run_probes), \
+                mock.patch('deviceApp.state.check_internet_connectivity', return_value=True), \
+                mock.patch('routerApp.tasks.check_device_internet_connectivity', return_value=True):
+            results = check_all_routers_connectivity()
+        return results, probed
+
+    def test_down_access_point_marks_routers_parent_down(self):
+        self.create_routers(2)
+        results, probed = self.sweep(access_point_status='offline')
+        self.assertEqual(probed, ['10.0.0.1'])
+        self.assertEqual(results['parent_down'], 2)
+
+    def test_access_point_without_ip_does_not_mark_routers_down(self):
+        for access_point_ip in ['', '10.0.0']:
+            Device.objects.all().delete()
+            self.create_routers(2, access_point_ip=access_point_ip)
+            results, probed = self.sweep()
+            # The access point cannot be probed, so its routers are probed themselves
+            self.assertEqual(sorted(probed), ['10.1.0.1', '10.1.0.2'], access_point_ip)
+            self.assertEqual((results['online'], results['parent_down']), (2, 0))
+            self.assertFalse(Router.objects.filter(probe_state__connectivity_details__cause=PARENT_DOWN).exists())
+
+    @override_settings(CONNECTIVITY_SWEEP_CHUNK_SIZE=2)
+    def test_budget_carries_routers_over(self):
+        self.create_routers(5)
+        with mock.patch('routerApp.tasks.cycle_expired', side_effect=[False, True]):
+            results, probed = self.sweep()
+        self.assertEqual((results['chunks'], results['online'], results['carried_over']), (1, 2, 3))
+        cycle = SweepCycle.objects.get(kind='routers')
+        self.assertEqual((cycle.status, cycle.checked_count, cycle.carried_over), ('partial', 2, 3))
+        self.assertFalse(SweepLock('routers').is_held())
+
+        # The carried-over routers are still due and go first next time
+        results, probed = self.sweep()
+        self.assertEqual((results['total'], results['online'], results['carried_over']), (3, 3, 0))
+
+    def test_failed_sweep_closes_cycle(self):
+        self.create_routers(2)
+        with mock.patch('routerApp.tasks.sweep_routers', side_effect=RuntimeError('boom')), \
+                self.assertRaises(RuntimeError):
+            self.sweep()
+        cycle = SweepCycle.objects.get(kind='routers')
+        self.assertEqual(cycle.status, 'failed')
+        self.assertFalse(SweepLock('routers').is_held())
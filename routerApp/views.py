@@ -5,6 +5,7 @@ from django.shortcuts import get_object_or_404, render
 from rest_framework.parsers import JSONParser
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated, AllowAny
+from backend.pagination import page_data, paginate
 from .models import Router
 from .serializers import RouterSerializer
 from deviceApp.models import Device
@@ -14,13 +15,29 @@ from deviceApp.models import Device
 @permission_classes([AllowAny])
 def get_routers_by_device(request, device_id):
     """
-    Get all routers associated with a specific access point device
+    Get the routers associated with a specific access point device, one
+    cursor page at a time (?cursor=, ?page_size=), with their last known
+    status (?refresh=true probes the page first, for signed-in users only).
+    ?status= keeps only routers with that stored status.
     """
+    refresh = request.GET.get('refresh') == 'true'
+    if refresh and not request.user.is_authenticated:
+        return JsonResponse({'error': 'Authentication is required to refresh router status'}, status=401)
+
     # Get the device or return 404
     device = get_object_or_404(Device, id=device_id)
     
     # Get all routers that have this device as their access_point
     routers = Router.objects.filter(access_point_id=device_id)
+    if request.GET.get('status'):
+        try:
+            routers = routers.filter(Router.stored_status_filter(request.GET['status']))
+        except ValueError:
+            return JsonResponse({'error': 'status must be one of online, no_internet, offline or unknown'},
+                                status=400)
+    paginator, routers = paginate(request, RouterSerializer.setup_eager_loading(routers))
+    if refresh:
+        Router.check_connectivity_many(routers)
 
     # Serialize the data
     serializer = RouterSerializer(routers, many=True)
@@ -38,14 +55,17 @@ def get_routers_by_device(request, device_id):
         return render(request, 'router/manage.html', context)
     else:
         # Otherwise return JSON
-        return JsonResponse(serializer.data, safe=False)
+        return JsonResponse(page_data(paginator, serializer.data))
 
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_Router_detail(request, router_id):
-    router_obj = get_object_or_404(Router, id=router_id)
+    """Router with its last known status; ?refresh=true probes it first"""
+    router_obj = get_object_or_404(RouterSerializer.setup_eager_loading(Router.objects.all()), id=router_id)
+    if request.GET.get('refresh') == 'true':
+        router_obj.check_connectivity()
     serializer = RouterSerializer(router_obj)
     return JsonResponse(serializer.data)
 
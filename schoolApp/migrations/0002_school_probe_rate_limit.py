@@ -0,0 +1,18 @@
+# Generated by Django 4.2.17 on 2026-10-18 08:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('schoolApp', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='school',
+            name='probe_rate_limit',
+            field=models.FloatField(blank=True, help_text='Maximum connectivity probes per second against this school (blank uses CONNECTIVITY_SCHOOL_RATE_LIMIT)', null=True),
+        ),
+    ]
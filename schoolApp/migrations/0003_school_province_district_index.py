@@ -0,0 +1,17 @@
+# Generated by Django 4.2.17 on 2026-10-18 09:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('schoolApp', '0002_school_probe_rate_limit'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='school',
+            index=models.Index(fields=['province', 'district'], name='schoolApp_s_provinc_ef206b_idx'),
+        ),
+    ]
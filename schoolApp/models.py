@@ -10,9 +10,15 @@ class School(models.Model):
     district = models.CharField(max_length=100)
     created_by = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name="schools")
     created_at = models.DateTimeField(default=now)
+    probe_rate_limit = models.FloatField(null=True, blank=True,
+                                         help_text="Maximum connectivity probes per second against this school "
+                                                   "(blank uses CONNECTIVITY_SCHOOL_RATE_LIMIT)")
 
     class Meta:
         unique_together = ('index_number', 'province', 'district')  # Prevent duplicate schools
+        indexes = [
+            models.Index(fields=['province', 'district']),
+        ]
 
     def __str__(self):
         return self.name
@@ -11,5 +11,5 @@ class SchoolSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = School
-        fields = ['id', 'index_number', 'name', 'province', 'district', 'created_by', 'created_at']
+        fields = ['id', 'index_number', 'name', 'province', 'district', 'probe_rate_limit', 'created_by', 'created_at']
 
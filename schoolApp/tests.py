@@ -1,3 +1,86 @@
-from django.test import TestCase
+from datetime import datetime, timezone
+
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from userApp.models import CustomUser
+from .models import School
 
 # Create your tests here.
+
+
+@override_settings(ALLOWED_HOSTS=['testserver'],
+                   PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class UpdateSchoolTests(TestCase):
+    """A school's probe rate limit must be a positive number"""
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user('Test', 'User', '0700000000', 'admin', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.school = School.objects.create(index_number='S1', name='School', province='Kigali',
+                                            district='Gasabo', created_by=self.user)
+
+    def update(self, probe_rate_limit):
+        return self.client.put(f'/school/update/{self.school.id}/', {'probe_rate_limit': probe_rate_limit},
+                               format='json')
+
+    def test_valid_rate_limit(self):
+        self.assertEqual(self.update('2.5').status_code, 200)
+        self.school.refresh_from_db()
+        self.assertEqual(self.school.probe_rate_limit, 2.5)
+
+    def test_blank_rate_limit_uses_default(self):
+        self.assertEqual(self.update('').status_code, 200)
+        self.school.refresh_from_db()
+        self.assertIsNone(self.school.probe_rate_limit)
+
+    def test_invalid_rate_limit(self):
+        for value in ['fast', '-1', '0', 'nan', 'inf', [1]]:
+            self.assertEqual(self.update(value).status_code, 400, value)
+
+
+@override_settings(ALLOWED_HOSTS=['testserver'],
+                   PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class SchoolListFilterTests(TestCase):
+    """The school list can be narrowed to one province and district"""
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user('Test', 'User', '0700000000', 'admin', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        for index, (province, district) in enumerate([('Kigali', 'Gasabo'), ('Kigali', 'Kicukiro'),
+                                                      ('Northern', 'Musanze')]):
+            School.objects.create(index_number=f'S{index}', name=f'School {index}', province=province,
+                                  district=district, created_by=self.user)
+
+    def names(self, query=''):
+        return sorted(school['name'] for school in self.client.get(f'/school/schools/?{query}').json()['results'])
+
+    def test_filters(self):
+        self.assertEqual(self.names(), ['School 0', 'School 1', 'School 2'])
+        self.assertEqual(self.names('province=Kigali'), ['School 0', 'School 1'])
+        self.assertEqual(self.names('province=Kigali&district=Kicukiro'), ['School 1'])
+
+
+@override_settings(ALLOWED_HOSTS=['testserver'], API_PAGE_SIZE=2,
+                   PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class SchoolSummaryTests(TestCase):
+    """The dashboard summary counts every school, not one list page"""
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user('Test', 'User', '0700000000', 'admin', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        for index, (province, created_at) in enumerate([('Kigali', datetime(2020, 1, 15, tzinfo=timezone.utc)),
+                                                        ('Kigali', datetime(2020, 1, 20, tzinfo=timezone.utc)),
+                                                        ('Northern', datetime(2020, 3, 1, tzinfo=timezone.utc))]):
+            School.objects.create(index_number=f'S{index}', name=f'School {index}', province=province,
+                                  district='Gasabo', created_by=self.user, created_at=created_at)
+
+    def test_summary(self):
+        self.assertEqual(self.client.get('/school/summary/').json(), {
+            'total': 3,
+            'by_province': {'Kigali': 2, 'Northern': 1},
+            'by_month': [{'month': '2020-01', 'count': 2}, {'month': '2020-03', 'count': 1}],
+        })
@@ -1,6 +1,6 @@
 from django.urls import path
 from .views import (
-    create_school, get_all_schools, get_school_by_id,
+    create_school, get_all_schools, get_school_by_id, get_school_summary,
     update_school, delete_school, get_schools_by_user,
     display_schools_page,
 )
@@ -9,6 +9,7 @@ urlpatterns = [
     
     path('display_schools_page/', display_schools_page, name='display_schools_page'),
     path('schools/', get_all_schools, name='get_all_schools'),
+    path('summary/', get_school_summary, name='get_school_summary'),
 
     path('create/', create_school, name='create_school'),
     path('<int:school_id>/', get_school_by_id, name='get_school_by_id'),
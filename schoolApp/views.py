@@ -1,9 +1,15 @@
+import math
+
 from django.db import IntegrityError
+from django.db.models import Count
+from django.db.models.functions import TruncMonth
 from django.core.exceptions import ValidationError
 from django.shortcuts import get_object_or_404
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework import status, permissions
+from rest_framework.exceptions import NotFound
+from backend.pagination import page_data, paginate
 from .models import School
 from .serializers import SchoolSerializer
 from django.shortcuts import render
@@ -12,6 +18,19 @@ def display_schools_page(request):
     return render(request, 'school/allSchools.html')
 
 
+def parse_probe_rate_limit(value):
+    """
+    Probes per second from a request value; blank means the default limit.
+    Raises ValueError unless it is a positive number.
+    """
+    if value is None or value == '':
+        return None
+    rate = float(value)
+    if not math.isfinite(rate) or rate <= 0:
+        raise ValueError(value)
+    return rate
+
+
 
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
@@ -51,16 +70,40 @@ def create_school(request):
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
 def get_all_schools(request):
-    """Retrieve all schools"""
+    """
+    Retrieve schools, newest first, one cursor page at a time (?cursor=, ?page_size=),
+    optionally only those in one ?province= and ?district=
+    """
     try:
-        schools = School.objects.all()
+        schools = School.objects.select_related('created_by')
+        if request.GET.get('province'):
+            schools = schools.filter(province=request.GET['province'])
+        if request.GET.get('district'):
+            schools = schools.filter(district=request.GET['district'])
+        paginator, schools = paginate(request, schools)
         serializer = SchoolSerializer(schools, many=True)
         print(f"\n\n Found schools Data: {serializer.data} \n\n")
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return Response(page_data(paginator, serializer.data), status=status.HTTP_200_OK)
+    except NotFound:
+        raise
     except Exception as e:
         return Response({"error": f"An unexpected error occurred: {str(e)}"},
                         status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def get_school_summary(request):
+    """School counts for the dashboard: the total, by province and by month added"""
+    schools = School.objects.order_by()
+    by_month = schools.annotate(month=TruncMonth('created_at')).values('month').annotate(
+        count=Count('id')).order_by('month')
+    return Response({
+        'total': schools.count(),
+        'by_province': {row['province']: row['count']
+                        for row in schools.values('province').annotate(count=Count('id')).order_by('province')},
+        'by_month': [{'month': row['month'].strftime('%Y-%m'), 'count': row['count']} for row in by_month]
+    }, status=status.HTTP_200_OK)
+
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
 def get_school_by_id(request, school_id):
@@ -88,6 +131,11 @@ def update_school(request, school_id):
         name = request.data.get('name', school.name)
         province = request.data.get('province', school.province)
         district = request.data.get('district', school.district)
+        try:
+            probe_rate_limit = parse_probe_rate_limit(request.data.get('probe_rate_limit', school.probe_rate_limit))
+        except (TypeError, ValueError):
+            return Response({"error": "probe_rate_limit must be a positive number of probes per second."},
+                            status=status.HTTP_400_BAD_REQUEST)
 
         # Check for duplicate school if index_number, province, and district change
         if School.objects.filter(index_number=index_number, province=province, district=district).exclude(id=school_id).exists():
@@ -98,6 +146,7 @@ def update_school(request, school_id):
         school.name = name
         school.province = province
         school.district = district
+        school.probe_rate_limit = probe_rate_limit
         school.save()
 
         return Response(SchoolSerializer(school).data, status=status.HTTP_200_OK)
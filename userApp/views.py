@@ -3,6 +3,7 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from django.core.mail import send_mail
 from django.db.utils import IntegrityError
+from backend.pagination import page_data, paginate
 from .models import CustomUser
 from django.contrib.auth.hashers import make_password
 from rest_framework.decorators import api_view
@@ -452,10 +453,10 @@ def update_user(request):
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def list_all_users(request):
-    # Retrieve all users
-    users = CustomUser.objects.all().values(
+    # Retrieve users, newest first, one cursor page at a time (?cursor=, ?page_size=)
+    paginator, users = paginate(request, CustomUser.objects.values(
         'id', 'first_name', 'last_name', 'phone_number', 'email', 'role', 'status', 'created_at', 'profile_picture',
-    )
+    ))
 
     # Convert status field to "Active" or "Non-Active"
     formatted_users = [
@@ -466,7 +467,7 @@ def list_all_users(request):
         for user in users
     ]
 
-    return Response({"users": formatted_users}, status=200)
+    return Response(page_data(paginator, formatted_users), status=200)
 
 
 @api_view(['GET'])